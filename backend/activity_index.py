@@ -0,0 +1,329 @@
+"""
+Module for the compact in-memory index of daily active users.
+
+The dau query returns one row per day with the list of users active that day.
+The index stores the same data as CSR (compressed sparse row) arrays of small
+integer user codes, once by day and once by user, so membership and
+intersection queries are vectorized numpy operations instead of work on
+Python lists. For set algebra over whole days (rolling active users, returning
+users) it also provides a day x user bitmap.
+"""
+
+import ast
+import json
+import numpy as np
+import pandas as pd
+from functools import cached_property
+from typing import Any, List
+from db import parse_pg_array
+
+
+def _user_id(value: Any) -> Any:
+    """Convert an integer ID parsed as text back to an int."""
+    if isinstance(value, str) and value.lstrip("-").isdigit():
+        return int(value)
+    return value
+
+
+def parse_user_list(value: Any) -> List[Any]:
+    """
+    Convert a stored unique_users value to a list of user IDs.
+
+    Lists are returned as they are. Strings, as found in CSV exports, may hold
+    a JSON list, a Python list literal or a Postgres array literal; they are
+    parsed without evaluating code. Integer IDs in Postgres literals come back
+    as ints, so they match the user_id column of the users table.
+
+    Args:
+        value: A value of the unique_users column
+
+    Returns:
+        List of user IDs (empty for missing values)
+    """
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return list(value)
+    if not isinstance(value, str):
+        return [] if value is None or pd.isna(value) else [value]
+
+    value = value.strip()
+    if not value:
+        return []
+    if value.startswith("{"):
+        return [_user_id(user) for user in parse_pg_array(value)]
+    if value.startswith("["):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return list(ast.literal_eval(value))
+    return [_user_id(value)]
+
+
+
+class UserActivity:
+    """
+    Active users per day as CSR arrays.
+
+    Attributes:
+        dates: Sorted datetime64[ns] days (midnight), one per day of data
+        user_ids: Array mapping each user code to its user ID
+        day_offsets: The users active on dates[i] are
+            user_codes[day_offsets[i]:day_offsets[i + 1]], sorted
+        user_codes: Int32 user codes, grouped by day
+        user_offsets: The days user code c was active are
+            day_indices[user_offsets[c]:user_offsets[c + 1]], sorted
+        day_indices: Int32 indices into dates, grouped by user
+    """
+
+    def __init__(self, dates, user_ids, day_offsets, user_codes):
+        self.dates = dates
+        self.user_ids = user_ids
+        self.day_offsets = day_offsets
+        self.user_codes = user_codes
+
+        # Transpose to one row per user; the stable sort keeps days ordered
+        day_of_entry = np.repeat(
+            np.arange(len(dates), dtype=np.int32), np.diff(day_offsets)
+        )
+        order = np.argsort(user_codes, kind="stable")
+        self.day_indices = day_of_entry[order]
+        self.user_offsets = np.zeros(len(user_ids) + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(user_codes, minlength=len(user_ids)),
+            out=self.user_offsets[1:],
+        )
+        self._user_index = pd.Index(user_ids)
+
+    def __len__(self) -> int:
+        """Number of (user, day) activity pairs."""
+        return len(self.user_codes)
+
+    def codes_for(self, user_ids) -> np.ndarray:
+        """
+        Map user IDs to user codes.
+
+        Args:
+            user_ids: Sequence of user IDs
+
+        Returns:
+            Int64 array of codes, -1 for users never active
+        """
+        return self._user_index.get_indexer(user_ids)
+
+    def users_on(self, day) -> np.ndarray:
+        """
+        Get the codes of the users active on a day.
+
+        Args:
+            day: Date or timestamp of the day
+
+        Returns:
+            Sorted int32 array of user codes (empty if the day has no data)
+        """
+        day = np.datetime64(pd.Timestamp(day).normalize(), "ns")
+        i = np.searchsorted(self.dates, day)
+        if i == len(self.dates) or self.dates[i] != day:
+            return self.user_codes[:0]
+        return self.user_codes[self.day_offsets[i] : self.day_offsets[i + 1]]
+
+    def is_active(self, user_id, day) -> bool:
+        """Check whether a user was active on a day."""
+        code = self.codes_for([user_id])[0]
+        users = self.users_on(day)
+        i = np.searchsorted(users, code)
+        return bool(code >= 0 and i < len(users) and users[i] == code)
+
+    def activity_of(self, codes) -> tuple:
+        """
+        Gather the active days of several users at once.
+
+        Args:
+            codes: Int array of user codes (all >= 0)
+
+        Returns:
+            Tuple (owner, day_index): for every activity pair, the position in
+            codes it belongs to and the index of its day in dates
+        """
+        codes = np.asarray(codes, dtype=np.int64)
+        starts = self.user_offsets[codes]
+        lengths = self.user_offsets[codes + 1] - starts
+        owner = np.repeat(np.arange(len(codes)), lengths)
+        # Position of each pair within its user's row, shifted to the row start
+        first = np.cumsum(lengths) - lengths
+        positions = np.arange(lengths.sum()) - np.repeat(first - starts, lengths)
+        return owner, self.day_indices[positions]
+
+    @cached_property
+    def bitmap(self) -> "ActivityBitmap":
+        """The activity as an ActivityBitmap, built on first use."""
+        return ActivityBitmap.from_activity(self)
+
+    def to_frame(self) -> pd.DataFrame:
+        """Get the activity as a (user_id, date) DataFrame, one row per pair."""
+        return pd.DataFrame(
+            {
+                "user_id": self.user_ids[self.user_codes],
+                "date": np.repeat(self.dates, np.diff(self.day_offsets)),
+            }
+        )
+
+
+class ActivityBitmap:
+    """
+    Active users per calendar day as packed bits.
+
+    Row i holds one bit per user code for dates[i]; days without data are
+    empty rows, so rows are consecutive calendar days. Set operations are
+    bitwise operations on uint64 words and counts are popcounts.
+
+    Attributes:
+        dates: datetime64[ns] days, from the first to the last day of data
+        words: uint64 array of shape (len(dates), ceil(users / 64))
+    """
+
+    def __init__(self, dates, words):
+        self.dates = dates
+        self.words = words
+
+    @classmethod
+    def from_activity(cls, activity: UserActivity) -> "ActivityBitmap":
+        """Build the bitmap from a UserActivity index."""
+        n_words = (len(activity.user_ids) + 63) // 64
+        if len(activity.dates) == 0:
+            return cls(activity.dates, np.zeros((0, n_words), dtype=np.uint64))
+
+        first = activity.dates[0]
+        n_days = int((activity.dates[-1] - first) // np.timedelta64(1, "D")) + 1
+        dates = first + np.arange(n_days) * np.timedelta64(1, "D")
+
+        row = (
+            np.repeat(activity.dates, np.diff(activity.day_offsets)) - first
+        ) // np.timedelta64(1, "D")
+        codes = activity.user_codes.astype(np.int64)
+        words = np.zeros((n_days, n_words), dtype=np.uint64)
+        np.bitwise_or.at(
+            words,
+            (row, codes >> 6),
+            np.left_shift(np.uint64(1), (codes & 63).astype(np.uint64)),
+        )
+        return cls(dates, words)
+
+    def day_index(self, day) -> int:
+        """Get the row of a day, or -1 if it is outside the data."""
+        day = np.datetime64(pd.Timestamp(day).normalize(), "ns")
+        if len(self.dates) == 0 or not self.dates[0] <= day <= self.dates[-1]:
+            return -1
+        return int((day - self.dates[0]) // np.timedelta64(1, "D"))
+
+    def users_mask(self, codes) -> np.ndarray:
+        """
+        Build a row of bits from user codes, to intersect with activity rows.
+
+        Args:
+            codes: User codes (negative codes are ignored)
+
+        Returns:
+            uint64 array of one row
+        """
+        codes = np.asarray(codes, dtype=np.int64)
+        codes = codes[codes >= 0]
+        mask = np.zeros(self.words.shape[1], dtype=np.uint64)
+        np.bitwise_or.at(
+            mask, codes >> 6, np.left_shift(np.uint64(1), (codes & 63).astype(np.uint64))
+        )
+        return mask
+
+    def rolling(self, window: int) -> np.ndarray:
+        """
+        Get, for every day, the users active in the window of days ending on it.
+
+        Windows are merged by doubling, so this takes log2(window) passes.
+        Windows reaching before the first day only cover the days with data.
+
+        Args:
+            window: Window length in days
+
+        Returns:
+            uint64 array shaped like words
+        """
+        result = self.words
+        covered = 1
+        while covered < window:
+            step = min(covered, window - covered)
+            merged = result.copy()
+            merged[step:] |= result[:-step]
+            result = merged
+            covered += step
+        return result
+
+    @staticmethod
+    def count(rows) -> np.ndarray:
+        """Count the users in each row of bits."""
+        return np.bitwise_count(rows).sum(axis=-1, dtype=np.int64)
+
+    def active_counts(self, window: int = 1) -> np.ndarray:
+        """Count the users active in the window ending on each day."""
+        return self.count(self.rolling(window))
+
+    def returning_counts(self, days_later: int) -> np.ndarray:
+        """
+        Count, for every day, the users active that day and days_later after.
+
+        Args:
+            days_later: Offset in days
+
+        Returns:
+            int64 array per day; days whose offset lies past the data count 0
+        """
+        counts = np.zeros(len(self.dates), dtype=np.int64)
+        if days_later < len(self.dates):
+            later = self.words[days_later:]
+            counts[: len(later)] = self.count(self.words[: len(later)] & later)
+        return counts
+
+
+def build_user_activity(dau_df: pd.DataFrame) -> UserActivity:
+    """
+    Build the activity index from the dau_users frame.
+
+    Args:
+        dau_df: Frame with a `date` column and a `unique_users` column holding
+            the users active that day
+
+    Returns:
+        UserActivity index; a repeated date keeps its last row and repeated
+        users within a day are counted once
+    """
+    days = pd.DataFrame(
+        {
+            "date": pd.to_datetime(dau_df["date"]).dt.normalize().to_numpy(),
+            "users": dau_df["unique_users"].map(parse_user_list).to_numpy(),
+        }
+    )
+    days = days.dropna(subset=["date"]).drop_duplicates("date", keep="last")
+    days = days.sort_values("date", kind="stable")
+
+    lengths = days["users"].map(len).to_numpy()
+    flat = pd.Series(
+        [user for users in days["users"] for user in users], dtype=object
+    ).infer_objects()
+    codes, user_ids = pd.factorize(flat)
+    day_of_entry = np.repeat(np.arange(len(days)), lengths)
+
+    # Drop missing IDs, then sort each day's users and drop repeats
+    valid = codes >= 0
+    codes, day_of_entry = codes[valid], day_of_entry[valid]
+    order = np.lexsort((codes, day_of_entry))
+    codes, day_of_entry = codes[order], day_of_entry[order]
+    keep = np.ones(len(codes), dtype=bool)
+    keep[1:] = (codes[1:] != codes[:-1]) | (day_of_entry[1:] != day_of_entry[:-1])
+    codes, day_of_entry = codes[keep], day_of_entry[keep]
+
+    day_offsets = np.zeros(len(days) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(day_of_entry, minlength=len(days)), out=day_offsets[1:])
+
+    return UserActivity(
+        dates=days["date"].to_numpy(dtype="datetime64[ns]"),
+        user_ids=np.asarray(user_ids),
+        day_offsets=day_offsets,
+        user_codes=codes.astype(np.int32),
+    )
@@ -1,72 +1,50 @@
 from flask import Blueprint, jsonify, request, g
 from db import get_main_db, get_analytic_db
+from auth import admin_required
 from models import User, AdminComment
-from functools import wraps
-import os
-import jwt
-from jwt.exceptions import InvalidTokenError, ExpiredSignatureError
 from analytics_model import ScreenVisitTimeAnalysis
+from sqlalchemy import func, tuple_
+from sqlalchemy.orm import joinedload
+from datetime import datetime
 from itertools import groupby
 from operator import attrgetter
+import base64
+import json
 
 admin_bp = Blueprint("admin", __name__)
 
-# Define allowed admin emails
-ADMIN_EMAILS = [
-    "zzyzsy0516321@gmail.com",
-    "zzyzsy0516321@yahoo.com",
-    "hkselinali@gmail.com",
-    "alex.taic@gmail.com",
-    "rna.jng@gmail.com",
-]
-
-
-# Authentication decorator
-def admin_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        # Get the authorization header
-        auth_header = request.headers.get("Authorization")
-
-        if not auth_header or not auth_header.startswith("Bearer "):
-            return jsonify({"error": "Authorization header is missing or invalid"}), 401
-
-        # Extract the token
-        token = auth_header.split("Bearer ")[1]
-
-        try:
-            # Verify the JWT token from Supabase
-            # The JWT_SECRET should be set in your environment variables (from Supabase project)
-            jwt_secret = os.environ.get("SUPABASE_JWT_SECRET")
-            if not jwt_secret:
-                return jsonify({"error": "Server configuration error"}), 500
-
-            # Decode and verify the token
-            payload = jwt.decode(
-                token, jwt_secret, algorithms=["HS256"], audience="authenticated"
-            )
+# Default and largest number of sessions per page of get_user_sessions
+DEFAULT_SESSIONS_PAGE_SIZE = 20
+MAX_SESSIONS_PAGE_SIZE = 100
+
+# Default and largest number of comments per page, and most users per request,
+# of get_admin_comments_batch
+DEFAULT_COMMENTS_PAGE_SIZE = 50
+MAX_COMMENTS_PAGE_SIZE = 200
+MAX_COMMENT_USER_IDS = 500
 
-            # Check if user email is in the allowed list
-            user_email = payload.get("email")
-            if not user_email or user_email not in ADMIN_EMAILS:
-                return jsonify(
-                    {"error": "Access denied. Your email is not authorized."}
-                ), 403
 
-            # Store the email in Flask's g object for access in the route
-            g.admin_email = user_email
+def encode_cursor(timestamp, key):
+    """Encode the position after a (timestamp, key) row as an opaque cursor."""
+    position = json.dumps([timestamp.isoformat(), key])
+    return base64.urlsafe_b64encode(position.encode("utf-8")).decode("ascii")
 
-        except ExpiredSignatureError:
-            return jsonify({"error": "Token has expired"}), 401
-        except InvalidTokenError as e:
-            print("invalid token error", e)
-            return jsonify({"error": "Invalid token"}), 401
-        except Exception as e:
-            return jsonify({"error": f"Authentication error: {str(e)}"}), 401
 
-        return f(*args, **kwargs)
+def decode_cursor(cursor):
+    """
+    Decode a cursor from encode_cursor.
 
-    return decorated_function
+    Returns:
+        tuple: (timestamp, key) of the last row served
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        timestamp, key = json.loads(base64.urlsafe_b64decode(cursor))
+        return datetime.fromisoformat(timestamp), key
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
 
 
 @admin_bp.route("/", methods=["GET"])
@@ -92,10 +70,106 @@ def get_user(user_id):
 @admin_bp.route("/<int:user_id>/comments", methods=["GET"])
 @admin_required
 def get_admin_comments(user_id):
-    """Get all admin comments for a user."""
+    """Get all admin comments for a user, newest first, with their authors."""
+    db = get_main_db()
+    comments = (
+        db.query(AdminComment)
+        .options(joinedload(AdminComment.author))
+        .filter(AdminComment.user_id == user_id)
+        .order_by(AdminComment.created_at.desc(), AdminComment.id.desc())
+        .all()
+    )
+    return jsonify([comment.to_dict(include_author=True) for comment in comments])
+
+
+@admin_bp.route("/comments", methods=["GET"])
+@admin_required
+def get_admin_comments_batch():
+    """
+    Get the admin comments of many users in one request, newest first.
+
+    Comments are paged with a keyset cursor on (created_at, id), and their
+    authors are loaded in the same query.
+
+    Query parameters:
+        user_ids: Comma-separated user IDs (at most 500)
+        limit: Comments per page (default: 50, at most 200)
+        cursor: The next_cursor of the previous page
+
+    Returns:
+        JSON: The page's `comments` (each with its `author`), the number of
+        comments of each requested user (`counts`, keyed by user ID) and the
+        `next_cursor` (None on the last page)
+    """
+    try:
+        user_ids = sorted(
+            {
+                int(user_id)
+                for user_id in request.args.get("user_ids", "").split(",")
+                if user_id.strip()
+            }
+        )
+        if not user_ids:
+            raise ValueError("user_ids is required")
+        if len(user_ids) > MAX_COMMENT_USER_IDS:
+            raise ValueError(f"At most {MAX_COMMENT_USER_IDS} user_ids are allowed")
+        limit = int(request.args.get("limit", DEFAULT_COMMENTS_PAGE_SIZE))
+        if not 1 <= limit <= MAX_COMMENTS_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_COMMENTS_PAGE_SIZE}")
+        cursor = request.args.get("cursor")
+        if cursor:
+            created_at, comment_id = decode_cursor(cursor)
+            after = (created_at, int(comment_id))
+        else:
+            after = None
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {e}"}), 400
+
     db = get_main_db()
-    comments = db.query(AdminComment).filter(AdminComment.user_id == user_id).all()
-    return jsonify([comment.to_dict() for comment in comments])
+
+    try:
+        counts = dict(
+            db.query(AdminComment.user_id, func.count())
+            .filter(AdminComment.user_id.in_(user_ids))
+            .group_by(AdminComment.user_id)
+            .all()
+        )
+
+        comments_query = (
+            db.query(AdminComment)
+            .options(joinedload(AdminComment.author))
+            .filter(AdminComment.user_id.in_(user_ids))
+        )
+        if after is not None:
+            comments_query = comments_query.filter(
+                tuple_(AdminComment.created_at, AdminComment.id) < tuple_(*after)
+            )
+        comments = (
+            comments_query.order_by(
+                AdminComment.created_at.desc(), AdminComment.id.desc()
+            )
+            .limit(limit + 1)
+            .all()
+        )
+        has_more = len(comments) > limit
+        comments = comments[:limit]
+
+        last = comments[-1] if comments else None
+        return jsonify(
+            {
+                "comments": [
+                    comment.to_dict(include_author=True) for comment in comments
+                ],
+                "counts": {
+                    str(user_id): counts.get(user_id, 0) for user_id in user_ids
+                },
+                "next_cursor": encode_cursor(last.created_at, last.id)
+                if has_more
+                else None,
+            }
+        )
+    except Exception as e:
+        return jsonify({"error": f"Error fetching admin comments: {str(e)}"}), 500
 
 
 @admin_bp.route("/<int:user_id>/comments", methods=["POST"])
@@ -121,6 +195,7 @@ def create_admin_comment(user_id):
     comment = AdminComment(
         user_id=user_id,
         author_id=admin_user.id,  # Use the authenticated admin's ID
+        author=admin_user,
         text=data.get("text"),
         mood=data.get("mood"),
     )
@@ -128,7 +203,7 @@ def create_admin_comment(user_id):
     db.add(comment)
     # No need to commit - will be handled by teardown function
 
-    return jsonify(comment.to_dict()), 201
+    return jsonify(comment.to_dict(include_author=True)), 201
 
 
 @admin_bp.route("/comments/<int:comment_id>", methods=["PUT"])
@@ -149,7 +224,7 @@ def update_admin_comment(comment_id):
 
     # No need to commit - will be handled by teardown function
 
-    return jsonify(comment.to_dict())
+    return jsonify(comment.to_dict(include_author=True))
 
 
 @admin_bp.route("/comments/<int:comment_id>", methods=["DELETE"])
@@ -215,52 +290,114 @@ def get_user_activity(user_id):
 @admin_required
 def get_user_sessions(user_id):
     """
-    Get the user activity grouped by session.
+    Get a page of the user activity grouped by session, newest session first.
+
+    Sessions are paged with a keyset cursor on (session_start_time,
+    session_id), and their screen counts and durations are aggregated in SQL.
+    Screen visits are only loaded for the sessions on the page.
 
     Args:
         user_id (int): The ID of the user
 
+    Query parameters:
+        limit: Sessions per page (default: 20, at most 100)
+        cursor: The next_cursor of the previous page
+
     Returns:
-        JSON: A list of sessions, each containing a list of screen visits
+        JSON: The page's `sessions`, each with its `screen_count`,
+        `total_duration_seconds` and list of screen visits (`activities`),
+        `total_sessions` (on the first page only, None on later pages) and
+        the `next_cursor` (None on the last page)
     """
+    try:
+        limit = int(request.args.get("limit", DEFAULT_SESSIONS_PAGE_SIZE))
+        if not 1 <= limit <= MAX_SESSIONS_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_SESSIONS_PAGE_SIZE}")
+        cursor = request.args.get("cursor")
+        if cursor:
+            start_time, session_id = decode_cursor(cursor)
+            after = (start_time, str(session_id))
+        else:
+            after = None
+    except ValueError as e:
+        return jsonify({"error": f"Invalid parameter: {e}"}), 400
+
     db = get_analytic_db()
+    visit = ScreenVisitTimeAnalysis
 
     try:
-        # Query the ScreenVisitTimeAnalysis view
-        all_activity = (
-            db.query(ScreenVisitTimeAnalysis)
-            .filter(ScreenVisitTimeAnalysis.user_id == user_id)
+        # Counting scans all of the user's visits, so only the first page does
+        total_sessions = None
+        if after is None:
+            total_sessions = (
+                db.query(func.count(func.distinct(visit.session_id)))
+                .filter(visit.user_id == user_id)
+                .scalar()
+            )
+
+        # Every visit carries its session's start time, so the keyset can be
+        # applied to the rows before grouping
+        sessions_query = db.query(
+            visit.session_id,
+            func.min(visit.session_start_time).label("session_start_time"),
+            func.max(visit.session_end_time).label("session_end_time"),
+            func.min(visit.visit_date).label("visit_date"),
+            func.count().label("screen_count"),
+            func.sum(visit.duration_seconds).label("total_duration_seconds"),
+        ).filter(visit.user_id == user_id)
+        if after is not None:
+            sessions_query = sessions_query.filter(
+                tuple_(visit.session_start_time, visit.session_id) < tuple_(*after)
+            )
+        rows = (
+            sessions_query.group_by(visit.session_id)
             .order_by(
-                ScreenVisitTimeAnalysis.session_id,
-                ScreenVisitTimeAnalysis.screen_start_time,
+                func.min(visit.session_start_time).desc(), visit.session_id.desc()
             )
+            .limit(limit + 1)
             .all()
         )
-
-        # Group by session_id
-        sessions = []
-        for session_id, group in groupby(all_activity, attrgetter("session_id")):
-            activities = list(group)
-
-            if not activities:
-                continue
-
-            # Get session metadata from the first activity
-            first_activity = activities[0]
-
-            session = {
-                "session_id": session_id,
-                "session_start_time": first_activity.session_start_time.isoformat(),
-                "session_end_time": first_activity.session_end_time.isoformat(),
-                "visit_date": first_activity.visit_date.isoformat(),
-                "activities": [activity.to_dict() for activity in activities],
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        activities = {}
+        if rows:
+            page_visits = (
+                db.query(visit)
+                .filter(
+                    visit.user_id == user_id,
+                    visit.session_id.in_([row.session_id for row in rows]),
+                )
+                .order_by(visit.session_id, visit.screen_start_time)
+                .all()
+            )
+            for session_id, group in groupby(page_visits, attrgetter("session_id")):
+                activities[session_id] = [activity.to_dict() for activity in group]
+
+        sessions = [
+            {
+                "session_id": row.session_id,
+                "session_start_time": row.session_start_time.isoformat(),
+                "session_end_time": row.session_end_time.isoformat(),
+                "visit_date": row.visit_date.isoformat(),
+                "screen_count": row.screen_count,
+                "total_duration_seconds": float(row.total_duration_seconds or 0),
+                "activities": activities.get(row.session_id, []),
             }
-
-            sessions.append(session)
-
-        # Sort sessions by start time (descending)
-        sessions.sort(key=lambda x: x["session_start_time"], reverse=True)
-
-        return jsonify(sessions)
+            for row in rows
+        ]
+
+        last = rows[-1] if rows else None
+        return jsonify(
+            {
+                "sessions": sessions,
+                "total_sessions": total_sessions,
+                "next_cursor": encode_cursor(
+                    last.session_start_time, last.session_id
+                )
+                if has_more
+                else None,
+            }
+        )
     except Exception as e:
         return jsonify({"error": f"Error fetching user sessions: {str(e)}"}), 500
@@ -0,0 +1,95 @@
+import numpy as np
+from data_store import DataNotLoadedError, get_derived, get_index
+
+# Day-N offsets of the returning-user rates reported by default
+RETURNING_DAYS = (1, 7, 30)
+
+# Upper bound on requested Day-N offsets
+MAX_RETURNING_DAY = 365
+
+
+def validate_returning_days(days=None):
+    """
+    Check the Day-N offsets of get_active_user_metrics.
+
+    Args:
+        days (list[int]): Day-N offsets (default: RETURNING_DAYS)
+
+    Returns:
+        list[int]: The sorted, de-duplicated offsets
+
+    Raises:
+        ValueError: If an offset is not supported
+    """
+    days = sorted(set(days if days is not None else RETURNING_DAYS))
+    if not days or days[0] < 1 or days[-1] > MAX_RETURNING_DAY:
+        raise ValueError(f"Returning days must be between 1 and {MAX_RETURNING_DAY}")
+    return days
+
+
+def get_active_user_metrics(days=None):
+    """
+    Calculate daily engagement metrics from the dau activity bitmap.
+
+    For every calendar day: DAU, WAU and MAU (users active in the 1, 7 and 30
+    days ending that day), stickiness (DAU / MAU, in percent) and, for each
+    Day-N offset, the share of that day's active users who were active again
+    N days later. All counts are bitwise OR/AND and popcounts over the bitmap.
+
+    WAU, MAU and stickiness are None until a full window of data exists, and
+    returning rates are None when day N lies past the last day of data.
+
+    Args:
+        days (list[int]): Day-N offsets for returning rates (default: 1, 7, 30)
+
+    Returns:
+        list[dict]: One record per day, oldest first
+
+    Raises:
+        DataNotLoadedError: If the dau activity index is not available
+    """
+    days = validate_returning_days(days)
+    return get_derived(
+        ("active_user_metrics", tuple(days)),
+        ("dau",),
+        lambda: _compute_active_user_metrics(days),
+    )
+
+
+def _compute_active_user_metrics(days):
+    activity = get_index("dau_activity")
+    if activity is None:
+        raise DataNotLoadedError("dau")
+    bitmap = activity.bitmap
+
+    n_days = len(bitmap.dates)
+    dau = bitmap.active_counts(1)
+    wau = bitmap.active_counts(7)
+    mau = bitmap.active_counts(30)
+
+    returning = {}
+    for day in days:
+        counts = bitmap.returning_counts(day)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rates = counts / dau * 100
+        returning[day] = [
+            float(rate) if i + day < n_days and dau[i] > 0 else None
+            for i, rate in enumerate(rates)
+        ]
+
+    labels = bitmap.dates.astype("datetime64[D]").astype(str)
+    records = []
+    for i in range(n_days):
+        record = {
+            "date": str(labels[i]),
+            "dau": int(dau[i]),
+            "wau": int(wau[i]) if i >= 6 else None,
+            "mau": int(mau[i]) if i >= 29 else None,
+            "stickiness": (
+                float(dau[i] / mau[i] * 100) if i >= 29 and mau[i] > 0 else None
+            ),
+        }
+        for day in days:
+            record[f"day{day}_returning"] = returning[day][i]
+        records.append(record)
+    return records
@@ -0,0 +1,81 @@
+"""
+Module for the dashboard KPIs computed from the users data.
+
+The rules are those of the useKPI hook of the frontend, which computed the same
+figures in the browser from the full users list: an active subscriber has
+status 1 and auto-renew enabled, a paying user is an active subscriber who
+used no non-paying promo code, and a paying user is monthly when the product
+ID contains "month" and yearly otherwise.
+"""
+
+import pandas as pd
+from data_store import query_cache, get_derived
+
+# The only free promo code that still counts as a paying subscription
+TRIAL_PROMO_CODE = "14-day-free"
+
+# Promo codes that look like UUIDs are one-off codes, not paid offers
+UUID_PATTERN = r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$"
+
+
+def _promo_codes(users_df):
+    """Promo codes per user; missing lists and lists holding None are empty."""
+    return users_df["promo_codes_used"].map(
+        lambda codes: []
+        if not isinstance(codes, list) or None in codes
+        else codes
+    )
+
+
+def get_user_metrics():
+    """
+    Calculate the dashboard KPIs from the users data.
+
+    The result is computed once per version of the users data.
+
+    Returns:
+        dict: User counts per funnel stage, subscriber counts by plan and
+        the estimated monthly revenue
+    """
+    return get_derived("user_metrics", ("users",), _compute_user_metrics)
+
+
+def _compute_user_metrics():
+    # Users are keyed by user_id, so a repeated user_id keeps its last row
+    users_df = query_cache["users"].drop_duplicates("user_id", keep="last")
+    users_df = users_df.reset_index(drop=True)
+
+    completed_onboarding = users_df["onboarding_complete"].fillna(False).astype(bool)
+    active = (users_df["status"] == 1) & users_df["auto_renew_enabled"].fillna(
+        False
+    ).astype(bool)
+
+    # As in useKPI, a promo code is non-paying when it does not contain
+    # "free", is the 14-day trial code or looks like a UUID; a subscriber
+    # pays unless one of their codes is non-paying
+    codes = _promo_codes(users_df).explode().dropna().astype(str)
+    non_paying_code = (
+        ~codes.str.lower().str.contains("free", regex=False)
+        | (codes == TRIAL_PROMO_CODE)
+        | codes.str.match(UUID_PATTERN, case=False)
+    )
+    uses_non_paying_code = (
+        non_paying_code.groupby(level=0).any().reindex(users_df.index, fill_value=False)
+    )
+    paying = active & ~uses_non_paying_code
+
+    monthly = paying & users_df["product_id"].fillna("").astype(str).str.contains(
+        "month", regex=False
+    )
+    expected_mmr = pd.to_numeric(users_df["expected_mmr"], errors="coerce")
+
+    return {
+        "total_users": int(len(users_df)),
+        "users_completed_onboarding": int(completed_onboarding.sum()),
+        "active_subscribers": int(active.sum()),
+        "paying_users": int(paying.sum()),
+        "free_users": int((active & ~paying).sum()),
+        "monthly_subscribers": int(monthly.sum()),
+        "yearly_subscribers": int((paying & ~monthly).sum()),
+        "estimated_monthly_revenue": float(expected_mmr[paying].sum()),
+    }
@@ -6,15 +6,12 @@ import os
 current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(current_dir)
 
-# View path
-print(sys.path)
-
 import pandas as pd
 import numpy as np
 import json
 from datetime import datetime, timedelta
 from db import execute_query
-from data_store import query_cache
+from data_store import DataNotLoadedError, query_cache, get_derived, get_index
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
@@ -48,192 +45,182 @@ def get_user_retention():
     return retention_df.to_dict(orient="records")
 
 
-def get_user_retention_by_cohort():
-    """
-    Calculate user retention metrics by cohort and return as a Python dictionary
-    that can be JSON serialized.
+# Day-N checkpoints reported by get_user_retention_by_cohort
+RETENTION_DAYS = (1, 7, 14, 30)
+
+
+def build_cohort_table(user_df):
     """
-    dau_df = query_cache["dau"]
-    user_df = query_cache["users"]
+    Build the (user_id, cohort_date) table used for cohort retention.
 
-    # First, let's process dau_df to get actual user IDs by date
-    dau_processed = dau_df.copy()
+    Users without dietary preferences never finished onboarding and are
+    left out, as are users without a creation date.
 
-    # Ensure unique_users is actually a list of user IDs
-    if isinstance(dau_df["unique_users"].iloc[0], str):
-        dau_processed["unique_users"] = dau_df["unique_users"].apply(eval)
+    Args:
+        user_df (pandas.DataFrame): The cached users frame
 
-    # Convert dates to datetime objects if they're not already
-    dau_processed["date"] = pd.to_datetime(dau_processed["date"])
-    user_df["created_at"] = pd.to_datetime(user_df["created_at"])
+    Returns:
+        pandas.DataFrame: Columns `user_id` and `cohort_date` (midnight of the
+        day the user was created)
+    """
+    user_df = user_df[user_df["dietary_preferences"].notna()]
 
-    # Create a dictionary to map dates to active users
-    date_to_users = dict(zip(dau_processed["date"], dau_processed["unique_users"]))
+    created_at = pd.to_datetime(user_df["created_at"])
+    if created_at.dt.tz is not None:
+        # Keep the wall-clock date in the stored timezone
+        created_at = created_at.dt.tz_localize(None)
 
-    # Group users by creation date to form cohorts
-    user_df["created_date"] = user_df["created_at"].dt.date
+    cohort_users = pd.DataFrame(
+        {
+            "user_id": user_df["user_id"].to_numpy(),
+            "cohort_date": created_at.dt.normalize().to_numpy(),
+        }
+    )
+    return cohort_users.dropna(subset=["cohort_date"])
 
-    # Remove rows where last active date is null
-    user_df = user_df[user_df["dietary_preferences"].notna()]
 
-    cohorts = user_df.groupby("created_date")["user_id"].apply(list).to_dict()
-
-    # Calculate retention for each cohort
-    retention_results = []
-
-    for cohort_date, cohort_users in cohorts.items():
-        cohort_date = pd.to_datetime(cohort_date)
-        cohort_size = len(cohort_users)
-
-        # Skip cohorts that are too recent for Day 30 analysis
-        if cohort_date > dau_processed["date"].max() - timedelta(days=30):
-            continue
-
-        # Calculate Day 1 retention
-        day1_date = cohort_date + timedelta(days=1)
-        day1_active_users = []
-        if day1_date in date_to_users:
-            day1_active_users = [
-                user for user in cohort_users if user in date_to_users[day1_date]
-            ]
-        day1_count = len(day1_active_users)
-        day1_retention = (day1_count / cohort_size * 100) if cohort_size > 0 else 0
-
-        # Calculate Day 7 retention
-        day7_date = cohort_date + timedelta(days=7)
-        day7_active_users = []
-        if day7_date in date_to_users:
-            day7_active_users = [
-                user for user in cohort_users if user in date_to_users[day7_date]
-            ]
-        day7_count = len(day7_active_users)
-        day7_retention = (day7_count / cohort_size * 100) if cohort_size > 0 else 0
-
-        # Calculate Day 14 retention
-        day14_date = cohort_date + timedelta(days=14)
-        day14_active_users = []
-        if day14_date in date_to_users:
-            day14_active_users = [
-                user for user in cohort_users if user in date_to_users[day14_date]
-            ]
-        day14_count = len(day14_active_users)
-        day14_retention = (day14_count / cohort_size * 100) if cohort_size > 0 else 0
-
-        # Calculate Day 30 retention
-        day30_date = cohort_date + timedelta(days=30)
-        day30_active_users = []
-        if day30_date in date_to_users:
-            day30_active_users = [
-                user for user in cohort_users if user in date_to_users[day30_date]
-            ]
-        day30_count = len(day30_active_users)
-        day30_retention = (day30_count / cohort_size * 100) if cohort_size > 0 else 0
-
-        retention_results.append(
-            {
-                "cohort_date": cohort_date,
-                "cohort_size": cohort_size,
-                "day1_active_users": day1_count,
-                "day1_retention": day1_retention,
-                "day7_active_users": day7_count,
-                "day7_retention": day7_retention,
-                "day14_active_users": day14_count,
-                "day14_retention": day14_retention,
-                "day30_active_users": day30_count,
-                "day30_retention": day30_retention,
-            }
-        )
+def count_retained_users(cohort_users, activity, cohort_dates, days):
+    """
+    Count, for every cohort and every Day-N offset, how many cohort members
+    were active N days after their cohort date.
 
-    # Create a DataFrame from the results
-    retention_analysis = pd.DataFrame(retention_results)
+    All offsets are counted in a single pass: the active days of every cohort
+    member are gathered from the activity index at once and the
+    (cohort, offset) pairs are tallied with one bincount.
 
-    # Sort by cohort date
-    retention_analysis = retention_analysis.sort_values("cohort_date", ascending=False)
+    Args:
+        cohort_users (pandas.DataFrame): Output of build_cohort_table
+        activity (UserActivity): The dau activity index
+        cohort_dates (numpy.ndarray): Sorted datetime64 cohort keys
+        days (numpy.ndarray): Sorted Day-N offsets
 
-    # Add week and month columns for grouping
-    retention_analysis["cohort_week"] = (
-        retention_analysis["cohort_date"].dt.to_period("W").astype(str)
-    )
-    retention_analysis["cohort_month"] = (
-        retention_analysis["cohort_date"].dt.to_period("M").astype(str)
+    Returns:
+        numpy.ndarray: Matrix of shape (len(cohort_dates), len(days))
+    """
+    counts = np.zeros(len(cohort_dates) * len(days), dtype=np.int64)
+    if len(cohort_dates) == 0 or len(days) == 0:
+        return counts.reshape(len(cohort_dates), len(days))
+
+    cohort_users = cohort_users[
+        cohort_users["cohort_date"].isin(cohort_dates)
+    ]
+    codes = activity.codes_for(cohort_users["user_id"])
+    known = codes >= 0
+    member_dates = cohort_users["cohort_date"].to_numpy()[known]
+    owner, day_index = activity.activity_of(codes[known])
+
+    offsets = (
+        (activity.dates[day_index] - member_dates[owner]) // np.timedelta64(1, "D")
+    ).astype(np.int64)
+    day_idx = np.searchsorted(days, offsets)
+    matched = day_idx < len(days)
+    matched[matched] = days[day_idx[matched]] == offsets[matched]
+
+    cohort_idx = np.searchsorted(cohort_dates, member_dates)[owner]
+    counts += np.bincount(
+        cohort_idx[matched] * len(days) + day_idx[matched],
+        minlength=len(counts),
     )
+    return counts.reshape(len(cohort_dates), len(days))
 
-    # Weekly cohort analysis
-    weekly_retention = retention_analysis.copy()
-    weekly_avg = weekly_retention.groupby("cohort_week").agg(
-        {
-            "cohort_size": "sum",
-            "day1_active_users": "sum",
-            "day7_active_users": "sum",
-            "day14_active_users": "sum",
-            "day30_active_users": "sum",
-        }
-    )
 
-    weekly_avg["day1_retention"] = (
-        weekly_avg["day1_active_users"] / weekly_avg["cohort_size"] * 100
-    )
-    weekly_avg["day7_retention"] = (
-        weekly_avg["day7_active_users"] / weekly_avg["cohort_size"] * 100
+def get_activity_table():
+    """
+    Get the activity index (see activity_index.py) of the cached dau data.
+
+    Raises:
+        DataNotLoadedError: If the dau data is not loaded or its index could
+            not be built
+    """
+    activity = get_index("dau_activity")
+    if activity is None:
+        raise DataNotLoadedError("dau")
+    return activity
+
+
+def get_cohort_table():
+    """Get the (user_id, cohort_date) table for the cached users data."""
+    return get_derived(
+        "cohort_users", ("users",), lambda: build_cohort_table(query_cache["users"])
     )
-    weekly_avg["day14_retention"] = (
-        weekly_avg["day14_active_users"] / weekly_avg["cohort_size"] * 100
+
+
+def _aggregate_cohorts(retention_analysis, period_column, days):
+    """Sum daily cohorts into weekly or monthly cohorts and recompute rates."""
+    sum_columns = ["cohort_size"] + [f"day{day}_active_users" for day in days]
+    aggregated = retention_analysis.groupby(period_column).agg(
+        {column: "sum" for column in sum_columns}
     )
-    weekly_avg["day30_retention"] = (
-        weekly_avg["day30_active_users"] / weekly_avg["cohort_size"] * 100
+    for day in days:
+        aggregated[f"day{day}_retention"] = (
+            aggregated[f"day{day}_active_users"] / aggregated["cohort_size"] * 100
+        )
+    return aggregated
+
+
+def get_user_retention_by_cohort():
+    """
+    Calculate user retention metrics by cohort and return as a Python dictionary
+    that can be JSON serialized.
+
+    The result is computed once per version of the dau and users data.
+    """
+    return get_derived(
+        "retention_by_cohort", ("dau", "users"), _compute_user_retention_by_cohort
     )
 
-    # Monthly cohort analysis
-    monthly_retention = retention_analysis.copy()
-    monthly_avg = monthly_retention.groupby("cohort_month").agg(
-        {
-            "cohort_size": "sum",
-            "day1_active_users": "sum",
-            "day7_active_users": "sum",
-            "day14_active_users": "sum",
-            "day30_active_users": "sum",
-        }
+
+def _compute_user_retention_by_cohort():
+    dau_df = query_cache["dau"]
+    activity = get_activity_table()
+    cohort_users = get_cohort_table()
+
+    # Skip cohorts that are too recent for the longest checkpoint
+    last_date = pd.to_datetime(dau_df["date"]).max()
+    cutoff = last_date - timedelta(days=max(RETENTION_DAYS))
+    cohort_sizes = cohort_users.groupby("cohort_date").size()
+    cohort_sizes = cohort_sizes[cohort_sizes.index <= cutoff]
+
+    days = np.asarray(RETENTION_DAYS, dtype=np.int64)
+    counts = count_retained_users(
+        cohort_users, activity, cohort_sizes.index.to_numpy(), days
     )
 
-    monthly_avg["day1_retention"] = (
-        monthly_avg["day1_active_users"] / monthly_avg["cohort_size"] * 100
+    sizes = cohort_sizes.to_numpy()
+    retention_analysis = pd.DataFrame(
+        {"cohort_date": cohort_sizes.index, "cohort_size": sizes}
     )
-    monthly_avg["day7_retention"] = (
-        monthly_avg["day7_active_users"] / monthly_avg["cohort_size"] * 100
+    for i, day in enumerate(RETENTION_DAYS):
+        retention_analysis[f"day{day}_active_users"] = counts[:, i]
+        retention_analysis[f"day{day}_retention"] = counts[:, i] / sizes * 100
+
+    # Sort by cohort date
+    retention_analysis = retention_analysis.sort_values("cohort_date", ascending=False)
+
+    # Add week and month columns for grouping
+    retention_analysis["cohort_week"] = (
+        retention_analysis["cohort_date"].dt.to_period("W").astype(str)
     )
-    monthly_avg["day14_retention"] = (
-        monthly_avg["day14_active_users"] / monthly_avg["cohort_size"] * 100
+    retention_analysis["cohort_month"] = (
+        retention_analysis["cohort_date"].dt.to_period("M").astype(str)
     )
-    monthly_avg["day30_retention"] = (
-        monthly_avg["day30_active_users"] / monthly_avg["cohort_size"] * 100
+
+    # Weekly and monthly cohort analysis
+    weekly_avg = _aggregate_cohorts(retention_analysis, "cohort_week", RETENTION_DAYS)
+    monthly_avg = _aggregate_cohorts(
+        retention_analysis, "cohort_month", RETENTION_DAYS
     )
 
-    # Calculate overall retention rates
+    # Calculate overall retention rates; 0 when no cohort is old enough yet
     overall_cohort_size = int(retention_analysis["cohort_size"].sum())
-    overall_day1_users = int(retention_analysis["day1_active_users"].sum())
-    overall_day7_users = int(retention_analysis["day7_active_users"].sum())
-    overall_day14_users = int(retention_analysis["day14_active_users"].sum())
-    overall_day30_users = int(retention_analysis["day30_active_users"].sum())
-
-    overall_day1_retention = float(overall_day1_users / overall_cohort_size * 100)
-    overall_day7_retention = float(overall_day7_users / overall_cohort_size * 100)
-    overall_day14_retention = float(overall_day14_users / overall_cohort_size * 100)
-    overall_day30_retention = float(overall_day30_users / overall_cohort_size * 100)
-
-    # Calculate rolling averages for weekly retention to identify trends
-    weekly_avg_sorted = weekly_avg.sort_index()
-    weekly_avg_sorted["day1_retention_rolling"] = (
-        weekly_avg_sorted["day1_retention"].rolling(window=4).mean()
-    )
-    weekly_avg_sorted["day7_retention_rolling"] = (
-        weekly_avg_sorted["day7_retention"].rolling(window=4).mean()
-    )
-    weekly_avg_sorted["day14_retention_rolling"] = (
-        weekly_avg_sorted["day14_retention"].rolling(window=4).mean()
-    )
-    weekly_avg_sorted["day30_retention_rolling"] = (
-        weekly_avg_sorted["day30_retention"].rolling(window=4).mean()
-    )
+    overall_retention = {"cohort_size": overall_cohort_size}
+    for day in RETENTION_DAYS:
+        overall_users = int(retention_analysis[f"day{day}_active_users"].sum())
+        overall_retention[f"day{day}_retention"] = (
+            float(overall_users / overall_cohort_size * 100)
+            if overall_cohort_size
+            else 0.0
+        )
 
     # Apply type conversion to all DataFrames before serialization
     weekly_avg_df = convert_numpy_types(weekly_avg.reset_index())
@@ -247,13 +234,124 @@ def get_user_retention_by_cohort():
         "retention_analysis": retention_analysis.to_dict(orient="records"),
         "weekly_avg": weekly_avg_df.to_dict(orient="records"),
         "monthly_avg": monthly_avg_df.to_dict(orient="records"),
-        "overall_retention": {
-            "cohort_size": overall_cohort_size,
-            "day1_retention": overall_day1_retention,
-            "day7_retention": overall_day7_retention,
-            "day14_retention": overall_day14_retention,
-            "day30_retention": overall_day30_retention,
-        },
+        "overall_retention": overall_retention,
+    }
+
+
+# Cohort granularities accepted by get_retention_triangle
+COHORT_PERIODS = {"daily": None, "weekly": "W", "monthly": "M"}
+
+# Upper bound on requested Day-N horizons
+MAX_RETENTION_DAY = 365
+
+
+def validate_triangle_args(period, days=None):
+    """
+    Check the arguments of get_retention_triangle.
+
+    Args:
+        period (str): Cohort granularity, 'daily', 'weekly' or 'monthly'
+        days (list[int]): Day-N horizons (default: 0 through 90)
+
+    Returns:
+        numpy.ndarray: The sorted, de-duplicated horizons
+
+    Raises:
+        ValueError: If the period or a horizon is not supported
+    """
+    if period not in COHORT_PERIODS:
+        raise ValueError(f"Unknown cohort period '{period}'")
+
+    days = np.unique(
+        np.asarray(days if days is not None else range(91), dtype=np.int64)
+    )
+    if len(days) == 0 or days[0] < 0 or days[-1] > MAX_RETENTION_DAY:
+        raise ValueError(f"Retention days must be between 0 and {MAX_RETENTION_DAY}")
+    return days
+
+
+def get_retention_triangle(period="daily", days=None):
+    """
+    Calculate the full cohort retention triangle: for every cohort and every
+    requested Day-N horizon, the share of the cohort active N days after signup.
+
+    Every horizon is counted in the same pass over the activity table, so
+    asking for 90 horizons costs about as much as asking for 4. Cells whose
+    horizon lies past the last day of activity data are returned as None;
+    for weekly and monthly cohorts a cell only includes the signup days
+    that are old enough to have reached that horizon.
+
+    Args:
+        period (str): Cohort granularity, 'daily', 'weekly' or 'monthly'
+        days (list[int]): Day-N horizons (default: 0 through 90)
+
+    Returns:
+        dict: The horizons and one row per cohort, newest first
+    """
+    days = validate_triangle_args(period, days)
+    return get_derived(
+        ("retention_triangle", period, tuple(days.tolist())),
+        ("dau", "users"),
+        lambda: _compute_retention_triangle(period, days),
+    )
+
+
+def _compute_retention_triangle(period, days):
+    dau_df = query_cache["dau"]
+    activity = get_activity_table()
+    cohort_users = get_cohort_table()
+    last_date = pd.to_datetime(dau_df["date"]).max().normalize()
+
+    cohort_sizes = cohort_users.groupby("cohort_date").size()
+    cohort_dates = cohort_sizes.index.to_numpy()
+    counts = count_retained_users(cohort_users, activity, cohort_dates, days)
+
+    # Mask the horizons each daily cohort has not reached yet
+    reached = (
+        cohort_dates[:, None] + days[None, :].astype("timedelta64[D]")
+    ) <= np.datetime64(last_date)
+    active = np.where(reached, counts, 0)
+    eligible = np.where(reached, cohort_sizes.to_numpy()[:, None], 0)
+
+    # Roll daily cohorts up into the requested period
+    if COHORT_PERIODS[period] is None:
+        labels = pd.DatetimeIndex(cohort_dates).strftime("%Y-%m-%d")
+    else:
+        labels = (
+            pd.DatetimeIndex(cohort_dates).to_period(COHORT_PERIODS[period]).astype(str)
+        )
+    keys, groups = np.unique(np.asarray(labels), return_inverse=True)
+    group_active = np.zeros((len(keys), len(days)), dtype=np.int64)
+    group_eligible = np.zeros((len(keys), len(days)), dtype=np.int64)
+    group_sizes = np.zeros(len(keys), dtype=np.int64)
+    np.add.at(group_active, groups, active)
+    np.add.at(group_eligible, groups, eligible)
+    np.add.at(group_sizes, groups, cohort_sizes.to_numpy())
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rates = group_active / group_eligible * 100
+
+    cohorts = []
+    for i in range(len(keys) - 1, -1, -1):
+        has_data = group_eligible[i] > 0
+        cohorts.append(
+            {
+                "cohort": str(keys[i]),
+                "cohort_size": int(group_sizes[i]),
+                "active_users": [
+                    int(count) if ok else None
+                    for count, ok in zip(group_active[i], has_data)
+                ],
+                "retention": [
+                    float(rate) if ok else None for rate, ok in zip(rates[i], has_data)
+                ],
+            }
+        )
+
+    return {
+        "period": period,
+        "days": days.tolist(),
+        "cohorts": cohorts,
     }
 
 
@@ -1,92 +1,67 @@
-from flask import Blueprint, jsonify, request, current_app
-from analytics.retention import get_user_retention, get_user_retention_by_cohort
-from users.user import get_users
+from flask import Blueprint, jsonify, request
+from analytics.retention import (
+    get_user_retention,
+    get_user_retention_by_cohort,
+    get_retention_triangle,
+    validate_triangle_args,
+)
+from analytics.kpi import get_user_metrics
+from analytics.engagement import get_active_user_metrics, validate_returning_days
+from users.user import (
+    get_users_json,
+    get_users_page,
+    get_user,
+    get_user_by_email,
+    search_users,
+    DATE_FILTERS,
+)
+from utils.responses import cached_json_response, data_not_loaded_response
+from data_store import DataNotLoadedError
+from auth import admin_required
 import pandas as pd
-from data_store import refresh_all_data
-from functools import wraps
-import os
-import jwt
-from jwt.exceptions import InvalidTokenError, ExpiredSignatureError
+from refresh_jobs import start_refresh_job, get_refresh_job
 
 # Create analytics blueprint
 analytics_bp = Blueprint("analytics", __name__)
 
-# Define allowed admin emails
-ADMIN_EMAILS = [
-    "zzyzsy0516321@gmail.com",
-    "zzyzsy0516321@yahoo.com",
-    "hkselinali@gmail.com",
-    "alex.taic@gmail.com",
-    "rna.jng@gmail.com",
-]
-
-
-# Authentication decorator
-def admin_required(f, special_privilege_required=False):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        # Get the authorization header
-        auth_header = request.headers.get("Authorization")
-
-        if not auth_header or not auth_header.startswith("Bearer "):
-            return jsonify({"error": "Authorization header is missing or invalid"}), 401
-
-        # Extract the token
-        token = auth_header.split("Bearer ")[1]
-
-        try:
-            # Verify the JWT token from Supabase
-            # The JWT_SECRET should be set in your environment variables (from Supabase project)
-            jwt_secret = os.environ.get("SUPABASE_JWT_SECRET")
-            if not jwt_secret:
-                return jsonify({"error": "Server configuration error"}), 500
-
-            # Decode and verify the token
-            payload = jwt.decode(
-                token, jwt_secret, algorithms=["HS256"], audience="authenticated"
-            )
-
-            # Check if user email is in the allowed list
-            user_email = payload.get("email")
-            if not user_email or user_email not in ADMIN_EMAILS:
-                return jsonify(
-                    {"error": "Access denied. Your email is not authorized."}
-                ), 403
-
-        except ExpiredSignatureError:
-            return jsonify({"error": "Token has expired"}), 401
-        except InvalidTokenError as e:
-            print("invalid token error", e)
-            return jsonify({"error": "Invalid token"}), 401
-        except Exception as e:
-            return jsonify({"error": f"Authentication error: {str(e)}"}), 401
-
-        return f(*args, **kwargs)
-
-    return decorated_function
-
 
 # Route to refresh queries
 @analytics_bp.route("/refresh", methods=["POST"])
 @admin_required
 def refresh_queries():
-    """Refresh all queries."""
+    """
+    Start refreshing all queries in the background.
+
+    Returns the refresh job at once; if a refresh is already running, that
+    job is returned instead of starting another one. Endpoints keep serving
+    the previous data until the refresh has finished.
+    """
     try:
-        refresh_all_data()
-        return jsonify({"message": "Queries refreshed successfully"}), 200
+        job = start_refresh_job()
+        return jsonify(job.to_dict()), 202
     except Exception as e:
         print("error", e)
         return jsonify({"error": str(e)}), 500
 
 
+@analytics_bp.route("/refresh/<job_id>", methods=["GET"])
+@admin_required
+def refresh_status(job_id):
+    """Get the status of a refresh job, per query."""
+    job = get_refresh_job(job_id)
+    if not job:
+        return jsonify({"error": "Refresh job not found"}), 404
+    return jsonify(job.to_dict()), 200
+
+
 @analytics_bp.route("/retention", methods=["GET"])
 @admin_required
 def user_retention():
     """Get user retention data."""
     try:
-        # Now get_user_retention returns a dictionary that jsonify can handle
-        retention_data = get_user_retention()
-        return jsonify(retention_data), 200
+        return cached_json_response("retention", ("retention",), get_user_retention)
+    except DataNotLoadedError as e:
+        return data_not_loaded_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -96,19 +71,264 @@ def user_retention():
 def user_retention_by_cohort():
     """Get user retention data by cohort."""
     try:
-        retention_data = get_user_retention_by_cohort()
-        return jsonify(retention_data), 200
+        return cached_json_response(
+            "retention_by_cohort", ("dau", "users"), get_user_retention_by_cohort
+        )
+    except DataNotLoadedError as e:
+        return data_not_loaded_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@analytics_bp.route("/retention_triangle", methods=["GET"])
+@admin_required
+def user_retention_triangle():
+    """
+    Get the Day-N retention triangle per cohort.
+
+    Query parameters:
+        period: 'daily', 'weekly' or 'monthly' cohorts (default: daily)
+        days: Comma-separated Day-N horizons, e.g. '1,7,14,30'
+        min_day, max_day: Horizon range used when `days` is not given
+            (default: 0 to 90)
+    """
+    period = request.args.get("period", "daily")
+    try:
+        if request.args.get("days"):
+            days = [int(day) for day in request.args["days"].split(",")]
+        else:
+            min_day = int(request.args.get("min_day", 0))
+            max_day = int(request.args.get("max_day", 90))
+            days = list(range(min_day, max_day + 1))
+    except ValueError:
+        return jsonify({"error": "Retention days must be integers"}), 400
+
+    try:
+        days = validate_triangle_args(period, days).tolist()
+        return cached_json_response(
+            ("retention_triangle", period, tuple(days)),
+            ("dau", "users"),
+            lambda: get_retention_triangle(period=period, days=days),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except DataNotLoadedError as e:
+        return data_not_loaded_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@analytics_bp.route("/active_users", methods=["GET"])
+@admin_required
+def active_users():
+    """
+    Get DAU, WAU, MAU, stickiness and Day-N returning rates per day.
+
+    Query parameters:
+        days: Comma-separated Day-N offsets of the returning rates
+            (default: '1,7,30')
+    """
+    try:
+        days = None
+        if request.args.get("days"):
+            days = [int(day) for day in request.args["days"].split(",")]
+    except ValueError:
+        return jsonify({"error": "Returning days must be integers"}), 400
+
+    try:
+        days = validate_returning_days(days)
+        return cached_json_response(
+            ("active_users", tuple(days)),
+            ("dau",),
+            lambda: get_active_user_metrics(days),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except DataNotLoadedError as e:
+        return data_not_loaded_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@analytics_bp.route("/kpi", methods=["GET"])
+@admin_required
+def kpi():
+    """Get the dashboard KPIs aggregated over all users."""
+    try:
+        return cached_json_response("kpi", ("users",), get_user_metrics)
+    except DataNotLoadedError as e:
+        return data_not_loaded_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+# Query parameters that select the paginated /users response
+USERS_PAGE_PARAMS = {
+    "page",
+    "page_size",
+    "sort",
+    "order",
+    "fields",
+    "status",
+    "onboarding",
+    "product_id",
+} | {f"{prefix}_{end}" for prefix in DATE_FILTERS for end in ("from", "to")}
+
+
+def _parse_list(value, convert=str):
+    return None if value is None else [convert(item) for item in value.split(",")]
+
+
+def _parse_timestamp(value):
+    """Parse an ISO date or timestamp as a naive UTC timestamp."""
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.tz_convert("UTC").tz_localize(None)
+    return timestamp
+
+
+def _parse_users_page_args(args):
+    """Convert /users query parameters to get_users_page arguments."""
+    order = args.get("order", "desc")
+    if order not in ("asc", "desc"):
+        raise ValueError("order must be 'asc' or 'desc'")
+
+    onboarding = args.get("onboarding")
+    if onboarding is not None:
+        if onboarding.lower() not in ("true", "false"):
+            raise ValueError("onboarding must be 'true' or 'false'")
+        onboarding = onboarding.lower() == "true"
+
+    filters = {
+        "status": _parse_list(args.get("status"), int),
+        "product_id": _parse_list(args.get("product_id")),
+        "onboarding_complete": onboarding,
+    }
+    for prefix, column in DATE_FILTERS.items():
+        start, end = args.get(f"{prefix}_from"), args.get(f"{prefix}_to")
+        if start is None and end is None:
+            continue
+        start = _parse_timestamp(start) if start else None
+        if end:
+            # A date without a time includes the whole day
+            end_is_date = len(end) == 10
+            end = _parse_timestamp(end) + pd.Timedelta(days=1 if end_is_date else 0)
+        filters[column] = (start, end or None)
+
+    return {
+        "page": int(args.get("page", 1)),
+        "page_size": int(args.get("page_size", 50)),
+        "sort": args.get("sort"),
+        "descending": order == "desc",
+        "filters": filters,
+        "fields": _parse_list(args.get("fields")),
+    }
+
+
 @analytics_bp.route("/users", methods=["GET"])
 @admin_required
 def users():
-    """Get user retention data."""
+    """
+    Get users.
+
+    Without paging parameters, every user is returned keyed by user_id.
+    With any of them, one page of users is returned instead.
+
+    Query parameters:
+        page, page_size: 1-based page number and users per page (default: 1, 50)
+        sort: Column to sort by, e.g. created_at or last_active
+        order: 'asc' or 'desc' (default: desc)
+        fields: Comma-separated columns to return (id is always included)
+        status, product_id: Comma-separated accepted values
+        onboarding: 'true' or 'false'
+        created_from, created_to, last_active_from, last_active_to,
+        expiry_from, expiry_to, purchase_from, purchase_to: Date ranges
+            (ISO dates or timestamps; a date `_to` includes that day)
+    """
+    try:
+        if not USERS_PAGE_PARAMS.intersection(request.args):
+            return cached_json_response(
+                "users", ("users",), get_users_json, serialized=True
+            )
+
+        try:
+            page_args = _parse_users_page_args(request.args)
+        except ValueError as e:
+            return jsonify({"error": f"Invalid parameter: {e}"}), 400
+
+        return cached_json_response(
+            ("users_page", tuple(sorted(request.args.items(multi=True)))),
+            ("users",),
+            lambda: get_users_page(**page_args),
+            cache=False,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except DataNotLoadedError as e:
+        return data_not_loaded_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@analytics_bp.route("/users/search", methods=["GET"])
+@admin_required
+def user_search():
+    """
+    Search users by user_id, email and first_name.
+
+    Query parameters:
+        q: Text to search for; prefix matches work from one character,
+            substring matches from three
+        limit: Maximum number of results (default: 20, at most 100)
+        fields: Comma-separated columns to return (id is always included)
+    """
+    try:
+        limit = int(request.args.get("limit", 20))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    query = request.args.get("q", "")
+    fields = _parse_list(request.args.get("fields"))
+
+    try:
+        return cached_json_response(
+            ("users_search", query, limit, tuple(fields or ())),
+            ("users",),
+            lambda: search_users(query, limit, fields),
+            cache=False,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except DataNotLoadedError as e:
+        return data_not_loaded_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@analytics_bp.route("/users/<user_id>", methods=["GET"])
+@admin_required
+def user_detail(user_id):
+    """Get one user by user_id."""
+    try:
+        user = get_user(user_id)
+        if user is None:
+            return jsonify({"error": "User not found"}), 404
+        return jsonify(user), 200
+    except DataNotLoadedError as e:
+        return data_not_loaded_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@analytics_bp.route("/users/by_email/<email>", methods=["GET"])
+@admin_required
+def user_by_email(email):
+    """Get one user by email address."""
     try:
-        # Now get_user_retention returns a dictionary that jsonify can handle
-        retention_data = get_users()
-        return jsonify(retention_data), 200
+        user = get_user_by_email(email)
+        if user is None:
+            return jsonify({"error": "User not found"}), 404
+        return jsonify(user), 200
+    except DataNotLoadedError as e:
+        return data_not_loaded_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -1,9 +1,12 @@
 from flask import Flask, jsonify
 from dotenv import load_dotenv
 import os
-from data_store import init_data_store
+import threading
+from data_store import init_data_store, warm_up_data_store, get_data_status
+from refresh_jobs import start_scheduler
 from flask_cors import CORS
-from db import analytic_db_engine, main_db_engine, check_connection, init_db, init_app
+from config import Config
+from db import analytic_db_engine, main_db_engine, init_db, init_app
 
 # Load environment variables
 load_dotenv()
@@ -21,14 +24,41 @@ CORS(
     },
 )
 
-# Initialize database schema
-init_db()
+# Lazy mode: serve at once, and create the schema and load the data in a
+# background warm-up; a request reading data not loaded yet loads it first.
+# A preloading gunicorn master always loads everything before forking
+LAZY_DATA_STORE = Config.LAZY_DATA_STORE
+if Config.PRELOAD_APP and os.getenv("LAZY_DATA_STORE", "false").lower() == "true":
+    print("LAZY_DATA_STORE is ignored: gunicorn preloads the data before forking")
+
+
+def warm_up():
+    try:
+        init_db()
+    except Exception as e:
+        print(f"WARNING: Could not initialize database schema: {e}")
+    warm_up_data_store()
+
 
 # Initialize request-scoped database session management
 init_app(app)
 
-# Initialize global data store
-query_data = init_data_store()
+if LAZY_DATA_STORE:
+    query_data = init_data_store(lazy=True)
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+else:
+    # Initialize database schema
+    init_db()
+
+    # Initialize global data store
+    query_data = init_data_store()
+
+# Refresh each query in the background once it passes its refresh_interval.
+# When gunicorn preloads the app (gunicorn.conf.py), this runs in the master
+# process; threads do not survive fork, so each worker starts its own
+# scheduler after forking instead
+if os.getenv("AUTO_REFRESH", "true").lower() == "true" and not Config.PRELOAD_APP:
+    start_scheduler()
 
 # Import routes
 from analytics.routes import analytics_bp
@@ -41,11 +71,13 @@ app.register_blueprint(admin_bp, url_prefix="/api/admin")
 
 @app.route("/health", methods=["GET"])
 def health_check():
-    # Check database connections
-    db_status = check_connection()
+    # Readiness of each dataset, from memory: probes never touch the database.
+    # The server is ready once all datasets are loaded
+    data_status = get_data_status()
     status = {
         "server": "healthy",
         "message": "Analytics server is running",
-        "database": db_status,
+        "data": data_status,
+        "ready": all(query["status"] == "ready" for query in data_status.values()),
     }
     return jsonify(status), 200
@@ -0,0 +1,151 @@
+"""
+Authentication of dashboard admins by their Supabase JWT.
+
+Verified tokens are kept in a small per-process LRU cache until they expire,
+so the parallel requests the dashboard makes with one token only verify its
+signature once.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Optional
+import jwt
+from flask import g, jsonify, request
+from jwt.exceptions import InvalidTokenError, ExpiredSignatureError
+
+# Define allowed admin emails
+ADMIN_EMAILS = frozenset(
+    [
+        "zzyzsy0516321@gmail.com",
+        "zzyzsy0516321@yahoo.com",
+        "hkselinali@gmail.com",
+        "alex.taic@gmail.com",
+        "rna.jng@gmail.com",
+    ]
+)
+
+# Largest number of verified tokens kept per process
+TOKEN_CACHE_SIZE = 1024
+
+# SHA-256 of a verified token -> (email, exp), least recently used first
+_token_cache: "OrderedDict[bytes, tuple]" = OrderedDict()
+_token_cache_lock = threading.Lock()
+
+_jwt_secret: Optional[str] = None
+
+
+def get_jwt_secret() -> Optional[str]:
+    """
+    Get the secret Supabase signs tokens with, read from the environment once.
+
+    Returns:
+        The secret, or None if SUPABASE_JWT_SECRET is not set
+    """
+    global _jwt_secret
+
+    if _jwt_secret is None:
+        # The JWT_SECRET should be set in your environment variables (from Supabase project)
+        _jwt_secret = os.environ.get("SUPABASE_JWT_SECRET") or None
+    return _jwt_secret
+
+
+def verify_token(token: str, jwt_secret: str) -> Optional[str]:
+    """
+    Verify a Supabase JWT and get the email it was issued to.
+
+    A token verified before is served from the cache until its `exp`;
+    tokens without `exp` are verified on every call.
+
+    Args:
+        token: The encoded JWT
+        jwt_secret: The secret the token is signed with
+
+    Returns:
+        The email claim of the token (None if it has none)
+
+    Raises:
+        jwt.exceptions.InvalidTokenError: If the token is invalid or expired
+    """
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+
+    with _token_cache_lock:
+        cached = _token_cache.get(key)
+        if cached is not None:
+            email, expires_at = cached
+            if time.time() < expires_at:
+                _token_cache.move_to_end(key)
+                return email
+            # Expired: verify again, which raises ExpiredSignatureError
+            del _token_cache[key]
+
+    payload = jwt.decode(
+        token, jwt_secret, algorithms=["HS256"], audience="authenticated"
+    )
+    email = payload.get("email")
+
+    expires_at = payload.get("exp")
+    if isinstance(expires_at, (int, float)):
+        with _token_cache_lock:
+            _token_cache[key] = (email, expires_at)
+            _token_cache.move_to_end(key)
+            while len(_token_cache) > TOKEN_CACHE_SIZE:
+                _token_cache.popitem(last=False)
+    return email
+
+
+def clear_token_cache() -> None:
+    """Forget all verified tokens, e.g. after rotating the JWT secret."""
+    with _token_cache_lock:
+        _token_cache.clear()
+
+
+# Authentication decorator
+def admin_required(f):
+    """
+    Only let requests with a valid token of an admin email through.
+
+    The admin's email is stored in flask.g.admin_email for the route.
+    """
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        # Get the authorization header
+        auth_header = request.headers.get("Authorization")
+
+        if not auth_header or not auth_header.startswith("Bearer "):
+            return jsonify({"error": "Authorization header is missing or invalid"}), 401
+
+        # Extract the token
+        token = auth_header.split("Bearer ")[1]
+
+        try:
+            jwt_secret = get_jwt_secret()
+            if not jwt_secret:
+                return jsonify({"error": "Server configuration error"}), 500
+
+            user_email = verify_token(token, jwt_secret)
+
+            # Check if user email is in the allowed list
+            if not user_email or user_email not in ADMIN_EMAILS:
+                return jsonify(
+                    {"error": "Access denied. Your email is not authorized."}
+                ), 403
+
+            # Store the email in Flask's g object for access in the route
+            g.admin_email = user_email
+
+        except ExpiredSignatureError:
+            return jsonify({"error": "Token has expired"}), 401
+        except InvalidTokenError as e:
+            print("invalid token error", e)
+            return jsonify({"error": "Invalid token"}), 401
+        except Exception as e:
+            return jsonify({"error": f"Authentication error: {str(e)}"}), 401
+
+        return f(*args, **kwargs)
+
+    return decorated_function
@@ -0,0 +1,109 @@
+"""
+Benchmark the JSON serialization of GET /api/analytics/users.
+
+Compares the dict-based path (a dict per user + flask's JSON provider) with
+the column-wise serializer, and checks both produce the same JSON.
+
+Usage:
+    python benchmarks/users_json.py                  # synthetic users
+    python benchmarks/users_json.py --rows 200000
+    python benchmarks/users_json.py --snapshot       # latest users snapshot
+"""
+
+# Add parent directory to Python path
+import sys
+import os
+
+# Get the current directory and append it to the Python path
+current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(current_dir)
+
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from flask import Flask
+from data_store import replace_data
+from snapshot_store import get_snapshot_entry, read_snapshot
+from users.user import _user_records, get_users_json
+
+
+def synthetic_users(rows, seed=0):
+    """Build a users frame shaped like the users query."""
+    rng = np.random.default_rng(seed)
+    created = pd.Timestamp("2024-01-01", tz="UTC") + pd.to_timedelta(
+        rng.integers(0, 365 * 24 * 3600, rows), unit="s"
+    )
+    missing = rng.random(rows) < 0.2
+    return pd.DataFrame(
+        {
+            "user_id": [f"{i:08x}-0000-4000-8000-{i:012x}" for i in range(rows)],
+            "email": [f"user{i}@example.com" for i in range(rows)],
+            "first_name": np.where(missing, None, "Alex"),
+            "created_at": created,
+            "last_active": pd.Series(created).where(~missing),
+            "expiry_date": pd.Series(created + pd.Timedelta(days=30)).where(missing),
+            "onboarding_complete": rng.random(rows) > 0.3,
+            "auto_renew_enabled": rng.random(rows) > 0.5,
+            "status": rng.integers(0, 3, rows),
+            "credits": np.where(missing, np.nan, rng.random(rows) * 10),
+            "product_id": rng.choice(["gymii.monthly", "gymii.yearly", None], rows),
+            "promo_codes_used": [
+                [] if i % 3 else (["14-day-free"] if i % 2 else [None])
+                for i in range(rows)
+            ],
+            "dietary_preferences": [
+                None if i % 6 == 0 else {"italian": bool(i % 2), "vegan": False}
+                for i in range(rows)
+            ],
+        }
+    )
+
+
+def users_dict(users_df):
+    """Build every user as a dict keyed by user_id, the way get_user serializes one."""
+    return {record["id"]: record for record in _user_records(users_df)}
+
+
+def timed(function, repeat):
+    """Run function repeat times and return its last result and best time."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--snapshot", action="store_true")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.snapshot:
+        entry = get_snapshot_entry("users")
+        if entry is None:
+            parser.error("No users snapshot found")
+        users_df = read_snapshot(entry["path"])
+    else:
+        users_df = synthetic_users(args.rows)
+    replace_data({"users": users_df})
+
+    app = Flask(__name__)
+    with app.app_context():
+        old, old_time = timed(
+            lambda: app.json.dumps(users_dict(users_df)), args.repeat
+        )
+        new, new_time = timed(get_users_json, args.repeat)
+
+    print(f"Users: {len(users_df)}, JSON: {len(new) / 1e6:.1f} MB")
+    print(f"dicts + flask JSON: {old_time * 1000:.0f} ms")
+    print(f"get_users_json:     {new_time * 1000:.0f} ms")
+    print(f"Speedup: {old_time / new_time:.1f}x")
+    print(f"Identical output: {old == new}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,8 +7,17 @@ load_dotenv()
 class Config:
     """Flask application configuration."""
 
-    PORT = 5500
-    DEBUG = True
+    # Port of both the development server (run.py) and gunicorn.conf.py
+    PORT = int(os.getenv("PORT", "5500"))
+    # Set by gunicorn.conf.py: the master loads the app and all data before
+    # forking the workers, so it overrides LAZY_DATA_STORE
+    PRELOAD_APP = os.getenv("PRELOAD_APP", "false").lower() == "true"
+    # Load the data in the background instead of before serving (app.py)
+    LAZY_DATA_STORE = (
+        os.getenv("LAZY_DATA_STORE", "false").lower() == "true" and not PRELOAD_APP
+    )
+    # Set DEBUG=false in production
+    DEBUG = os.getenv("DEBUG", "true").lower() == "true"
     # Database configuration
     ANALYTIC_DB_URI = os.getenv("ANALYTIC_DB_CONNECTION_STRING")
     MAIN_DB_URI = os.getenv("MAIN_DB_CONNECTION_STRING")
@@ -3,48 +3,518 @@ Module for storing global query data in memory.
 Provides functions to initialize, access, and refresh data.
 """
 
+import itertools
+import os
+import threading
+import time
+import uuid
 import pandas as pd
-from typing import Dict, Optional, Any, TypedDict, List
-from query_databases import run_query, run_all_queries, analytics_to_run, load_latest
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Any, TypedDict, List, Tuple, Union
+from query_databases import (
+    run_query,
+    run_all_queries,
+    analytics_to_run,
+    find_latest_file,
+    load_saved_data,
+    latest_snapshot_time,
+)
+from snapshot_store import (
+    load_current_snapshot,
+    load_manifest,
+    locked_refresh,
+    read_snapshot_entry,
+)
+from activity_index import build_user_activity
 
 
 # Define type for query result
-class QueryResult(TypedDict):
+class QueryResult(TypedDict, total=False):
     query_id: str
     file_name: str
-    pkl_file: str
-    csv_file: str
+    snapshot_file: str
+    csv_file: Optional[str]
     dataframe: pd.DataFrame
+    elapsed_seconds: float
+    error: Optional[str]
+
+
+class DataNotLoadedError(KeyError):
+    """The data of a query is not in the cache: it is loading or failed to load."""
+
+    def __str__(self) -> str:
+        return f"Data for '{self.args[0]}' is not loaded"
+
+
+class _QueryCache(dict):
+    """Dataframes by query ID; reading a query still pending loads it first."""
+
+    def __missing__(self, query_id: str) -> pd.DataFrame:
+        if ensure_loaded(query_id):
+            return dict.__getitem__(self, query_id)
+        raise DataNotLoadedError(query_id)
 
 
 # Global dictionary to store dataframes in memory
-query_cache: Dict[str, pd.DataFrame] = {}
+query_cache: Dict[str, pd.DataFrame] = _QueryCache()
+
+# Load state of each query's data: "pending" (not loaded yet, in lazy mode),
+# "loading", "ready" or "failed"; see init_data_store
+load_status: Dict[str, str] = {}
+load_errors: Dict[str, Optional[str]] = {}
+
+# A failed load is tried again on the next read after a delay, doubled after
+# every failure up to the maximum (seconds)
+LOAD_RETRY_DELAY = 5
+MAX_LOAD_RETRY_DELAY = 300
+_load_failures: Dict[str, int] = {}
+_load_retry_at: Dict[str, float] = {}
+_load_locks: Dict[str, threading.Lock] = {}
+_load_locks_guard = threading.Lock()
+
+# Version of each cached dataframe, bumped whenever the dataframe is replaced
+data_versions: Dict[str, int] = {}
+_version_counter = itertools.count(1)
+
+# When the data behind each cached dataframe was fetched (POSIX timestamp)
+refreshed_at: Dict[str, float] = {}
+
+# Identifies this store instance, so versions from another process never collide
+store_id = uuid.uuid4().hex
+
+# Snapshot file each cached dataframe was loaded from or saved to; the same in
+# every process sharing the data directory
+snapshot_paths: Dict[str, str] = {}
+
+# Manifest generation the cache was last synchronized with, see sync_snapshots
+_synced_generation: Optional[int] = None
+_sync_lock = threading.Lock()
+
+# Set while this process refreshes; its own new snapshots are not reloaded
+_refreshing = threading.Event()
+
+# Maximum number of derived results kept in memory
+DERIVED_CACHE_MAX_ENTRIES = 64
+
+# Results derived from query_cache (cohort analysis, users dict, JSON bytes...),
+# keyed on the derived key plus the versions of the dataframes it was built from
+_derived_cache: "OrderedDict[Tuple[Any, Tuple[Tuple[str, int], ...]], Any]" = (
+    OrderedDict()
+)
+_derived_lock = threading.Lock()
+
+# Index builders registered per query: query ID -> {index name: build(df)}
+_index_builders: Dict[str, Dict[str, Callable[[pd.DataFrame], Any]]] = {}
+
+# Indexes built from the current dataframes, keyed by index name
+indexes: Dict[str, Any] = {}
+
+
+def register_index(
+    query_id: str, name: str, build: Callable[[pd.DataFrame], Any]
+) -> None:
+    """
+    Register an index built from a query's dataframe.
+
+    The index is rebuilt whenever the dataframe is replaced, before the new
+    dataframe becomes visible, so an index always matches its dataframe.
+
+    Args:
+        query_id: ID of the query in analytics_to_run dictionary
+        name: Name the index is looked up by with get_index
+        build: Function building the index from the dataframe
+    """
+    _index_builders.setdefault(query_id, {})[name] = build
+    df = query_cache.get(query_id)
+    if df is not None:
+        with _derived_lock:
+            indexes[name] = build(df)
+
+
+def get_index(name: str) -> Any:
+    """
+    Get an index registered with register_index.
+
+    Args:
+        name: Name of the index
+
+    Returns:
+        The index built from the current dataframe, or None if its query is
+        not loaded
+    """
+    if name not in indexes:
+        for query_id, builders in _index_builders.items():
+            if name in builders:
+                ensure_loaded(query_id)
+    return indexes.get(name)
+
+
+def _build_indexes(frames: Dict[str, pd.DataFrame]) -> Dict[str, Any]:
+    built = {}
+    for query_id, df in frames.items():
+        for name, build in _index_builders.get(query_id, {}).items():
+            try:
+                built[name] = build(df)
+            except Exception as e:
+                print(f"WARNING: Could not build index '{name}': {e}")
+                built[name] = None
+    return built
+
+
+def set_data(
+    query_id: str,
+    df: pd.DataFrame,
+    fetched_at: Optional[float] = None,
+    snapshot: Optional[str] = None,
+) -> int:
+    """
+    Replace the cached dataframe for a query and bump its version.
+
+    Derived results built from the previous dataframe are dropped.
+
+    Args:
+        query_id: ID of the query in analytics_to_run dictionary
+        df: The new dataframe
+        fetched_at: When the data was fetched from the database (default: now)
+        snapshot: Path of the snapshot the dataframe was loaded from or saved to
+
+    Returns:
+        The new version of the query's data
+    """
+    snapshots = {query_id: snapshot} if snapshot else None
+    return replace_data({query_id: df}, fetched_at, snapshots)[query_id]
+
+
+def replace_data(
+    frames: Dict[str, pd.DataFrame],
+    fetched_at: Optional[Union[float, Dict[str, float]]] = None,
+    snapshots: Optional[Dict[str, str]] = None,
+) -> Dict[str, int]:
+    """
+    Replace the cached dataframes of several queries in one step, so readers
+    never see a mix of old and new frames from the same refresh. Indexes of
+    the replaced queries are rebuilt first and swapped in with them.
+
+    Args:
+        frames: Mapping of query ID to its new dataframe
+        fetched_at: When the data was fetched from the database (default:
+            now), or a mapping of query ID to that time
+        snapshots: Mapping of query ID to the snapshot its dataframe was
+            loaded from or saved to, see get_data_tags
+
+    Returns:
+        Mapping of query ID to the new version of its data
+    """
+    versions = {query_id: next(_version_counter) for query_id in frames}
+    now = time.time()
+    if not isinstance(fetched_at, dict):
+        fetched_at = {query_id: fetched_at for query_id in frames}
+    fetched_at = {
+        query_id: now if fetched_at.get(query_id) is None else fetched_at[query_id]
+        for query_id in frames
+    }
+    built = _build_indexes(frames)
+    with _derived_lock:
+        query_cache.update(frames)
+        indexes.update(built)
+        data_versions.update(versions)
+        refreshed_at.update(fetched_at)
+        load_status.update({query_id: "ready" for query_id in frames})
+        for query_id in frames:
+            if snapshots and snapshots.get(query_id):
+                snapshot_paths[query_id] = snapshots[query_id]
+            else:
+                snapshot_paths.pop(query_id, None)
+        for cache_key in list(_derived_cache):
+            if any(source in frames for source, _ in cache_key[1]):
+                del _derived_cache[cache_key]
+    return versions
+
+
+def get_data_version(*query_ids: str) -> Tuple[Tuple[str, int], ...]:
+    """
+    Get the current version of one or more cached queries.
+
+    Args:
+        query_ids: IDs of the queries in analytics_to_run dictionary
+
+    Returns:
+        Tuple of (query_id, version) pairs; version is 0 if nothing is loaded
+    """
+    return tuple((query_id, data_versions.get(query_id, 0)) for query_id in query_ids)
+
+
+def get_data_tags(*query_ids: str) -> Tuple[Tuple[str, str], ...]:
+    """
+    Identify the data of one or more cached queries across processes.
+
+    Data loaded from or saved to a snapshot is identified by the snapshot
+    file, so every worker serving the same snapshot reports the same tag
+    (and ETag); other data by this store's ID and the data version.
+
+    Args:
+        query_ids: IDs of the queries in analytics_to_run dictionary
+
+    Returns:
+        Tuple of (query_id, tag) pairs
+    """
+    ensure_loaded(*query_ids)
+    tags = []
+    for query_id in query_ids:
+        path = snapshot_paths.get(query_id)
+        if path:
+            tags.append((query_id, os.path.basename(path)))
+        else:
+            tags.append((query_id, f"{store_id}:{data_versions.get(query_id, 0)}"))
+    return tuple(tags)
+
+
+def get_derived(key: Any, sources: Tuple[str, ...], compute: Callable[[], Any]) -> Any:
+    """
+    Get a result derived from cached query data, computing it only once per
+    version of its source dataframes.
+
+    Args:
+        key: Hashable identifier of the derived result
+        sources: IDs of the queries the result is computed from
+        compute: Function building the result from query_cache
+
+    Returns:
+        The memoized result of compute()
+    """
+    ensure_loaded(*sources)
+    cache_key = (key, get_data_version(*sources))
+    with _derived_lock:
+        if cache_key in _derived_cache:
+            _derived_cache.move_to_end(cache_key)
+            return _derived_cache[cache_key]
+
+    value = compute()
+
+    with _derived_lock:
+        # Only keep the result if its sources were not replaced meanwhile
+        if cache_key[1] == get_data_version(*sources):
+            _derived_cache[cache_key] = value
+            while len(_derived_cache) > DERIVED_CACHE_MAX_ENTRIES:
+                _derived_cache.popitem(last=False)
+    return value
+
+
+# Active users per day, parsed once per version of the dau data
+register_index("dau", "dau_activity", build_user_activity)
+
+
+def _load_snapshot(query_id: str) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
+    """
+    Load the latest snapshot of a query; returns (dataframe, path).
+
+    The snapshot recorded in the manifest is checked against its checksum;
+    files saved before the manifest existed are found by scanning.
+    """
+    try:
+        df, entry = load_current_snapshot(analytics_to_run[query_id]["name"])
+    except FileNotFoundError as e:
+        print(f"Snapshot in manifest not found: {e.filename}")
+        df, entry = None, None
+    if entry is not None:
+        print(f"Loaded most recent data for '{query_id}' from {entry['path']}")
+        return df, entry["path"]
+
+    path = find_latest_file(query_id)
+    if path is None:
+        return None, None
+    print(f"Loading most recent data for '{query_id}' from {path}")
+    return load_saved_data(path), path
 
 
-def init_data_store() -> Dict[str, pd.DataFrame]:
+def _load_query(query_id: str) -> None:
+    """
+    Load the latest data of a query into the cache, or run the query if it
+    has never been saved.
+    """
+    load_status[query_id] = "loading"
+    try:
+        # Try to load the latest data first
+        fetched_at: Optional[float] = latest_snapshot_time(query_id)
+        df, path = _load_snapshot(query_id)
+
+        # If no data exists, run the query, unless another process has
+        # saved it while this one waited for the refresh lock
+        if df is None:
+            with locked_refresh():
+                fetched_at = latest_snapshot_time(query_id)
+                df, path = _load_snapshot(query_id)
+                if df is None:
+                    fetched_at = None
+                    result: Optional[QueryResult] = run_query(query_id)
+                    if result and "dataframe" in result:
+                        df, path = result["dataframe"], result["snapshot_file"]
+    except Exception as e:
+        print(f"WARNING: Could not load data for '{query_id}': {e}")
+        _load_failed(query_id, str(e))
+        return
+
+    # Store the dataframe in the global cache
+    if df is not None:
+        set_data(query_id, df, fetched_at, path)
+        load_errors[query_id] = None
+        _load_failures.pop(query_id, None)
+        _load_retry_at.pop(query_id, None)
+        print(f"Loaded data for '{query_id}' into memory cache")
+    else:
+        _load_failed(query_id, "No data")
+        print(f"WARNING: No data loaded for '{query_id}'")
+
+
+def _load_failed(query_id: str, error: str) -> None:
+    """Mark a load as failed and schedule its next attempt."""
+    failures = _load_failures.get(query_id, 0) + 1
+    delay = min(LOAD_RETRY_DELAY * 2 ** (failures - 1), MAX_LOAD_RETRY_DELAY)
+    _load_failures[query_id] = failures
+    _load_retry_at[query_id] = time.monotonic() + delay
+    load_errors[query_id] = error
+    load_status[query_id] = "failed"
+
+
+def _needs_load(query_id: str) -> bool:
+    """Check whether a query is pending, or failed and due for another try."""
+    status = load_status.get(query_id)
+    return status == "pending" or (
+        status == "failed" and time.monotonic() >= _load_retry_at.get(query_id, 0)
+    )
+
+
+def ensure_loaded(*query_ids: str) -> bool:
+    """
+    Load the data of queries still pending in lazy mode, or whose last load
+    failed more than its retry delay ago; a query that is being loaded by
+    another thread is waited for.
+
+    Args:
+        query_ids: IDs of the queries in analytics_to_run dictionary
+
+    Returns:
+        True if every query has data in the cache
+    """
+    for query_id in query_ids:
+        if load_status.get(query_id) != "loading" and not _needs_load(query_id):
+            continue
+        with _load_locks_guard:
+            lock = _load_locks.setdefault(query_id, threading.Lock())
+        with lock:
+            if _needs_load(query_id):
+                _load_query(query_id)
+    return all(dict.__contains__(query_cache, query_id) for query_id in query_ids)
+
+
+def init_data_store(lazy: bool = False) -> Dict[str, pd.DataFrame]:
     """
     Initialize the data store with the latest data from each query.
     If no data exists, run the queries to populate the cache.
+
+    Args:
+        lazy: Return at once and load each query's data when it is first
+            read, or by warm_up_data_store, instead of loading it all now
     """
+    global _synced_generation
+
     print("Initializing global data store...")
+    _synced_generation = load_manifest().get("generation", 0)
     for query_id in analytics_to_run:
-        # Try to load the latest data first
-        df: Optional[pd.DataFrame] = load_latest(query_id)
+        load_status.setdefault(query_id, "pending")
 
-        # If no data exists, run the query
-        if df is None:
-            result: Optional[QueryResult] = run_query(query_id)
-            if result and "dataframe" in result:
-                df = result["dataframe"]
+    if not lazy:
+        ensure_loaded(*analytics_to_run)
+    return query_cache
 
-        # Store the dataframe in the global cache
-        if df is not None:
-            query_cache[query_id] = df
-            print(f"Loaded data for '{query_id}' into memory cache")
-        else:
-            print(f"WARNING: No data loaded for '{query_id}'")
 
-    return query_cache
+def warm_up_data_store() -> None:
+    """Load the data of every query still pending, one query at a time."""
+    for query_id in analytics_to_run:
+        ensure_loaded(query_id)
+    print("Data store warm-up finished")
+
+
+def get_data_status() -> Dict[str, Dict[str, Any]]:
+    """
+    Report whether the data of each query is loaded.
+
+    Returns:
+        Dict of query IDs mapping to their load `status` (see load_status),
+        number of `rows`, `age_seconds`, load `error`, if any, and for a
+        failed load `retry_in_seconds`, the time until it is tried again
+    """
+    status = {}
+    now = time.monotonic()
+    for query_id in analytics_to_run:
+        df = dict.get(query_cache, query_id)
+        query_status = load_status.get(
+            query_id, "ready" if df is not None else "pending"
+        )
+        status[query_id] = {
+            "status": query_status,
+            "rows": None if df is None else len(df),
+            "age_seconds": get_data_age(query_id),
+            "error": load_errors.get(query_id),
+        }
+        if query_status == "failed":
+            retry_in = _load_retry_at.get(query_id, now) - now
+            status[query_id]["retry_in_seconds"] = max(0.0, retry_in)
+    return status
+
+
+def sync_snapshots() -> List[str]:
+    """
+    Load the snapshots other processes saved since this one last looked, so
+    every worker serves the same data without querying it again.
+
+    While no snapshot has changed, this costs one stat() of the manifest:
+    every snapshot write bumps the manifest generation.
+
+    Returns:
+        IDs of the queries whose data was reloaded
+    """
+    global _synced_generation
+
+    if (
+        load_manifest().get("generation", 0) == _synced_generation
+        or _refreshing.is_set()
+    ):
+        return []
+
+    with _sync_lock:
+        manifest = load_manifest()
+        generation = manifest.get("generation", 0)
+        if generation == _synced_generation:
+            return []
+
+        frames: Dict[str, pd.DataFrame] = {}
+        fetched_at: Dict[str, float] = {}
+        snapshots: Dict[str, str] = {}
+        for query_id, query_info in analytics_to_run.items():
+            entry = manifest["snapshots"].get(query_info["name"])
+            if (
+                entry is None
+                or load_status.get(query_id) in ("pending", "loading")
+                or entry["path"] == snapshot_paths.get(query_id)
+                or entry["created_at"] <= refreshed_at.get(query_id, 0)
+            ):
+                continue
+            try:
+                df = read_snapshot_entry(entry)
+            except FileNotFoundError:
+                # Replaced again meanwhile; the next sync loads the newer one
+                continue
+            frames[query_id] = df
+            fetched_at[query_id] = entry["created_at"]
+            snapshots[query_id] = entry["path"]
+
+        if frames:
+            replace_data(frames, fetched_at, snapshots)
+            print(f"Loaded data saved by another process: {', '.join(frames)}")
+        _synced_generation = generation
+        return list(frames)
 
 
 def get_data(query_id: str) -> Optional[pd.DataFrame]:
@@ -57,21 +527,148 @@ def get_data(query_id: str) -> Optional[pd.DataFrame]:
     Returns:
         DataFrame with the cached data or None if not found
     """
+    ensure_loaded(query_id)
     return query_cache.get(query_id)
 
 
-def refresh_all_data() -> Dict[str, pd.DataFrame]:
+def get_data_age(query_id: str) -> Optional[float]:
+    """
+    Get how old the cached data for a query is.
+
+    Args:
+        query_id: ID of the query in analytics_to_run dictionary
+
+    Returns:
+        Age in seconds, or None if no data is loaded
+    """
+    fetched_at = refreshed_at.get(query_id)
+    return None if fetched_at is None else max(0.0, time.time() - fetched_at)
+
+
+def is_stale(query_id: str) -> bool:
+    """
+    Check whether the cached data for a query has outlived its refresh_interval.
+
+    Queries without a refresh_interval never go stale, and neither do
+    queries whose data has not been loaded yet.
+
+    Args:
+        query_id: ID of the query in analytics_to_run dictionary
+
+    Returns:
+        True if the data should be refreshed
+    """
+    interval = analytics_to_run.get(query_id, {}).get("refresh_interval")
+    if not interval or load_status.get(query_id) in ("pending", "loading"):
+        return False
+    age = get_data_age(query_id)
+    return age is None or age >= interval
+
+
+@contextmanager
+def _refreshing_data():
+    """Mark this process as refreshing; callers hold locked_refresh."""
+    _refreshing.set()
+    try:
+        yield
+    finally:
+        _refreshing.clear()
+
+
+def _fresh_snapshots(
+    query_ids: List[str], fresh_since: Optional[float] = None
+) -> List[str]:
+    """
+    Find the queries whose saved snapshot can be loaded instead of running
+    them again: snapshots newer than the cached data (saved by another
+    process) and taken at or after fresh_since.
+
+    Args:
+        query_ids: IDs of the queries to check
+        fresh_since: Oldest acceptable snapshot time (default: snapshots that
+            are not stale yet, see is_stale)
+    """
+    now = time.time()
+    fresh = []
+    for query_id in query_ids:
+        snapshot_time = latest_snapshot_time(query_id)
+        if snapshot_time is None or snapshot_time <= refreshed_at.get(query_id, 0):
+            continue
+        since = fresh_since
+        if since is None:
+            interval = analytics_to_run.get(query_id, {}).get("refresh_interval")
+            since = now - interval if interval else 0
+        if snapshot_time >= since:
+            fresh.append(query_id)
+    return fresh
+
+
+def refresh_all_data(
+    on_progress: Optional[Callable[[str, str, Optional[QueryResult]], None]] = None,
+    query_ids: Optional[List[str]] = None,
+    fresh_since: Optional[float] = None,
+) -> Dict[str, pd.DataFrame]:
     """
     Refresh all cached data by running all queries again.
+
+    Queries run concurrently; once all of them have finished, the successful
+    results are swapped into the cache together. Failed queries keep serving
+    their previous data.
+
+    Only one process refreshes at a time (see locked_refresh). Queries that
+    another process refreshed meanwhile are loaded from its snapshots instead
+    of being run again.
+
+    Args:
+        on_progress: Optional per-query progress callback, see run_timed_query
+        query_ids: Queries to refresh (default: every query in analytics_to_run)
+        fresh_since: Oldest snapshot that may be loaded instead of running a
+            query, see _fresh_snapshots
     """
-    print("Refreshing all data in cache...")
-    results: Dict[str, QueryResult] = run_all_queries()
+    query_ids = list(query_ids if query_ids is not None else analytics_to_run)
+
+    with locked_refresh(), _refreshing_data():
+        print("Refreshing all data in cache...")
+        frames: Dict[str, pd.DataFrame] = {}
+        fetched_at: Dict[str, float] = {}
+        snapshots: Dict[str, str] = {}
+        for query_id in _fresh_snapshots(query_ids, fresh_since):
+            start = time.perf_counter()
+            snapshot_time = latest_snapshot_time(query_id)
+            df, path = _load_snapshot(query_id)
+            if df is None:
+                continue
+            frames[query_id] = df
+            fetched_at[query_id] = snapshot_time
+            snapshots[query_id] = path
+            print(f"Loaded data for '{query_id}' refreshed by another process")
+            if on_progress:
+                on_progress(
+                    query_id,
+                    "completed",
+                    {"elapsed_seconds": time.perf_counter() - start, "error": None},
+                )
+
+        to_run = [query_id for query_id in query_ids if query_id not in frames]
+        results: Dict[str, QueryResult] = run_all_queries(
+            to_run, on_progress=on_progress, base_frames=dict(query_cache)
+        )
+
+        # Update the global cache with new results
+        for query_id, result in results.items():
+            if result and "dataframe" in result:
+                frames[query_id] = result["dataframe"]
+                snapshots[query_id] = result.get("snapshot_file")
+        replace_data(frames, fetched_at, snapshots)
 
-    # Update the global cache with new results
     for query_id, result in results.items():
-        if result and "dataframe" in result:
-            query_cache[query_id] = result["dataframe"]
-            print(f"Refreshed data for '{query_id}' in memory cache")
+        if query_id in frames:
+            print(
+                f"Refreshed data for '{query_id}' in memory cache "
+                f"({result['elapsed_seconds']:.2f}s)"
+            )
+        else:
+            print(f"WARNING: Refresh failed for '{query_id}': {result.get('error')}")
 
     return query_cache
 
@@ -90,10 +687,13 @@ def refresh_query(query_id: str) -> bool:
         print(f"Query ID '{query_id}' not found in analytics_to_run dictionary")
         return False
 
-    result: Optional[QueryResult] = run_query(query_id)
-    if result and "dataframe" in result:
-        query_cache[query_id] = result["dataframe"]
-        print(f"Refreshed data for '{query_id}' in memory cache")
-        return True
+    with locked_refresh(), _refreshing_data():
+        result: Optional[QueryResult] = run_query(query_id, query_cache.get(query_id))
+        if result and "dataframe" in result:
+            set_data(
+                query_id, result["dataframe"], snapshot=result.get("snapshot_file")
+            )
+            print(f"Refreshed data for '{query_id}' in memory cache")
+            return True
 
     return False
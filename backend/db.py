@@ -1,8 +1,12 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, scoped_session
 import os
+import json
+import tempfile
 import pandas as pd
+from datetime import date, datetime, timezone
+from decimal import Decimal
 from dotenv import load_dotenv
 from sqlalchemy.pool import QueuePool
 from contextlib import contextmanager
@@ -142,7 +146,17 @@ def analytic_db_session():
 
 
 def execute_query(query, params=None, is_analytics_db=True):
-    """Execute a raw SQL query and return the results as a pandas DataFrame."""
+    """
+    Execute a raw SQL query and return the results as a pandas DataFrame.
+
+    Args:
+        query: SQL query string
+        params: Optional query parameters
+        is_analytics_db: Whether to run on analytics DB (True) or main DB (False)
+
+    Returns:
+        DataFrame with the query results
+    """
     engine = analytic_db_engine if is_analytics_db else main_db_engine
     with engine.connect() as connection:
         try:
@@ -155,6 +169,284 @@ def execute_query(query, params=None, is_analytics_db=True):
             raise
 
 
+# Postgres type OIDs of the columns COPY output is parsed into
+PG_BOOL = 16
+PG_INTEGERS = {20, 21, 23}  # int8, int2, int4
+PG_FLOATS = {700, 701}  # float4, float8
+PG_NUMERIC = 1700
+PG_DATE = 1082
+PG_TIMESTAMP = 1114
+PG_TIMESTAMPTZ = 1184
+PG_JSON = {114, 3802}  # json, jsonb
+# Array type OIDs mapped to the OID of their elements
+PG_ARRAYS = {
+    1000: PG_BOOL,
+    1005: 21,
+    1007: 23,
+    1016: 20,
+    1021: 700,
+    1022: 701,
+    1231: PG_NUMERIC,
+    1009: 25,  # text
+    1015: 1043,  # varchar
+    1014: 1042,  # bpchar
+    2951: 2950,  # uuid
+    1182: PG_DATE,
+    1115: PG_TIMESTAMP,
+    1185: PG_TIMESTAMPTZ,
+}
+
+# NULL marker written by COPY; unlike the default empty string it keeps empty
+# text values apart from NULL (only a text value of exactly \N reads as NULL)
+COPY_NULL = "\\N"
+
+
+def _parse_pg_date(value):
+    """Parse a date as psycopg2 does, mapping +/-infinity to date.max/min."""
+    if value == "infinity":
+        return date.max
+    if value == "-infinity":
+        return date.min
+    return date.fromisoformat(value)
+
+
+def _parse_pg_datetime(value, aware=False):
+    """
+    Parse a timestamp as psycopg2 does, mapping +/-infinity to datetime.max/min
+    (in UTC when aware is set, as for timestamptz).
+    """
+    if value in ("infinity", "-infinity"):
+        limit = datetime.max if value == "infinity" else datetime.min
+        return limit.replace(tzinfo=timezone.utc) if aware else limit
+    return datetime.fromisoformat(value)
+
+
+def _convert_array_element(value, type_oid):
+    if value is None:
+        return None
+    if type_oid == PG_BOOL:
+        return value == "t"
+    if type_oid in PG_INTEGERS:
+        return int(value)
+    if type_oid in PG_FLOATS:
+        return float(value)
+    if type_oid == PG_NUMERIC:
+        return Decimal(value)
+    if type_oid == PG_DATE:
+        return _parse_pg_date(value)
+    if type_oid in (PG_TIMESTAMP, PG_TIMESTAMPTZ):
+        return _parse_pg_datetime(value, aware=type_oid == PG_TIMESTAMPTZ)
+    return value
+
+
+def parse_pg_array(value, element_oid=25):
+    """
+    Parse the text form of a Postgres array, e.g. '{a,"b c",NULL}'.
+
+    Args:
+        value: Array literal as written by COPY
+        element_oid: Type OID of the array elements (default: text)
+
+    Returns:
+        List of converted elements (nested lists for multi-dimensional arrays)
+    """
+    # Arrays may carry explicit bounds, e.g. '[0:1]={a,b}'
+    if value.startswith("["):
+        value = value[value.index("=") + 1 :]
+
+    # Fast path: no quoted elements or nested arrays
+    inner = value[1:-1]
+    if '"' not in inner and "{" not in inner:
+        if not inner:
+            return []
+        return [
+            _convert_array_element(None if item == "NULL" else item, element_oid)
+            for item in inner.split(",")
+        ]
+
+    stack = [[]]
+    item = []
+    quoted = False
+    was_quoted = False
+    escaped = False
+    for char in value[1:]:
+        if escaped:
+            item.append(char)
+            escaped = False
+        elif quoted:
+            if char == "\\":
+                escaped = True
+            elif char == '"':
+                quoted = False
+            else:
+                item.append(char)
+        elif char == '"':
+            quoted = was_quoted = True
+        elif char == "{":
+            stack.append([])
+        elif char in ",}":
+            if item or was_quoted:
+                text_value = "".join(item)
+                if not was_quoted and text_value == "NULL":
+                    text_value = None
+                stack[-1].append(_convert_array_element(text_value, element_oid))
+            item = []
+            was_quoted = False
+            if char == "}":
+                if len(stack) == 1:
+                    break
+                nested = stack.pop()
+                stack[-1].append(nested)
+        else:
+            item.append(char)
+    return stack[0]
+
+
+def _parse_timestamptz(values):
+    """
+    Parse timestamptz text as written by COPY, keeping the UTC offset of the
+    session time zone on every value, like the rows returned by execute_query.
+
+    Args:
+        values: Series of timestamp strings, e.g. '2025-03-01 23:58:06+01'
+
+    Returns:
+        A datetime64 series in the fixed offset of the values, or an object
+        series of datetimes when the offset changes (e.g. across DST) or a
+        value is out of the datetime64[ns] range
+    """
+    present = values.dropna()
+    if present.empty:
+        return values
+    offsets = present.str.extract(r"([+-][\d:]+)$", expand=False)
+    if offsets.nunique(dropna=False) == 1:
+        try:
+            tzinfo = datetime.fromisoformat(present.iloc[0]).tzinfo
+            return pd.to_datetime(values, utc=True, format="ISO8601").dt.tz_convert(
+                tzinfo
+            )
+        except ValueError:
+            # infinity or a year past 2262, which datetime64[ns] cannot hold
+            pass
+    return values.map(
+        lambda value: _parse_pg_datetime(value, aware=True), na_action="ignore"
+    )
+
+
+def parse_copy_csv(stream, columns):
+    """
+    Parse the CSV output of COPY ... TO STDOUT into a typed DataFrame.
+
+    Integers, floats, booleans and timestamps become native dtypes, json columns
+    are decoded and arrays become lists. Dates and numerics are kept as
+    datetime.date and Decimal values, and timestamptz values keep the session's
+    UTC offset, like the rows returned by execute_query. Timestamps outside the
+    datetime64[ns] range, including infinity, stay Python datetimes as psycopg2
+    returns them.
+
+    Args:
+        stream: File-like object with the CSV text, written with a header row
+            and COPY_NULL as the NULL marker
+        columns: List of (name, type OID) pairs for the result columns
+
+    Returns:
+        DataFrame with the parsed rows
+    """
+    names = [name for name, _ in columns]
+    df = pd.read_csv(
+        stream,
+        dtype=str,
+        keep_default_na=False,
+        na_values=[COPY_NULL],
+        header=0,
+        names=names,
+    )
+
+    for name, type_oid in columns:
+        values = df[name]
+        if type_oid in PG_INTEGERS:
+            df[name] = pd.to_numeric(values)
+        elif type_oid in PG_FLOATS:
+            df[name] = values.astype("float64")
+        elif type_oid == PG_BOOL:
+            converted = values.map({"t": True, "f": False})
+            df[name] = converted.astype(bool) if values.notna().all() else converted
+        elif type_oid == PG_TIMESTAMP:
+            try:
+                df[name] = pd.to_datetime(values, format="ISO8601")
+            except ValueError:
+                # infinity or a year past 2262, which datetime64[ns] cannot hold
+                df[name] = values.map(_parse_pg_datetime, na_action="ignore")
+        elif type_oid == PG_TIMESTAMPTZ:
+            df[name] = _parse_timestamptz(values)
+        elif type_oid == PG_DATE:
+            try:
+                df[name] = pd.to_datetime(values, format="ISO8601").dt.date
+            except ValueError:
+                df[name] = values.map(_parse_pg_date, na_action="ignore")
+        elif type_oid == PG_NUMERIC:
+            df[name] = values.map(Decimal, na_action="ignore")
+        elif type_oid in PG_JSON:
+            df[name] = values.map(json.loads, na_action="ignore")
+        elif type_oid in PG_ARRAYS:
+            element_oid = PG_ARRAYS[type_oid]
+            df[name] = values.map(
+                lambda value: parse_pg_array(value, element_oid), na_action="ignore"
+            )
+
+        # Missing values in object columns are None, as in execute_query
+        if df[name].dtype == object:
+            df[name] = df[name].astype(object).where(df[name].notna(), None)
+    return df
+
+
+def copy_query(query, params=None, is_analytics_db=True):
+    """
+    Execute a SQL query with COPY ... TO STDOUT and return a DataFrame.
+
+    COPY streams the whole result as CSV text, which is much faster to
+    transfer and parse for large results than fetching rows one by one.
+    Column types are read from the cursor description of the query.
+
+    Args:
+        query: SQL query string (a SELECT, using :name parameters)
+        params: Optional query parameters
+        is_analytics_db: Whether to run on analytics DB (True) or main DB (False)
+
+    Returns:
+        DataFrame with the query results
+    """
+    engine = analytic_db_engine if is_analytics_db else main_db_engine
+    compiled = text(query.strip().rstrip(";")).compile(dialect=engine.dialect)
+    bound_params = {**compiled.params, **(params or {})}
+
+    connection = engine.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            sql = cursor.mogrify(str(compiled), bound_params).decode("utf-8")
+
+            # Read the column types without fetching any rows
+            cursor.execute(f"SELECT * FROM ({sql}) AS copy_query LIMIT 0")
+            columns = [(column.name, column.type_code) for column in cursor.description]
+
+            with tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024) as buffer:
+                cursor.copy_expert(
+                    f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER true, "
+                    f"NULL '{COPY_NULL}')",
+                    buffer,
+                )
+                buffer.seek(0)
+                df = parse_copy_csv(buffer, columns)
+        connection.commit()
+        return df
+    except Exception as e:
+        print(f"Error executing COPY query: {e}")
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+
 def check_connection():
     """Check database connections and return status."""
     status = {"analytics_db": False, "main_db": False}
@@ -178,9 +470,33 @@ def check_connection():
 
 # Function to initialize the database schema
 def init_db():
-    """Initialize database schema."""
+    """Create the tables and indexes of the models that do not exist yet."""
     # Import all models to ensure they are registered with Base
     import models
 
-    # Create all tables
-    Base.metadata.create_all(bind=main_db_engine)
+    # Views live in the analytics database and are never created here
+    tables = [
+        table
+        for table in Base.metadata.sorted_tables
+        if not table.info.get("is_view")
+    ]
+
+    # One catalog query instead of a check per table on every start
+    inspector = inspect(main_db_engine)
+    existing = set(inspector.get_table_names())
+    missing = [table for table in tables if table.name not in existing]
+
+    # Create the missing tables
+    if missing:
+        Base.metadata.create_all(bind=main_db_engine, tables=missing)
+
+    # create_all never adds indexes to existing tables, so create the ones
+    # declared since a table was created
+    for table in tables:
+        if table.name not in existing or not table.indexes:
+            continue
+        indexed = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexed:
+                print(f"Creating index {index.name}")
+                index.create(bind=main_db_engine)
@@ -0,0 +1,49 @@
+"""
+Gunicorn configuration for serving the app in production:
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The app and its data store are loaded once in the master process and the
+workers are forked from it, so they share the loaded dataframes and indexes
+copy-on-write instead of each loading every snapshot again. Refreshes are
+serialized across workers by a file lock (see snapshot_store.locked_refresh),
+and a worker waiting on it loads the snapshots the refreshing worker saved
+rather than querying the databases again.
+"""
+
+import gc
+import os
+
+# Load the app and the data store in the master, before forking the workers.
+# PRELOAD_APP tells the app so (see config.py); it overrides LAZY_DATA_STORE
+# and must be set before config is imported
+preload_app = True
+os.environ["PRELOAD_APP"] = "true"
+
+from config import Config
+
+bind = f"0.0.0.0:{Config.PORT}"
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+
+# Workers boot quickly once the data is loaded; refreshes run in the background
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+
+
+def when_ready(server):
+    # Move the loaded objects out of the garbage collector's generations, so
+    # collections in the workers do not write to (and copy) the shared pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from db import analytic_db_engine, main_db_engine
+
+    # Connections opened by the master must not be shared with the workers
+    analytic_db_engine.dispose(close=False)
+    main_db_engine.dispose(close=False)
+
+    if os.getenv("AUTO_REFRESH", "true").lower() == "true":
+        from refresh_jobs import start_scheduler
+
+        start_scheduler()
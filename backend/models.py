@@ -51,6 +51,7 @@ class AdminComment(Base):
     # Indexes
     __table_args__ = (
         Index("idx_admin_comment_user_id", user_id),
+        Index("idx_admin_comment_user_id_created_at", user_id, created_at),
         Index("idx_admin_comment_author_id", author_id),
         Index("idx_admin_comment_mood", mood),
     )
@@ -58,8 +59,8 @@ class AdminComment(Base):
     def __repr__(self):
         return f"<AdminComment {self.id} by author {self.author_id} on user {self.user_id}>"
 
-    def to_dict(self):
-        return {
+    def to_dict(self, include_author=False):
+        comment = {
             "id": self.id,
             "user_id": self.user_id,
             "author_id": self.author_id,
@@ -68,3 +69,7 @@ class AdminComment(Base):
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
         }
+        if include_author:
+            # Load authors with the comments (joinedload) to avoid a query each
+            comment["author"] = self.author.to_dict() if self.author else None
+        return comment
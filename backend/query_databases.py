@@ -1,63 +1,121 @@
 import os
+import time
+import threading
 import pandas as pd
 import glob
-from datetime import datetime
-from db import execute_query
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from db import execute_query, copy_query, analytic_db_engine, main_db_engine
+from snapshot_store import (
+    read_snapshot,
+    write_snapshot,
+    get_snapshot_entry,
+    get_retired_snapshot,
+    remove_snapshot_entry,
+    SNAPSHOT_EXTENSIONS,
+)
 
 # Ensure the data directory exists
 os.makedirs("data", exist_ok=True)
 
-# Dictionary of queries to run
+# Dictionary of queries to run; refresh_interval is the number of seconds after
+# which cached data is considered stale and refreshed in the background.
+# Append-only sources can define "incremental": a refresh then only fetches rows
+# whose watermark column is at or after the cached maximum minus the overlap,
+# and merges them into the cached data. Large results can set
+# "extractor": "copy" to fetch them in bulk with COPY ... TO STDOUT.
 analytics_to_run = {
     "users": {
         "query": "SELECT * FROM user_subscription_profile",
         "is_analytics": False,
         "name": "users",
+        "refresh_interval": 10 * 60,
+        "extractor": "copy",
     },
     "dau": {
         "query": "SELECT * FROM dau_users",
         "is_analytics": True,
         "name": "analytics_dau_users",
+        "refresh_interval": 60 * 60,
+        "extractor": "copy",
+        "incremental": {
+            "column": "date",
+            "query": "SELECT * FROM dau_users WHERE date >= :watermark",
+            "overlap": timedelta(days=2),
+        },
     },
     "retention": {
         "query": "SELECT * FROM daily_retention_rates",
         "is_analytics": True,
         "name": "retention",
+        "refresh_interval": 60 * 60,
     },
 }
 
 
+# Also write a CSV copy of every query result (CSV can be exported on demand
+# with export_csv instead)
+EXPORT_CSV = os.getenv("EXPORT_CSV", "false").lower() == "true"
+
+# Limit concurrent queries per database to the size of its connection pool
+_engine_pool_sizes = {
+    True: analytic_db_engine.pool.size(),
+    False: main_db_engine.pool.size(),
+}
+_engine_slots = {
+    is_analytics: threading.BoundedSemaphore(size)
+    for is_analytics, size in _engine_pool_sizes.items()
+}
+
+
+def find_snapshot_files(query_name):
+    """
+    Find every saved snapshot file for a specific query name, in any format
+
+    Args:
+        query_name: The base name of the query files
+
+    Returns:
+        List of snapshot file paths
+    """
+    return [
+        file
+        for extension in SNAPSHOT_EXTENSIONS
+        for file in glob.glob(f"data/{query_name}_*{extension}")
+    ]
+
+
 def delete_old_query_files(query_name, keep_latest=True):
     """
     Delete old query files for a specific query name
 
+    The current snapshot recorded in the manifest and the one it replaced are
+    kept; any other snapshot or CSV file for the query name (e.g. left over
+    from before the manifest) is deleted.
+
     Args:
         query_name: The base name of the query files
-        keep_latest: Whether to keep the most recent file (default: True)
+        keep_latest: Whether to keep the current snapshot (default: True)
     """
-    pattern = f"data/{query_name}_*.pkl"
-    files = glob.glob(pattern)
-
-    if not files:
-        print(f"No files found for pattern: {pattern}")
+    entry = get_snapshot_entry(query_name)
+    keep = set()
+    if keep_latest and entry:
+        # The snapshot the current one replaced may still be opened by
+        # another process, see write_snapshot
+        for path in (entry["path"], get_retired_snapshot(query_name)):
+            if path:
+                keep.add(os.path.abspath(path))
+                keep.add(os.path.abspath(f"{os.path.splitext(path)[0]}.csv"))
+    elif not keep_latest:
+        remove_snapshot_entry(query_name)
+
+    files = find_snapshot_files(query_name) + glob.glob(f"data/{query_name}_*.csv")
+    files_to_delete = [f for f in files if os.path.abspath(f) not in keep]
+
+    if not files_to_delete:
+        print(f"No old files found for query: {query_name}")
         return
 
-    # Also find matching CSV files
-    csv_files = []
-    for f in files:
-        csv_path = f.replace(".pkl", ".csv")
-        if os.path.exists(csv_path):
-            csv_files.append(csv_path)
-
-    if keep_latest and len(files) > 1:
-        # Sort files by modification time (most recent first)
-        files.sort(key=os.path.getmtime, reverse=True)
-        # Keep the most recent file
-        files_to_delete = files[1:]
-    else:
-        files_to_delete = [] if keep_latest else files
-
-    # Delete pickle files
     for file in files_to_delete:
         if os.path.exists(file):  # Check if file exists before attempting to delete
             try:
@@ -68,39 +126,56 @@ def delete_old_query_files(query_name, keep_latest=True):
         else:
             print(f"File not found, skipping: {file}")
 
-    # Delete CSV files
-    if keep_latest and len(csv_files) > 1:
-        # Sort CSV files by modification time of corresponding pkl files
-        csv_files.sort(
-            key=lambda x: os.path.getmtime(
-                x.replace(".csv", ".pkl")
-                if os.path.exists(x.replace(".csv", ".pkl"))
-                else 0
-            ),
-            reverse=True,
-        )
-        # Keep the most recent file
-        csv_files_to_delete = csv_files[1:]
-    else:
-        csv_files_to_delete = [] if keep_latest else csv_files
 
-    for file in csv_files_to_delete:
-        if os.path.exists(file):  # Check if file exists before attempting to delete
-            try:
-                os.remove(file)
-                print(f"Deleted old file: {file}")
-            except Exception as e:
-                print(f"Error deleting {file}: {e}")
-        else:
-            print(f"File not found, skipping: {file}")
+def fetch_query(query_info, query, params=None):
+    """
+    Fetch the rows of a query with the extractor configured for its entry
+
+    Args:
+        query_info: The analytics_to_run entry the query belongs to
+        query: SQL query string
+        params: Optional query parameters
+
+    Returns:
+        DataFrame with the query results
+    """
+    is_analytics_db = query_info["is_analytics"]
+    if query_info.get("extractor") == "copy":
+        return copy_query(query, params=params, is_analytics_db=is_analytics_db)
+    return execute_query(query, params=params, is_analytics_db=is_analytics_db)
+
+
+def merge_incremental(base_df, new_df, column, watermark):
+    """
+    Merge rows fetched from a watermark into previously cached data.
+
+    Rows of base_df at or after the watermark are replaced by new_df.
+
+    Args:
+        base_df: Previously cached DataFrame
+        new_df: Rows fetched with the incremental query
+        column: Watermark column
+        watermark: Lowest watermark value fetched by the incremental query
 
+    Returns:
+        The merged DataFrame, sorted by the watermark column
+    """
+    kept = base_df[base_df[column] < watermark]
+    if new_df.empty:
+        return kept.reset_index(drop=True)
+    merged = pd.concat([kept, new_df], ignore_index=True)
+    return merged.sort_values(column, kind="stable").reset_index(drop=True)
 
-def run_query(query_id):
+
+def run_query(query_id, base_df=None):
     """
     Run a specific query from the analytics_to_run dictionary
 
     Args:
         query_id: The key in analytics_to_run dictionary
+        base_df: Previously cached data; for queries with an "incremental"
+            definition only the rows after its watermark are fetched and
+            merged into it
 
     Returns:
         Dict with information about saved files
@@ -113,59 +188,79 @@ def run_query(query_id):
     query_string = query_info["query"]
     is_analytics_db = query_info["is_analytics"]
     name = query_info["name"]
-
-    # Generate timestamp
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    file_name = f"{name}_{timestamp}"
+    incremental = query_info.get("incremental")
 
     # Run query
     db_type = "analytics" if is_analytics_db else "main"
-    print(f"Querying {db_type} database: {query_id}")
-    df = execute_query(query_string, is_analytics_db=is_analytics_db)
-
-    # Save results
-    pkl_file = f"data/{file_name}.pkl"
-    csv_file = f"data/{file_name}.csv"
+    if (
+        incremental
+        and base_df is not None
+        and not base_df.empty
+        and incremental["column"] in base_df.columns
+    ):
+        column = incremental["column"]
+        watermark = base_df[column].max() - incremental.get("overlap", timedelta(0))
+        print(f"Querying {db_type} database: {query_id} ({column} >= {watermark})")
+        new_df = fetch_query(
+            query_info, incremental["query"], params={"watermark": watermark}
+        )
+        print(f"Fetched {len(new_df)} new rows for '{query_id}'")
+        df = merge_incremental(base_df, new_df, column, watermark)
+    else:
+        print(f"Querying {db_type} database: {query_id}")
+        df = fetch_query(query_info, query_string)
 
-    df.to_pickle(pkl_file)
-    df.to_csv(csv_file, index=False)
+    # Save results; the snapshot it replaces is deleted once it is recorded
+    migrating = get_snapshot_entry(name) is None
+    entry = write_snapshot(df, name)
+    snapshot_file = entry["path"]
 
-    print(f"Query results saved to {pkl_file} and {csv_file}")
+    # Files saved before the manifest existed are cleaned up once
+    if migrating:
+        try:
+            delete_old_query_files(name)
+        except Exception as e:
+            print(f"Warning: Could not delete old files: {e}")
+    file_name = os.path.splitext(os.path.basename(snapshot_file))[0]
+    print(f"Query results saved to {snapshot_file}")
 
-    # Now delete old query files AFTER saving the new one
-    try:
-        delete_old_files_except_latest(name, pkl_file, csv_file)
-    except Exception as e:
-        print(f"Warning: Could not delete old files: {e}")
+    csv_file = None
+    if EXPORT_CSV:
+        csv_file = f"data/{file_name}.csv"
+        df.to_csv(csv_file, index=False)
+        print(f"Query results exported to {csv_file}")
 
     return {
         "query_id": query_id,
         "file_name": file_name,
-        "pkl_file": pkl_file,
+        "snapshot_file": snapshot_file,
         "csv_file": csv_file,
         "dataframe": df,
     }
 
 
-def delete_old_files_except_latest(query_name, latest_pkl=None, latest_csv=None):
+def delete_old_files_except_latest(
+    query_name, latest_snapshot=None, latest_csv=None
+):
     """
     Delete all query files for a specific query name, except the specified latest files
 
     Args:
         query_name: The base name of the query files
-        latest_pkl: The path to the latest pkl file to keep
+        latest_snapshot: The path to the latest snapshot file to keep
         latest_csv: The path to the latest csv file to keep
     """
-    pattern = f"data/{query_name}_*.pkl"
-    files = glob.glob(pattern)
+    files = find_snapshot_files(query_name)
 
     if not files:
-        print(f"No files found to delete for pattern: {pattern}")
+        print(f"No files found to delete for query: {query_name}")
         return
 
-    # Delete all pkl files except the latest
+    # Delete all snapshot files except the latest
     for file in files:
-        if latest_pkl and os.path.abspath(file) == os.path.abspath(latest_pkl):
+        if latest_snapshot and os.path.abspath(file) == os.path.abspath(
+            latest_snapshot
+        ):
             continue  # Skip the latest file
 
         if os.path.exists(file):
@@ -193,23 +288,94 @@ def delete_old_files_except_latest(query_name, latest_pkl=None, latest_csv=None)
     print(f"Cleaned up old files for query: {query_name}")
 
 
-def run_all_queries():
+def run_timed_query(query_id, on_progress=None, base_df=None):
+    """
+    Run a specific query, recording how long it took and any error raised.
+
+    Waits for a free slot on the query's database so that concurrent
+    refreshes never need more connections than the engine's pool holds.
+
+    Args:
+        query_id: The key in analytics_to_run dictionary
+        on_progress: Optional callback called as on_progress(query_id, status,
+            result) when the query starts ('running') and when it ends
+            ('completed' or 'failed')
+        base_df: Previously cached data, see run_query
+
+    Returns:
+        Dict with information about saved files, plus `elapsed_seconds` and
+        `error` (None on success, in which case `dataframe` is set)
+    """
+    start = time.perf_counter()
+    is_analytics_db = analytics_to_run.get(query_id, {}).get("is_analytics", True)
+
+    try:
+        with _engine_slots[is_analytics_db]:
+            if on_progress:
+                on_progress(query_id, "running", None)
+            result = run_query(query_id, base_df)
+        error = None if result else f"Query ID '{query_id}' could not be run"
+    except Exception as e:
+        print(f"Error running query '{query_id}': {e}")
+        result, error = None, str(e)
+
+    elapsed = time.perf_counter() - start
+    print(f"Query '{query_id}' finished in {elapsed:.2f}s")
+    timed_result = {
+        **(result or {"query_id": query_id}),
+        "elapsed_seconds": elapsed,
+        "error": error,
+    }
+    if on_progress:
+        on_progress(query_id, "failed" if error else "completed", timed_result)
+    return timed_result
+
+
+def run_all_queries(query_ids=None, on_progress=None, base_frames=None):
     """
-    Run all queries defined in analytics_to_run dictionary
+    Run all queries defined in analytics_to_run dictionary concurrently
+
+    Queries against the analytics and main databases run in parallel, each
+    database bounded by its connection pool size. A failing query is
+    reported in its result and does not stop the others.
+
+    Args:
+        query_ids: Queries to run (default: every query in analytics_to_run)
+        on_progress: Optional per-query progress callback, see run_timed_query
+        base_frames: Previously cached data by query ID, used by incremental
+            queries (see run_query)
 
     Returns:
         Dict of query IDs mapping to their results
     """
-    results = {}
-
-    for query_id in analytics_to_run:
-        print(f"\nExecuting query: {query_id}")
-        results[query_id] = run_query(query_id)
+    query_ids = list(query_ids if query_ids is not None else analytics_to_run)
+    base_frames = base_frames or {}
+    if not query_ids:
+        return {}
+
+    with ThreadPoolExecutor(
+        max_workers=min(sum(_engine_pool_sizes.values()), len(query_ids)),
+        thread_name_prefix="query",
+    ) as executor:
+        print(f"\nExecuting queries: {', '.join(query_ids)}")
+        results = dict(
+            zip(
+                query_ids,
+                executor.map(
+                    lambda query_id: run_timed_query(
+                        query_id, on_progress, base_frames.get(query_id)
+                    ),
+                    query_ids,
+                ),
+            )
+        )
 
     return results
 
 
-def add_query(query_id, query_string, is_analytics=True, name=None):
+def add_query(
+    query_id, query_string, is_analytics=True, name=None, refresh_interval=None
+):
     """
     Add a new query to the analytics_to_run dictionary
 
@@ -218,6 +384,8 @@ def add_query(query_id, query_string, is_analytics=True, name=None):
         query_string: SQL query to execute
         is_analytics: Whether to run on analytics DB (True) or main DB (False)
         name: Base name for saved files (defaults to query_id)
+        refresh_interval: Seconds before cached data is refreshed in the
+            background (default: never)
     """
     if name is None:
         name = query_id
@@ -226,6 +394,7 @@ def add_query(query_id, query_string, is_analytics=True, name=None):
         "query": query_string,
         "is_analytics": is_analytics,
         "name": name,
+        "refresh_interval": refresh_interval,
     }
 
     print(f"Added query '{query_id}' to analytics_to_run dictionary")
@@ -254,65 +423,124 @@ def clean_all_query_files(keep_latest=True):
     print("Cleaned up old query files")
 
 
-def load_saved_data(file_path):
+def load_saved_data(file_path, columns=None):
     """
     Load previously saved query results
 
     Args:
-        file_path: Path to the saved pickle file
+        file_path: Path to the saved snapshot file, with or without extension
+        columns: Only load these columns (default: all)
 
     Returns:
         DataFrame with the loaded data or None if file doesn't exist
     """
-    pkl_file = file_path if file_path.endswith(".pkl") else f"{file_path}.pkl"
-
-    if os.path.exists(pkl_file):
-        df = pd.read_pickle(pkl_file)
-        print(f"Loaded data from {pkl_file}")
-        return df
+    if os.path.splitext(file_path)[1] in SNAPSHOT_EXTENSIONS:
+        candidates = [file_path]
     else:
-        print(f"File not found: {pkl_file}")
-        return None
+        candidates = [f"{file_path}{extension}" for extension in SNAPSHOT_EXTENSIONS]
 
+    for snapshot_file in candidates:
+        if os.path.exists(snapshot_file):
+            df = read_snapshot(snapshot_file, columns)
+            print(f"Loaded data from {snapshot_file}")
+            return df
 
-def load_latest(query_id):
+    print(f"File not found: {file_path}")
+    return None
+
+
+def find_latest_file(query_id):
     """
-    Load the most recent data for a given query ID without running the query again.
+    Find the most recent saved snapshot file for a given query ID.
+
+    The snapshot is looked up in the manifest; the data directory is only
+    scanned for queries saved before the manifest existed.
 
     Args:
         query_id: The key in analytics_to_run dictionary
 
     Returns:
-        DataFrame with the loaded data or None if no files found
+        Path of the latest file or None if no files found
     """
     if query_id not in analytics_to_run:
         print(f"Query ID '{query_id}' not found in analytics_to_run dictionary")
         return None
 
     name = analytics_to_run[query_id]["name"]
-    # Find all files matching the pattern
-    pattern = f"data/{name}_*.pkl"
-    files = glob.glob(pattern)
+    entry = get_snapshot_entry(name)
+    if entry:
+        if os.path.exists(entry["path"]):
+            return entry["path"]
+        print(f"Snapshot in manifest not found: {entry['path']}")
 
-    if not files:
-        print(f"No saved data found for query '{query_id}' (pattern: {pattern})")
-        return None
+    # Fall back to scanning for snapshots saved before the manifest
+    files = find_snapshot_files(name)
 
-    # Sort files by modification time (most recent first)
-    files = [f for f in files if os.path.exists(f)]
     if not files:
-        print(f"No accessible files found for query '{query_id}'")
+        print(f"No saved data found for query '{query_id}'")
         return None
 
-    latest_file = max(files, key=os.path.getmtime)
+    return max(files, key=os.path.getmtime)
+
+
+def latest_snapshot_time(query_id):
+    """
+    Get when the most recent saved data for a given query ID was written.
+
+    Args:
+        query_id: The key in analytics_to_run dictionary
+
+    Returns:
+        POSIX timestamp of the latest snapshot or None if no files found
+    """
+    name = analytics_to_run.get(query_id, {}).get("name")
+    entry = get_snapshot_entry(name) if name else None
+    if entry and os.path.exists(entry["path"]):
+        return entry["created_at"]
+
+    latest_file = find_latest_file(query_id)
+    return os.path.getmtime(latest_file) if latest_file else None
+
+
+def load_latest(query_id, columns=None):
+    """
+    Load the most recent data for a given query ID without running the query again.
+
+    Args:
+        query_id: The key in analytics_to_run dictionary
+        columns: Only load these columns (default: all)
 
-    if not os.path.exists(latest_file):
-        print(f"Latest file not found: {latest_file}")
+    Returns:
+        DataFrame with the loaded data or None if no files found
+    """
+    latest_file = find_latest_file(query_id)
+    if latest_file is None:
         return None
 
     print(f"Loading most recent data for '{query_id}' from {latest_file}")
 
-    return load_saved_data(latest_file)
+    return load_saved_data(latest_file, columns)
+
+
+def export_csv(query_id, csv_file=None):
+    """
+    Export the most recent saved data for a given query ID to CSV.
+
+    Args:
+        query_id: The key in analytics_to_run dictionary
+        csv_file: Destination path (default: next to the snapshot file)
+
+    Returns:
+        Path of the CSV file or None if no saved data was found
+    """
+    latest_file = find_latest_file(query_id)
+    if latest_file is None:
+        return None
+
+    csv_file = csv_file or f"{os.path.splitext(latest_file)[0]}.csv"
+    read_snapshot(latest_file).to_csv(csv_file, index=False)
+    print(f"Exported '{query_id}' to {csv_file}")
+    return csv_file
 
 
 if __name__ == "__main__":
@@ -322,11 +550,10 @@ if __name__ == "__main__":
         try:
             name = query_info["name"]
             print(f"Checking for old files for {query_id}...")
-            pattern = f"data/{name}_*.pkl"
-            files = glob.glob(pattern)
+            files = find_snapshot_files(name)
             if len(files) > 1:  # Only clean if there are multiple files
                 print(f"Found {len(files)} files for {query_id}, cleaning up...")
-                delete_old_files_except_latest(name)
+                delete_old_query_files(name)
         except Exception as e:
             print(f"Error cleaning up files for {query_id}: {e}")
 
@@ -0,0 +1,217 @@
+"""
+Module for running data store refreshes as background jobs.
+Concurrent refresh requests are merged into the job already running, and a
+scheduler refreshes each query in the background once its data is stale.
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from data_store import refresh_all_data, is_stale, sync_snapshots
+from query_databases import analytics_to_run
+
+# Number of finished jobs kept around for status lookups
+MAX_FINISHED_JOBS = 20
+
+# Seconds between two scheduled refresh attempts of the same query, so a
+# failing query is not retried on every request
+STALE_RETRY_DELAY = 60
+
+# Seconds between two scheduler checks for stale data
+SCHEDULER_INTERVAL = 30
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class RefreshJob:
+    """A refresh of some or all queries in analytics_to_run, run on its own thread."""
+
+    def __init__(
+        self, query_ids: Optional[List[str]] = None, fresh_since: Optional[float] = None
+    ):
+        self.id = uuid.uuid4().hex
+        self.query_ids = list(query_ids if query_ids is not None else analytics_to_run)
+        # Snapshots another process saved since then are loaded instead of
+        # running their queries again, see data_store.refresh_all_data
+        self.fresh_since = fresh_since
+        self.status = "pending"
+        self.created_at = _now()
+        self.finished_at: Optional[str] = None
+        self.error: Optional[str] = None
+        self.queries: Dict[str, Dict[str, Any]] = {
+            query_id: {"status": "pending", "elapsed_seconds": None, "error": None}
+            for query_id in self.query_ids
+        }
+        self._lock = threading.Lock()
+
+    @property
+    def is_active(self) -> bool:
+        with self._lock:
+            return self.status in ("pending", "running")
+
+    def on_progress(self, query_id, status, result):
+        """Record the progress of one query, see query_databases.run_timed_query."""
+        with self._lock:
+            query = self.queries.setdefault(query_id, {})
+            query["status"] = status
+            if result is not None:
+                query["elapsed_seconds"] = result.get("elapsed_seconds")
+                query["error"] = result.get("error")
+
+    def _finish(self, status: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            self.status = status
+            self.error = error
+            self.finished_at = _now()
+
+    def run(self):
+        with self._lock:
+            self.status = "running"
+        try:
+            refresh_all_data(
+                on_progress=self.on_progress,
+                query_ids=self.query_ids,
+                fresh_since=self.fresh_since,
+            )
+        except Exception as e:
+            print(f"Refresh job {self.id} failed: {e}")
+            self._finish("failed", str(e))
+            return
+
+        with self._lock:
+            failed = [
+                query_id
+                for query_id, info in self.queries.items()
+                if info["status"] == "failed"
+            ]
+        if failed:
+            self._finish("failed", f"Queries failed: {', '.join(failed)}")
+        else:
+            self._finish("completed")
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+                "error": self.error,
+                "queries": {query_id: dict(info) for query_id, info in self.queries.items()},
+            }
+
+
+# Jobs by ID, oldest first
+_jobs: "OrderedDict[str, RefreshJob]" = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+def start_refresh_job(
+    query_ids: Optional[List[str]] = None, force: bool = True
+) -> RefreshJob:
+    """
+    Start a background refresh, or join one already in progress that covers
+    the same queries.
+
+    Args:
+        query_ids: Queries to refresh (default: every query in analytics_to_run)
+        force: Only reuse data another process fetched after this call; when
+            False, any snapshot that is not stale yet is reused
+
+    Returns:
+        The running RefreshJob
+    """
+    requested = set(query_ids if query_ids is not None else analytics_to_run)
+    with _jobs_lock:
+        for job in reversed(_jobs.values()):
+            if job.is_active and requested <= set(job.query_ids):
+                return job
+
+        job = RefreshJob(sorted(requested), time.time() if force else None)
+        _jobs[job.id] = job
+        finished = [job_id for job_id, j in _jobs.items() if not j.is_active]
+        for job_id in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del _jobs[job_id]
+
+        threading.Thread(
+            target=job.run, name=f"refresh-{job.id[:8]}", daemon=True
+        ).start()
+        return job
+
+
+# When each query was last scheduled for a stale refresh
+_last_scheduled: Dict[str, float] = {}
+
+
+def refresh_stale_data() -> Optional[RefreshJob]:
+    """
+    Start a background refresh of every query whose data is stale.
+
+    The caller keeps serving the cached data (stale-while-revalidate); a
+    query is scheduled at most once every STALE_RETRY_DELAY seconds. Data
+    another process has refreshed meanwhile is loaded first, so it is not
+    queried again.
+
+    Returns:
+        The refresh job, or None if nothing is stale
+    """
+    sync_snapshots()
+
+    now = time.time()
+    with _jobs_lock:
+        stale = [
+            query_id
+            for query_id in analytics_to_run
+            if is_stale(query_id)
+            and now - _last_scheduled.get(query_id, 0) >= STALE_RETRY_DELAY
+        ]
+        for query_id in stale:
+            _last_scheduled[query_id] = now
+
+    if not stale:
+        return None
+    print(f"Data is stale, refreshing in the background: {', '.join(stale)}")
+    return start_refresh_job(stale, force=False)
+
+
+_scheduler_thread: Optional[threading.Thread] = None
+
+
+def start_scheduler(interval: float = SCHEDULER_INTERVAL) -> threading.Thread:
+    """
+    Start a daemon thread that refreshes stale data every `interval` seconds,
+    so requests never have to wait on a query.
+
+    Args:
+        interval: Seconds between two checks
+
+    Returns:
+        The scheduler thread (the existing one if already started)
+    """
+    global _scheduler_thread
+
+    def run():
+        while True:
+            try:
+                refresh_stale_data()
+            except Exception as e:
+                print(f"Scheduled refresh failed: {e}")
+            time.sleep(interval)
+
+    with _jobs_lock:
+        if _scheduler_thread is None or not _scheduler_thread.is_alive():
+            _scheduler_thread = threading.Thread(
+                target=run, name="refresh-scheduler", daemon=True
+            )
+            _scheduler_thread.start()
+        return _scheduler_thread
+
+
+def get_refresh_job(job_id: str) -> Optional[RefreshJob]:
+    """Get a refresh job by ID, or None if it is unknown."""
+    return _jobs.get(job_id)
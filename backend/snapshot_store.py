@@ -0,0 +1,479 @@
+"""
+Module for persisting query results as on-disk snapshots.
+
+Snapshots are written as Parquet when pyarrow is installed: a compact columnar
+file that is memory-mapped on read and can load a subset of its columns.
+Without pyarrow, snapshots fall back to pickle files.
+
+A manifest (data/manifest.json) records the current snapshot of each query, so
+the latest snapshot is found without scanning the data directory. Snapshots
+and the manifest are written to a temporary file and atomically renamed, so a
+half-written file is never picked up.
+"""
+
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+import pandas as pd
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - pyarrow is optional
+    pa = None
+    pq = None
+
+# Parquet schema metadata key listing the columns stored as JSON text
+JSON_COLUMNS_KEY = b"gymii_json_columns"
+
+
+class SnapshotStore(ABC):
+    """Reads and writes DataFrame snapshots in one file format."""
+
+    extension = ""
+
+    @abstractmethod
+    def write(self, df: pd.DataFrame, path: str) -> None:
+        """Write a DataFrame to path."""
+
+    @abstractmethod
+    def read(self, path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Read a snapshot, optionally only some of its columns."""
+
+
+class PickleSnapshotStore(SnapshotStore):
+    """Pickle snapshots; every read loads the whole frame."""
+
+    extension = ".pkl"
+
+    def write(self, df: pd.DataFrame, path: str) -> None:
+        df.to_pickle(path)
+
+    def read(self, path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        df = pd.read_pickle(path)
+        return df[columns] if columns is not None else df
+
+
+class ParquetSnapshotStore(SnapshotStore):
+    """
+    Parquet snapshots, memory-mapped on read with optional column projection.
+
+    Columns of Python lists are stored as native Parquet lists and read back as
+    lists. Object columns of tz-aware datetimes whose UTC offset varies (e.g.
+    across DST) are stored as UTC timestamps. Other object columns that Arrow
+    cannot store natively (dicts, mixed types) are stored as JSON text and
+    decoded on read; a value JSON cannot represent either fails the write.
+    """
+
+    extension = ".parquet"
+
+    def write(self, df: pd.DataFrame, path: str) -> None:
+        df = df.reset_index(drop=True)
+        json_columns = []
+        encoded = {}
+
+        for column in df.columns:
+            if df[column].dtype != object:
+                continue
+            values = df[column]
+            present = values.dropna()
+            if len(present) and present.map(_is_aware_datetime).all():
+                encoded[column] = pd.to_datetime(values, utc=True)
+                continue
+            if not present.map(lambda value: isinstance(value, dict)).any():
+                try:
+                    pa.array(values, from_pandas=True)
+                    continue
+                except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+                    pass
+            json_columns.append(column)
+            try:
+                encoded[column] = values.map(
+                    lambda value: None if value is None else json.dumps(value)
+                )
+            except (TypeError, ValueError) as e:
+                raise ValueError(
+                    f"Cannot store column '{column}' in a Parquet snapshot: {e}"
+                ) from e
+
+        if encoded:
+            df = df.assign(**encoded)
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[JSON_COLUMNS_KEY] = json.dumps(json_columns).encode("utf-8")
+        pq.write_table(table.replace_schema_metadata(metadata), path)
+
+    def read(self, path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        table = pq.read_table(path, columns=columns, memory_map=True)
+        metadata = table.schema.metadata or {}
+        json_columns = set(json.loads(metadata.get(JSON_COLUMNS_KEY, b"[]")))
+
+        # Convert list columns to Python lists rather than numpy arrays
+        list_columns = [
+            field.name
+            for field in table.schema
+            if pa.types.is_list(field.type) or pa.types.is_large_list(field.type)
+        ]
+        df = table.drop_columns(list_columns).to_pandas()
+        for column in list_columns:
+            df[column] = table.column(column).to_pylist()
+        df = df[table.column_names]
+
+        # Fixed UTC offsets come back as pytz offsets; use datetime.timezone,
+        # as the frames read from the database do
+        for field in table.schema:
+            tz = field.type.tz if pa.types.is_timestamp(field.type) else None
+            if tz and tz[0] in "+-":
+                offset = datetime.strptime(tz, "%z").utcoffset()
+                df[field.name] = df[field.name].dt.tz_convert(timezone(offset))
+
+        for column in json_columns.intersection(df.columns):
+            df[column] = df[column].map(
+                lambda value: None if value is None else json.loads(value)
+            )
+        return df
+
+
+def _is_aware_datetime(value: Any) -> bool:
+    return isinstance(value, datetime) and value.tzinfo is not None
+
+
+_stores = {store.extension: store for store in (PickleSnapshotStore(),)}
+if pa is not None:
+    _stores[ParquetSnapshotStore.extension] = ParquetSnapshotStore()
+
+# File extensions of every readable snapshot format
+SNAPSHOT_EXTENSIONS = tuple(_stores)
+
+
+def get_snapshot_store() -> SnapshotStore:
+    """
+    Get the store new snapshots are written with.
+
+    Uses the SNAPSHOT_FORMAT environment variable ('parquet' or 'pickle');
+    defaults to Parquet when pyarrow is installed.
+    """
+    default = "parquet" if pa is not None else "pickle"
+    snapshot_format = os.getenv("SNAPSHOT_FORMAT", default).lower()
+    if snapshot_format == "parquet" and pa is not None:
+        return _stores[ParquetSnapshotStore.extension]
+    return _stores[PickleSnapshotStore.extension]
+
+
+def read_snapshot(path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Read a snapshot written by any store, picked by the file extension.
+
+    Args:
+        path: Path of the snapshot file
+        columns: Only load these columns (default: all)
+
+    Returns:
+        DataFrame with the snapshot data
+    """
+    extension = os.path.splitext(path)[1]
+    if extension not in _stores:
+        raise ValueError(f"Unsupported snapshot format: {path}")
+    return _stores[extension].read(path, columns)
+
+
+# Directory holding snapshots and the manifest
+SNAPSHOT_DIR = "data"
+MANIFEST_FILE = os.path.join(SNAPSHOT_DIR, "manifest.json")
+
+# Held by the process refreshing query data, see locked_refresh
+REFRESH_LOCK_FILE = os.path.join(SNAPSHOT_DIR, "refresh.lock")
+
+# Parsed manifest, reloaded only when the file changes on disk
+_manifest: Dict[str, Any] = {"generation": 0, "snapshots": {}, "retired": {}}
+_manifest_mtime: Optional[int] = None
+_manifest_lock = threading.RLock()
+_refresh_lock = threading.Lock()
+
+
+@contextmanager
+def _locked_manifest():
+    """Hold the manifest lock across threads and, where supported, processes."""
+    with _manifest_lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        with open(f"{MANIFEST_FILE}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@contextmanager
+def locked_refresh():
+    """
+    Hold the refresh lock, so one process at a time queries the databases.
+
+    Blocks while another thread or, where supported, another process sharing
+    the data directory (e.g. a gunicorn worker) is refreshing.
+    """
+    with _refresh_lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        with open(REFRESH_LOCK_FILE, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def load_manifest() -> Dict[str, Any]:
+    """
+    Get the snapshot manifest.
+
+    The file is only parsed again when its modification time has changed.
+    The returned dictionary is shared and must not be modified.
+
+    Returns:
+        Dict with the manifest `generation` (bumped on every update) and the
+        current `snapshots` entry of each query name
+    """
+    global _manifest, _manifest_mtime
+
+    try:
+        mtime = os.stat(MANIFEST_FILE).st_mtime_ns
+    except FileNotFoundError:
+        return _manifest
+
+    with _manifest_lock:
+        if mtime != _manifest_mtime:
+            with open(MANIFEST_FILE, "r") as f:
+                _manifest = json.load(f)
+            _manifest_mtime = mtime
+        return _manifest
+
+
+def _save_manifest(manifest: Dict[str, Any]) -> None:
+    global _manifest, _manifest_mtime
+
+    tmp_file = f"{MANIFEST_FILE}.{os.getpid()}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, MANIFEST_FILE)
+
+    _manifest = manifest
+    _manifest_mtime = os.stat(MANIFEST_FILE).st_mtime_ns
+
+
+def get_snapshot_entry(name: str) -> Optional[Dict[str, Any]]:
+    """
+    Get the manifest entry of the current snapshot for a query name.
+
+    Args:
+        name: The base name of the query files
+
+    Returns:
+        Dict with `path`, `format`, `rows`, `schema_hash`, `checksum` and
+        `created_at` (POSIX timestamp), or None if no snapshot is recorded
+    """
+    return load_manifest()["snapshots"].get(name)
+
+
+def schema_hash(df: pd.DataFrame) -> str:
+    """Hash the column names and dtypes of a DataFrame."""
+    schema = [[str(column), str(dtype)] for column, dtype in df.dtypes.items()]
+    return hashlib.sha1(json.dumps(schema).encode("utf-8")).hexdigest()
+
+
+def file_checksum(path: str) -> str:
+    """Compute the SHA-256 checksum of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SnapshotChecksumError(ValueError):
+    """A snapshot file does not match the checksum recorded in the manifest."""
+
+
+def verify_snapshot(entry: Dict[str, Any]) -> bool:
+    """Check that a snapshot file still matches the checksum in its manifest entry."""
+    try:
+        return file_checksum(entry["path"]) == entry["checksum"]
+    except FileNotFoundError:
+        return False
+
+
+def read_snapshot_entry(
+    entry: Dict[str, Any], columns: Optional[List[str]] = None
+) -> pd.DataFrame:
+    """
+    Read the snapshot of a manifest entry, after checking its checksum.
+
+    Args:
+        entry: The manifest entry, see get_snapshot_entry
+        columns: Only load these columns (default: all)
+
+    Returns:
+        DataFrame with the snapshot data
+
+    Raises:
+        FileNotFoundError: If the snapshot file no longer exists
+        SnapshotChecksumError: If the file does not match its checksum
+    """
+    if file_checksum(entry["path"]) != entry["checksum"]:
+        raise SnapshotChecksumError(
+            f"Snapshot {entry['path']} does not match its manifest checksum"
+        )
+    return read_snapshot(entry["path"], columns)
+
+
+# Times the current snapshot is looked up again when its file disappeared
+# between reading the manifest and opening the file
+SNAPSHOT_READ_ATTEMPTS = 3
+
+
+def load_current_snapshot(name: str, columns: Optional[List[str]] = None) -> tuple:
+    """
+    Read the current snapshot of a query name, checked against its checksum.
+
+    Args:
+        name: The base name of the query files
+        columns: Only load these columns (default: all)
+
+    Returns:
+        Tuple (DataFrame, manifest entry), or (None, None) if no snapshot is
+        recorded
+
+    Raises:
+        FileNotFoundError: If the recorded snapshot file no longer exists
+        SnapshotChecksumError: If the file does not match its checksum
+    """
+    for attempt in range(SNAPSHOT_READ_ATTEMPTS):
+        entry = get_snapshot_entry(name)
+        if entry is None:
+            return None, None
+        try:
+            return read_snapshot_entry(entry, columns), entry
+        except FileNotFoundError:
+            # Replaced by a newer snapshot meanwhile: read the manifest again
+            last_attempt = attempt == SNAPSHOT_READ_ATTEMPTS - 1
+            if last_attempt or get_snapshot_entry(name) == entry:
+                raise
+
+
+def _remove_snapshot_files(path: str) -> None:
+    """Delete a snapshot and the CSV exported next to it, if any."""
+    for file in (path, f"{os.path.splitext(path)[0]}.csv"):
+        if os.path.exists(file):
+            try:
+                os.remove(file)
+                print(f"Deleted old file: {file}")
+            except Exception as e:
+                print(f"Error deleting {file}: {e}")
+
+
+def get_retired_snapshot(name: str) -> Optional[str]:
+    """
+    Get the snapshot the current one replaced, kept until the next write.
+
+    Args:
+        name: The base name of the query files
+
+    Returns:
+        Path of the previous snapshot file, or None
+    """
+    return load_manifest().get("retired", {}).get(name)
+
+
+def write_snapshot(df: pd.DataFrame, name: str) -> Dict[str, Any]:
+    """
+    Save a query result as the current snapshot for a query name.
+
+    The snapshot is written to a temporary file, renamed into place and then
+    recorded in the manifest. The snapshot it replaces is kept until the next
+    write, so a process that has just looked it up can still open it; the one
+    before that is deleted.
+
+    Args:
+        df: The query result
+        name: The base name of the query files
+
+    Returns:
+        The new manifest entry, see get_snapshot_entry
+    """
+    store = get_snapshot_store()
+    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S-%f")
+    path = os.path.join(SNAPSHOT_DIR, f"{name}_{timestamp}{store.extension}")
+    tmp_path = f"{path}.tmp"
+
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    try:
+        store.write(df, tmp_path)
+        checksum = file_checksum(tmp_path)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    entry = {
+        "path": path,
+        "format": store.extension.lstrip("."),
+        "rows": len(df),
+        "schema_hash": schema_hash(df),
+        "checksum": checksum,
+        "created_at": time.time(),
+    }
+
+    with _locked_manifest():
+        manifest = copy.deepcopy(load_manifest())
+        previous = manifest["snapshots"].get(name)
+        retired = manifest.setdefault("retired", {})
+        expired = retired.pop(name, None)
+        if previous and previous["path"] != path:
+            retired[name] = previous["path"]
+        manifest["snapshots"][name] = entry
+        manifest["generation"] = manifest.get("generation", 0) + 1
+        _save_manifest(manifest)
+
+    if expired and expired not in (path, retired.get(name)):
+        _remove_snapshot_files(expired)
+    return entry
+
+
+def remove_snapshot_entry(name: str) -> Optional[Dict[str, Any]]:
+    """
+    Forget the current snapshot of a query name (its files are not deleted).
+
+    Args:
+        name: The base name of the query files
+
+    Returns:
+        The removed manifest entry, or None if there was none
+    """
+    with _locked_manifest():
+        manifest = copy.deepcopy(load_manifest())
+        entry = manifest["snapshots"].pop(name, None)
+        if entry is not None:
+            manifest["generation"] = manifest.get("generation", 0) + 1
+            _save_manifest(manifest)
+    return entry
@@ -0,0 +1,15 @@
+import os
+import sys
+import tempfile
+
+# Run the tests from the backend directory's modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# db creates its engines at import; they only connect when used
+os.environ.setdefault(
+    "ANALYTIC_DB_CONNECTION_STRING", "postgresql://localhost/analytics"
+)
+os.environ.setdefault("MAIN_DB_CONNECTION_STRING", "postgresql://localhost/main")
+
+# Snapshots and the manifest live in ./data; keep them out of the source tree
+os.chdir(tempfile.mkdtemp(prefix="gymii-tests-"))
@@ -0,0 +1,148 @@
+"""
+Admin authentication and the cache of verified tokens.
+"""
+
+import time
+import jwt
+import pytest
+from flask import Flask, g, jsonify
+import auth
+
+SECRET = "test-secret-test-secret-test-secret-0123"
+ADMIN = "admin@example.com"
+
+
+def make_token(email=ADMIN, expires_in=3600, secret=SECRET):
+    payload = {"aud": "authenticated", "email": email}
+    if expires_in is not None:
+        payload["exp"] = int(time.time()) + expires_in
+    return jwt.encode(payload, secret, algorithm="HS256")
+
+
+@pytest.fixture(autouse=True)
+def setup(monkeypatch):
+    monkeypatch.setattr(auth, "_jwt_secret", SECRET)
+    monkeypatch.setattr(auth, "ADMIN_EMAILS", frozenset([ADMIN]))
+    auth.clear_token_cache()
+    yield
+    auth.clear_token_cache()
+
+
+@pytest.fixture
+def decodes(monkeypatch):
+    """Count the tokens verified with jwt.decode."""
+    calls = []
+    decode = jwt.decode
+
+    def counting_decode(token, *args, **kwargs):
+        calls.append(token)
+        return decode(token, *args, **kwargs)
+
+    monkeypatch.setattr(auth.jwt, "decode", counting_decode)
+    return calls
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+
+    @app.route("/private")
+    @auth.admin_required
+    def private():
+        return jsonify({"admin": g.admin_email})
+
+    return app.test_client()
+
+
+def get(client, token):
+    return client.get("/private", headers={"Authorization": f"Bearer {token}"})
+
+
+def test_cache_hit(decodes):
+    token = make_token()
+    assert auth.verify_token(token, SECRET) == ADMIN
+    assert auth.verify_token(token, SECRET) == ADMIN
+    assert len(decodes) == 1
+
+    # Another token is verified on its own
+    assert auth.verify_token(make_token(expires_in=60), SECRET) == ADMIN
+    assert len(decodes) == 2
+
+
+def test_token_without_exp_is_not_cached(decodes):
+    token = make_token(expires_in=None)
+    auth.verify_token(token, SECRET)
+    auth.verify_token(token, SECRET)
+    assert len(decodes) == 2
+
+
+def test_expired_entry_is_evicted(monkeypatch, decodes):
+    token = make_token(expires_in=60)
+    auth.verify_token(token, SECRET)
+    [(_, expires_at)] = auth._token_cache.values()
+
+    # Past its exp the cached entry is not used: the token is verified again
+    # (jwt.decode rejects it by its own clock, unchanged here)
+    monkeypatch.setattr(auth.time, "time", lambda: expires_at)
+    assert auth.verify_token(token, SECRET) == ADMIN
+    assert len(decodes) == 2
+
+
+def test_expired_token_is_rejected_after_a_cache_hit(monkeypatch):
+    token = make_token(expires_in=60)
+    auth.verify_token(token, SECRET)
+    [(_, expires_at)] = auth._token_cache.values()
+
+    def expired(*args, **kwargs):
+        raise jwt.ExpiredSignatureError("Signature has expired")
+
+    monkeypatch.setattr(auth.time, "time", lambda: expires_at + 1)
+    monkeypatch.setattr(auth.jwt, "decode", expired)
+    with pytest.raises(jwt.ExpiredSignatureError):
+        auth.verify_token(token, SECRET)
+    assert len(auth._token_cache) == 0
+
+
+def test_least_recently_used_token_is_evicted(monkeypatch, decodes):
+    monkeypatch.setattr(auth, "TOKEN_CACHE_SIZE", 2)
+    first, second, third = (make_token(expires_in=60 + i) for i in range(3))
+    auth.verify_token(first, SECRET)
+    auth.verify_token(second, SECRET)
+    auth.verify_token(first, SECRET)
+    auth.verify_token(third, SECRET)
+    assert len(decodes) == 3
+
+    # second was used least recently
+    auth.verify_token(first, SECRET)
+    assert len(decodes) == 3
+    auth.verify_token(second, SECRET)
+    assert decodes[-1] == second
+
+
+def test_invalid_tokens_are_not_cached(decodes):
+    forged = make_token(secret="another-secret-another-secret-0123456")
+    for _ in range(2):
+        with pytest.raises(jwt.InvalidSignatureError):
+            auth.verify_token(forged, SECRET)
+    assert len(decodes) == 2
+    assert len(auth._token_cache) == 0
+
+
+def test_admin_required(client):
+    assert get(client, make_token()).get_json() == {"admin": ADMIN}
+    assert client.get("/private").status_code == 401
+    assert get(client, make_token(expires_in=-10)).status_code == 401
+    assert get(client, "not-a-token").status_code == 401
+    assert get(client, make_token(email="user@example.com")).status_code == 403
+    assert get(client, make_token(email=None)).status_code == 403
+
+
+def test_cached_token_of_removed_admin_is_denied(monkeypatch, client, decodes):
+    token = make_token()
+    assert get(client, token).status_code == 200
+
+    # The admin list is checked on every request, cached token or not
+    monkeypatch.setattr(auth, "ADMIN_EMAILS", frozenset(["other@example.com"]))
+    response = get(client, token)
+    assert response.status_code == 403
+    assert len(decodes) == 1
@@ -0,0 +1,189 @@
+"""
+The COPY extractor must return the same frames as execute_query.
+
+The tests without a database build the execute_query frame from the values
+psycopg2 returns for each text value (datetimes with a fixed-offset tzinfo),
+or compare the parsed values of each column type with those psycopg2 returns.
+Set TEST_DATABASE_URL to also compare both extractors on a live database.
+"""
+
+import io
+import os
+from datetime import date, datetime, timezone
+from decimal import Decimal
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+import db
+
+TIMESTAMPTZ_COLUMNS = [("user_id", 23), ("created_at", db.PG_TIMESTAMPTZ)]
+
+
+def copy_frame(rows):
+    """Parse rows of (user_id, created_at text) like copy_query."""
+    lines = ["user_id,created_at"]
+    lines += [f"{user_id},{value or db.COPY_NULL}" for user_id, value in rows]
+    return db.parse_copy_csv(io.StringIO("\n".join(lines) + "\n"), TIMESTAMPTZ_COLUMNS)
+
+
+def execute_query_frame(rows):
+    """Build the frame execute_query returns for the same rows."""
+    records = [
+        (user_id, None if value is None else datetime.fromisoformat(value))
+        for user_id, value in rows
+    ]
+    return pd.DataFrame(records, columns=["user_id", "created_at"])
+
+
+@pytest.mark.parametrize(
+    "rows",
+    [
+        # Session time zone UTC
+        [(1, "2025-03-01 23:58:06+00"), (2, "2025-03-02 00:00:01.5+00")],
+        # A fixed offset, with a missing value
+        [(1, "2025-03-01 23:58:06+05:30"), (2, None), (3, "2025-01-01 00:00:00+05:30")],
+        # Europe/Berlin across a DST change: the offset differs per row
+        [(1, "2025-03-01 23:58:06+01"), (2, "2025-07-01 08:00:00+02"), (3, None)],
+        # No values at all
+        [(1, None), (2, None)],
+    ],
+)
+def test_timestamptz_matches_execute_query(rows):
+    copied = copy_frame(rows)
+    expected = execute_query_frame(rows)
+
+    pd.testing.assert_frame_equal(copied, expected)
+    # Wall-clock values, e.g. cohort dates, are those of the session time zone
+    for copied_value, value in zip(copied["created_at"], expected["created_at"]):
+        if value is not None and not pd.isna(value):
+            assert copied_value.utcoffset() == value.utcoffset()
+            assert copied_value.date() == value.date()
+
+
+@pytest.mark.skipif(
+    not os.getenv("TEST_DATABASE_URL"), reason="TEST_DATABASE_URL is not set"
+)
+@pytest.mark.parametrize("timezone", ["UTC", "Asia/Kolkata", "Europe/Berlin"])
+def test_extractors_return_equal_frames(monkeypatch, timezone):
+    engine = create_engine(
+        os.environ["TEST_DATABASE_URL"],
+        connect_args={"options": f"-c timezone={timezone}"},
+    )
+    monkeypatch.setattr(db, "analytic_db_engine", engine)
+    query = """
+        SELECT id AS user_id,
+               CASE WHEN id % 5 = 0 THEN NULL
+                    ELSE TIMESTAMPTZ '2025-01-01 23:30:00+00' + id * INTERVAL '9 days'
+               END AS created_at
+        FROM generate_series(1, 40) AS id
+    """
+    try:
+        pd.testing.assert_frame_equal(
+            db.copy_query(query), db.execute_query(query)
+        )
+    finally:
+        engine.dispose()
+
+
+def parse(columns, *lines):
+    """Parse CSV lines written by COPY for (name, type OID) columns."""
+    header = ",".join(name for name, _ in columns)
+    return db.parse_copy_csv(io.StringIO("\n".join([header, *lines]) + "\n"), columns)
+
+
+@pytest.mark.parametrize(
+    "value, element_oid, expected",
+    [
+        ("{}", 25, []),
+        ("{a,b}", 25, ["a", "b"]),
+        ('{a,"b c",NULL,"NULL"}', 25, ["a", "b c", None, "NULL"]),
+        (
+            '{"say \\"hi\\"","back\\\\slash","a,b",""}',
+            25,
+            ['say "hi"', "back\\slash", "a,b", ""],
+        ),
+        ("{{1,2},{3,NULL}}", 23, [[1, 2], [3, None]]),
+        ('{{"a b"},{c}}', 25, [["a b"], ["c"]]),
+        ("[0:1]={1,2}", 23, [1, 2]),
+        ("{t,f,NULL}", db.PG_BOOL, [True, False, None]),
+        ("{1.10,NULL}", db.PG_NUMERIC, [Decimal("1.10"), None]),
+        ("{2025-03-01,infinity}", db.PG_DATE, [date(2025, 3, 1), date.max]),
+    ],
+)
+def test_parse_pg_array(value, element_oid, expected):
+    assert db.parse_pg_array(value, element_oid) == expected
+
+
+def test_arrays_are_unquoted_from_csv():
+    df = parse(
+        [("id", 23), ("tags", 1009), ("scores", 1007)],
+        '1,"{a,""b c"",NULL}","{{1,2},{3,4}}"',
+        "2,{},\\N",
+    )
+
+    assert df["tags"].tolist() == [["a", "b c", None], []]
+    assert df["scores"].tolist() == [[[1, 2], [3, 4]], None]
+
+
+def test_bool_columns():
+    df = parse([("a", db.PG_BOOL), ("b", db.PG_BOOL)], "t,t", "f,\\N")
+
+    assert df["a"].dtype == bool
+    assert df["a"].tolist() == [True, False]
+    # A NULL keeps the column as objects, with None for the missing value
+    assert df["b"].dtype == object
+    assert df["b"].tolist() == [True, None]
+
+
+def test_json_and_numeric_columns():
+    df = parse(
+        [("data", 3802), ("amount", db.PG_NUMERIC)],
+        '"{""plan"": ""annual"", ""seats"": [1, 2]}",12.50',
+        "\\N,\\N",
+        "null,-0.001",
+    )
+
+    assert df["data"].tolist() == [{"plan": "annual", "seats": [1, 2]}, None, None]
+    assert df["amount"].tolist() == [Decimal("12.50"), None, Decimal("-0.001")]
+    assert str(df["amount"][0]) == "12.50"
+
+
+def test_null_and_empty_text_stay_apart():
+    df = parse([("id", 23), ("name", 25)], '1,""', "2,\\N", "3,NULL")
+
+    assert df["name"].tolist() == ["", None, "NULL"]
+
+
+def test_date_columns():
+    df = parse([("day", db.PG_DATE)], "2025-03-01", "\\N")
+
+    assert df["day"].tolist() == [date(2025, 3, 1), None]
+
+
+def test_dates_outside_datetime64_range():
+    df = parse(
+        [("day", db.PG_DATE)], "2025-03-01", "9999-12-31", "infinity", "-infinity"
+    )
+
+    assert df["day"].tolist() == [date(2025, 3, 1), date.max, date.max, date.min]
+
+
+def test_timestamps_outside_datetime64_range():
+    df = parse(
+        [("at", db.PG_TIMESTAMP), ("at_tz", db.PG_TIMESTAMPTZ)],
+        "2025-03-01 10:00:00,2025-03-01 10:00:00+00",
+        "infinity,infinity",
+        "-infinity,3000-01-01 00:00:00+00",
+        "\\N,\\N",
+    )
+
+    # The same values psycopg2 returns to execute_query
+    assert df["at"].tolist() == [
+        datetime(2025, 3, 1, 10), datetime.max, datetime.min, None
+    ]
+    assert df["at_tz"].tolist() == [
+        datetime(2025, 3, 1, 10, tzinfo=timezone.utc),
+        datetime.max.replace(tzinfo=timezone.utc),
+        datetime(3000, 1, 1, tzinfo=timezone.utc),
+        None,
+    ]
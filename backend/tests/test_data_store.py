@@ -0,0 +1,98 @@
+"""
+Loading data on first read in lazy mode, and retrying failed loads.
+"""
+
+import pandas as pd
+import pytest
+import data_store
+from data_store import DataNotLoadedError
+
+QUERY_ID = "retention"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(data_store.time, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    """Make loading the query fail until `succeed` is set; count the loads."""
+    state = {"loads": 0, "succeed": False}
+
+    def load_snapshot(query_id):
+        state["loads"] += 1
+        if not state["succeed"]:
+            raise OSError("database is down")
+        return pd.DataFrame({"value": [1]}), None
+
+    monkeypatch.setattr(data_store, "_load_snapshot", load_snapshot)
+    monkeypatch.setattr(data_store, "latest_snapshot_time", lambda query_id: None)
+    monkeypatch.setattr(data_store, "load_status", {QUERY_ID: "pending"})
+    monkeypatch.setattr(data_store, "load_errors", {})
+    monkeypatch.setattr(data_store, "_load_failures", {})
+    monkeypatch.setattr(data_store, "_load_retry_at", {})
+    monkeypatch.delitem(data_store.query_cache, QUERY_ID, raising=False)
+    return state
+
+
+def read():
+    return data_store.query_cache[QUERY_ID]
+
+
+def test_failed_load_is_retried_with_backoff(clock, loads):
+    with pytest.raises(DataNotLoadedError):
+        read()
+    assert loads["loads"] == 1
+    assert data_store.get_data_status()[QUERY_ID]["status"] == "failed"
+    assert data_store.get_data_status()[QUERY_ID]["error"] == "database is down"
+
+    # Reads within the retry delay fail at once
+    clock.now += data_store.LOAD_RETRY_DELAY - 1
+    with pytest.raises(DataNotLoadedError):
+        read()
+    assert loads["loads"] == 1
+    assert data_store.get_data_status()[QUERY_ID]["retry_in_seconds"] == 1
+
+    # The next read after it tries again; the delay doubles
+    clock.now += 1
+    with pytest.raises(DataNotLoadedError):
+        read()
+    assert loads["loads"] == 2
+    assert data_store.get_data_status()[QUERY_ID]["retry_in_seconds"] == (
+        2 * data_store.LOAD_RETRY_DELAY
+    )
+
+    clock.now += 2 * data_store.LOAD_RETRY_DELAY
+    loads["succeed"] = True
+    assert read()["value"].tolist() == [1]
+    assert loads["loads"] == 3
+    status = data_store.get_data_status()[QUERY_ID]
+    assert (status["status"], status["error"]) == ("ready", None)
+    assert "retry_in_seconds" not in status
+
+
+def test_retry_delay_is_capped(clock, loads):
+    for _ in range(12):
+        data_store.ensure_loaded(QUERY_ID)
+        clock.now += data_store.MAX_LOAD_RETRY_DELAY
+    assert loads["loads"] == 12
+    assert data_store.get_data_status()[QUERY_ID]["retry_in_seconds"] == 0
+
+
+def test_pending_query_loads_on_first_read(clock, loads):
+    loads["succeed"] = True
+    assert data_store.get_data_status()[QUERY_ID]["status"] == "pending"
+    assert read()["value"].tolist() == [1]
+    read()
+    assert loads["loads"] == 1
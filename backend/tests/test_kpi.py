@@ -0,0 +1,110 @@
+"""
+The dashboard KPIs must follow the rules of the useKPI hook they replace.
+"""
+
+import pandas as pd
+import pytest
+import data_store
+from analytics.kpi import get_user_metrics
+
+UUID_CODE = "0f8fad5b-d9cb-469f-a165-70867728950e"
+
+# user_id -> (status, auto_renew_enabled, promo_codes_used, product_id,
+# expected_mmr, onboarding_complete)
+USERS = {
+    1: (1, True, [], "com.gymii.monthly", "10", True),
+    # Codes containing "free" do not make a subscriber non-paying
+    2: (1, True, ["SUMMERFREE"], "com.gymii.annual", "5", True),
+    # Any code without "free" does
+    3: (1, True, ["WELCOME10"], "com.gymii.monthly", "10", False),
+    4: (1, True, ["14-day-free"], "com.gymii.monthly", "10", None),
+    5: (1, True, [UUID_CODE.upper()], "com.gymii.annual", "5", True),
+    6: (1, True, None, "com.gymii.monthly", "7.5", True),
+    7: (0, True, [], "com.gymii.monthly", "10", True),
+    8: (1, False, [], "com.gymii.monthly", "10", True),
+    9: (1, True, ["FREEMONTH", "WELCOME10"], "com.gymii.annual", "5", True),
+    10: (1, None, [], "com.gymii.annual", "5", False),
+}
+COLUMNS = [
+    "status",
+    "auto_renew_enabled",
+    "promo_codes_used",
+    "product_id",
+    "expected_mmr",
+    "onboarding_complete",
+]
+
+
+def users_frame(users):
+    df = pd.DataFrame(list(users.values()), columns=COLUMNS)
+    df.insert(0, "user_id", list(users))
+    return df
+
+
+@pytest.fixture(autouse=True)
+def users_data():
+    data_store.replace_data({"users": users_frame(USERS)})
+
+
+def test_user_metrics_follow_use_kpi_rules():
+    assert get_user_metrics() == {
+        "total_users": 10,
+        "users_completed_onboarding": 7,
+        "active_subscribers": 7,
+        "paying_users": 3,  # users 1, 2 and 6
+        "free_users": 4,  # users 3, 4, 5 and 9
+        "monthly_subscribers": 2,
+        "yearly_subscribers": 1,
+        "estimated_monthly_revenue": 22.5,
+    }
+
+
+@pytest.mark.parametrize(
+    "codes, paying",
+    [
+        ([], True),
+        (None, True),
+        ([None], True),
+        (["FREE-YEAR"], True),
+        (["free", "Free-Pass"], True),
+        (["14-day-free"], False),
+        (["PROMO"], False),
+        (["free", "PROMO"], False),
+        ([UUID_CODE], False),
+    ],
+)
+def test_non_paying_promo_codes(codes, paying):
+    data_store.replace_data(
+        {"users": users_frame({1: (1, True, codes, "com.gymii.annual", "5", True)})}
+    )
+
+    metrics = get_user_metrics()
+    assert metrics["paying_users"] == int(paying)
+    assert metrics["free_users"] == int(not paying)
+    assert metrics["yearly_subscribers"] == int(paying)
+
+
+def test_monthly_and_yearly_subscribers():
+    users = {
+        1: (1, True, [], "com.gymii.monthly", "10", True),
+        2: (1, True, [], "com.gymii.month3", "10", True),
+        3: (1, True, [], "com.gymii.Monthly", "10", True),
+        4: (1, True, [], "com.gymii.yearly", "5", True),
+        5: (1, True, [], None, "5", True),
+    }
+    data_store.replace_data({"users": users_frame(users)})
+
+    metrics = get_user_metrics()
+    # "month" is matched case-sensitively, as in useKPI
+    assert metrics["monthly_subscribers"] == 2
+    assert metrics["yearly_subscribers"] == 3
+
+
+def test_repeated_user_keeps_last_row():
+    users = users_frame(USERS)
+    repeated = users.iloc[[0]].assign(status=0)
+    data_store.replace_data({"users": pd.concat([users, repeated])})
+
+    metrics = get_user_metrics()
+    assert metrics["total_users"] == 10
+    assert metrics["paying_users"] == 2
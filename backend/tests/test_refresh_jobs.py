@@ -0,0 +1,76 @@
+"""
+Refresh jobs: status reporting and merging of concurrent refresh requests.
+"""
+
+import threading
+import refresh_jobs
+from refresh_jobs import RefreshJob, start_refresh_job
+
+
+def fake_refresh(statuses, started=None, release=None):
+    def refresh_all_data(on_progress, query_ids, fresh_since):
+        if started is not None:
+            started.set()
+            release.wait(5)
+        for query_id in query_ids:
+            on_progress(query_id, statuses.get(query_id, "completed"), {})
+
+    return refresh_all_data
+
+
+def test_completed_job(monkeypatch):
+    monkeypatch.setattr(refresh_jobs, "refresh_all_data", fake_refresh({}))
+    job = RefreshJob(["users", "dau"])
+    assert job.is_active
+
+    job.run()
+    state = job.to_dict()
+    assert state["status"] == "completed"
+    assert state["error"] is None
+    assert state["finished_at"] is not None
+    assert {info["status"] for info in state["queries"].values()} == {"completed"}
+    assert not job.is_active
+
+
+def test_failed_queries_fail_the_job(monkeypatch):
+    monkeypatch.setattr(
+        refresh_jobs, "refresh_all_data", fake_refresh({"dau": "failed"})
+    )
+    job = RefreshJob(["users", "dau"])
+    job.run()
+    assert job.to_dict()["status"] == "failed"
+    assert job.to_dict()["error"] == "Queries failed: dau"
+
+
+def test_refresh_error_fails_the_job(monkeypatch):
+    def refresh_all_data(**kwargs):
+        raise RuntimeError("database is down")
+
+    monkeypatch.setattr(refresh_jobs, "refresh_all_data", refresh_all_data)
+    job = RefreshJob(["users"])
+    job.run()
+    assert job.to_dict()["status"] == "failed"
+    assert job.to_dict()["error"] == "database is down"
+
+
+def test_requests_join_the_running_job(monkeypatch):
+    started, release = threading.Event(), threading.Event()
+    monkeypatch.setattr(
+        refresh_jobs, "refresh_all_data", fake_refresh({}, started, release)
+    )
+    job = start_refresh_job(["users", "dau"])
+    try:
+        assert started.wait(5)
+        assert job.to_dict()["status"] == "running"
+        # Covered by the running job
+        assert start_refresh_job(["users"]) is job
+        # Not covered: a new job
+        other = start_refresh_job(["retention"])
+        assert other is not job
+    finally:
+        release.set()
+    for thread in threading.enumerate():
+        if thread.name.startswith("refresh-"):
+            thread.join(5)
+    assert job.to_dict()["status"] == "completed"
+    assert other.to_dict()["status"] == "completed"
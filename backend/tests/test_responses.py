@@ -0,0 +1,95 @@
+"""
+ETags and conditional requests of cached_json_response.
+"""
+
+import pandas as pd
+import pytest
+from flask import Flask
+import data_store
+from utils import responses
+from utils.responses import cached_json_response
+
+app = Flask(__name__)
+
+
+def set_users(count):
+    data_store.replace_data({"users": pd.DataFrame({"user_id": range(count)})})
+
+
+def user_count():
+    return {"users": len(data_store.query_cache["users"])}
+
+
+def respond(build=user_count, headers=None, key="count", **kwargs):
+    with app.test_request_context(headers=headers or {}):
+        return cached_json_response(key, ("users",), build, **kwargs)
+
+
+@pytest.fixture(autouse=True)
+def users():
+    set_users(3)
+
+
+def test_revalidating_with_the_current_etag_gets_304():
+    response = respond()
+    assert response.status_code == 200
+    assert response.get_json() == {"users": 3}
+    assert response.headers["Cache-Control"] == "private, no-cache"
+    etag = response.headers["ETag"]
+
+    calls = []
+    revalidated = respond(
+        lambda: calls.append(1) or user_count(), headers={"If-None-Match": etag}
+    )
+    assert revalidated.status_code == 304
+    assert revalidated.headers["ETag"] == etag
+    assert revalidated.get_data() == b""
+    assert calls == []
+
+
+def test_new_data_gets_a_new_etag():
+    etag = respond().headers["ETag"]
+    set_users(5)
+
+    response = respond(headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.get_json() == {"users": 5}
+    assert response.headers["ETag"] != etag
+
+
+def test_body_and_etag_come_from_the_same_data():
+    refreshed = []
+
+    def build_during_refresh():
+        body = user_count()
+        if not refreshed:
+            # A refresh finishes after the payload has read the old data
+            refreshed.append(1)
+            set_users(7)
+        return body
+
+    response = respond(build_during_refresh, cache=False)
+    assert response.get_json() == {"users": 7}
+    current = responses.make_etag("count", data_store.get_data_tags("users"))
+    assert response.headers["ETag"] == f'"{current}"'
+
+
+def test_data_that_keeps_changing_is_served_without_etag():
+    def build_during_refreshes():
+        body = user_count()
+        set_users(body["users"] + 1)
+        return body
+
+    response = respond(build_during_refreshes, cache=False)
+    assert response.status_code == 200
+    assert "ETag" not in response.headers
+    assert response.headers["Cache-Control"] == "no-store"
+
+
+def test_snapshot_sync_is_throttled(monkeypatch):
+    calls = []
+    monkeypatch.setattr(responses, "sync_snapshots", lambda: calls.append(1))
+    monkeypatch.setattr(responses, "_last_sync", 0.0)
+    for _ in range(5):
+        respond()
+    assert len(calls) == 1
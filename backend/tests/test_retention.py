@@ -0,0 +1,194 @@
+"""
+Cohort retention computed on the activity index, checked against a small
+fixture whose counts are worked out by hand.
+"""
+
+import pandas as pd
+import pytest
+import data_store
+from data_store import DataNotLoadedError
+from analytics.retention import (
+    MAX_RETENTION_DAY,
+    get_retention_triangle,
+    get_user_retention_by_cohort,
+    validate_triangle_args,
+)
+
+FIRST_DAY = pd.Timestamp("2025-01-01")
+
+
+def day(n):
+    return FIRST_DAY + pd.Timedelta(days=n)
+
+
+# user_id -> (created on day, onboarded, active on days)
+USERS = {
+    1: (0, True, [1, 7, 30]),
+    2: (0, True, [1]),
+    3: (1, True, [15]),
+    4: (0, False, [1]),  # no dietary preferences: not in any cohort
+    5: (19, True, [20]),  # too recent for the Day-30 checkpoint
+    6: (6, True, [7, 13]),
+}
+LAST_DAY = 35
+CHECKPOINTS = (1, 7, 14, 30)
+
+
+def load_fixture():
+    users = pd.DataFrame(
+        {
+            "user_id": list(USERS),
+            "created_at": [
+                day(created) + pd.Timedelta(hours=9) for created, _, _ in USERS.values()
+            ],
+            "dietary_preferences": [
+                {"vegan": False} if onboarded else None
+                for _, onboarded, _ in USERS.values()
+            ],
+        }
+    )
+    dau = pd.DataFrame(
+        {
+            "date": [day(n) for n in range(LAST_DAY + 1)],
+            "unique_users": [
+                [user_id for user_id, (_, _, active) in USERS.items() if n in active]
+                for n in range(LAST_DAY + 1)
+            ],
+        }
+    )
+    data_store.replace_data({"users": users, "dau": dau})
+
+
+@pytest.fixture(autouse=True)
+def fixture_data():
+    load_fixture()
+
+
+def test_retention_by_cohort_counts():
+    result = get_user_retention_by_cohort()
+
+    # Cohorts up to day 5 (LAST_DAY - 30) are reported, newest first
+    rows = {row["cohort_date"]: row for row in result["retention_analysis"]}
+    assert list(rows) == [day(1), day(0)]
+    assert rows[day(0)]["cohort_size"] == 2
+    assert [rows[day(0)][f"day{n}_active_users"] for n in CHECKPOINTS] == [2, 1, 0, 1]
+    assert rows[day(0)]["day1_retention"] == 100.0
+    assert rows[day(0)]["day7_retention"] == 50.0
+    assert rows[day(1)]["cohort_size"] == 1
+    assert [rows[day(1)][f"day{n}_active_users"] for n in CHECKPOINTS] == [0, 0, 1, 0]
+
+    overall = result["overall_retention"]
+    assert overall["cohort_size"] == 3
+    assert overall["day1_retention"] == pytest.approx(200 / 3)
+    assert overall["day14_retention"] == pytest.approx(100 / 3)
+
+    weekly = {row["cohort_week"]: row for row in result["weekly_avg"]}
+    assert weekly["2024-12-30/2025-01-05"]["cohort_size"] == 3
+    assert weekly["2024-12-30/2025-01-05"]["day1_active_users"] == 2
+
+
+def test_retention_from_array_literals():
+    # dau loaded from a CSV file holds Postgres array literals as text
+    expected = get_user_retention_by_cohort()
+    dau = data_store.query_cache["dau"].copy()
+    dau["unique_users"] = [
+        "{" + ",".join(map(str, users)) + "}" for users in dau["unique_users"]
+    ]
+    data_store.replace_data({"dau": dau})
+
+    result = get_user_retention_by_cohort()
+    assert result == expected
+    assert result["overall_retention"]["day1_retention"] == pytest.approx(200 / 3)
+
+
+def test_retention_by_cohort_is_json_ready():
+    result = get_user_retention_by_cohort()
+    row = result["retention_analysis"][0]
+    assert type(row["cohort_size"]) is int
+    assert type(row["day1_retention"]) is float
+
+
+def test_missing_activity_index_is_not_loaded():
+    # The activity index cannot be built without unique_users
+    data_store.replace_data({"dau": pd.DataFrame({"date": [day(0)]})})
+    with pytest.raises(DataNotLoadedError):
+        get_user_retention_by_cohort()
+
+
+def test_retention_by_cohort_without_old_enough_cohorts():
+    # Every cohort is younger than the Day-30 checkpoint
+    data_store.replace_data(
+        {"dau": pd.DataFrame({"date": [day(0), day(2)], "unique_users": [[1], [1]]})}
+    )
+    result = get_user_retention_by_cohort()
+    assert result["retention_analysis"] == []
+    assert result["overall_retention"] == {
+        "cohort_size": 0,
+        **{f"day{n}_retention": 0.0 for n in CHECKPOINTS},
+    }
+
+
+def test_retention_triangle_daily():
+    triangle = get_retention_triangle("daily", [0, 1, 7, 30])
+    assert triangle["days"] == [0, 1, 7, 30]
+
+    cohorts = {row["cohort"]: row for row in triangle["cohorts"]}
+    assert list(cohorts) == ["2025-01-20", "2025-01-07", "2025-01-02", "2025-01-01"]
+    assert cohorts["2025-01-01"]["cohort_size"] == 2
+    assert cohorts["2025-01-01"]["active_users"] == [0, 2, 1, 1]
+    assert cohorts["2025-01-01"]["retention"] == [0.0, 100.0, 50.0, 50.0]
+    # Day 30 of the 2025-01-07 cohort lies past the last day of data
+    assert cohorts["2025-01-07"]["active_users"] == [0, 1, 1, None]
+    assert cohorts["2025-01-07"]["retention"][3] is None
+
+
+def test_retention_triangle_rolls_cohorts_up():
+    triangle = get_retention_triangle("weekly", [1, 7, 30])
+    weeks = {row["cohort"]: row for row in triangle["cohorts"]}
+    assert list(weeks) == [
+        "2025-01-20/2025-01-26",
+        "2025-01-06/2025-01-12",
+        "2024-12-30/2025-01-05",
+    ]
+
+    # 2025-01-01 (2 users) and 2025-01-02 (1 user) are summed
+    first_week = weeks["2024-12-30/2025-01-05"]
+    assert first_week["cohort_size"] == 3
+    assert first_week["active_users"] == [2, 1, 1]
+    assert first_week["retention"] == pytest.approx([200 / 3, 100 / 3, 100 / 3])
+
+    monthly = get_retention_triangle("monthly", [1])
+    assert [(row["cohort"], row["cohort_size"]) for row in monthly["cohorts"]] == [
+        ("2025-01", 5)
+    ]
+    assert monthly["cohorts"][0]["active_users"] == [4]
+
+
+def test_retention_triangle_only_counts_cohorts_that_reached_a_horizon():
+    # Day 30 is past the data for the 2025-01-20 cohort, so only the older
+    # members count towards the January cell
+    monthly = get_retention_triangle("monthly", [30])
+    assert monthly["cohorts"][0]["active_users"] == [1]
+    assert monthly["cohorts"][0]["retention"] == [pytest.approx(100 / 3)]
+
+
+@pytest.mark.parametrize(
+    "period, days",
+    [
+        ("hourly", [1]),
+        ("daily", []),
+        ("daily", [-1]),
+        ("daily", [MAX_RETENTION_DAY + 1]),
+    ],
+)
+def test_validate_triangle_args_rejects(period, days):
+    with pytest.raises(ValueError):
+        validate_triangle_args(period, days)
+
+
+def test_validate_triangle_args_sorts_and_caps():
+    assert validate_triangle_args("weekly", [7, 1, 7]).tolist() == [1, 7]
+    assert validate_triangle_args("daily", [MAX_RETENTION_DAY]).tolist() == [
+        MAX_RETENTION_DAY
+    ]
+    assert validate_triangle_args("daily").tolist() == list(range(91))
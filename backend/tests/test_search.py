@@ -0,0 +1,104 @@
+"""
+Matching and ranking of the user search index.
+"""
+
+import pandas as pd
+import pytest
+import data_store
+from users.search import UserSearchIndex
+from users.user import search_users
+
+USERS = pd.DataFrame(
+    {
+        "user_id": [101, 102, 103, 104, 105, 1010],
+        "email": [
+            "anna@example.com",
+            "Annabel@Example.com",
+            "joanna@mail.org",
+            "zed@annex.io",
+            None,
+            "x@y.z",
+        ],
+        "first_name": ["Anna", "Annabel", "Joanna", "Zed", "ANN", None],
+    }
+)
+
+
+@pytest.fixture
+def index():
+    return UserSearchIndex(USERS)
+
+
+def found(index, query, limit=20):
+    """Search and return the user_ids of the matching rows."""
+    return [int(USERS["user_id"][row]) for row in index.search(query, limit)]
+
+
+def test_trigram_postings(index):
+    for gram, gram_id in index.ngram_ids.items():
+        rows = index.ngram_rows[
+            index.ngram_offsets[gram_id] : index.ngram_offsets[gram_id + 1]
+        ]
+        expected = [
+            row
+            for row, text in enumerate(index.texts)
+            if any(gram in field for field in text.split("\0"))
+        ]
+        assert rows.tolist() == expected, gram
+        # Trigrams never span two fields
+        assert "\0" not in gram
+    assert {"ann", "nne", "nex", "101", "010"} <= set(index.ngram_ids)
+
+
+def test_ranking(index):
+    # The exact first_name match, then email and first_name prefix matches
+    # in alphabetical order, then substring matches by match position
+    assert found(index, "ann") == [105, 101, 102, 103, 104]
+    assert found(index, "ann", limit=2) == [105, 101]
+
+
+def test_user_id_matches(index):
+    assert found(index, "101") == [101, 1010]
+    assert found(index, "10") == [101, 1010, 102, 103, 104, 105]
+
+
+def test_case_folding(index):
+    assert found(index, "ANNA") == found(index, "anna") == [101, 102, 103]
+    assert found(index, " annabel@EXAMPLE.com ") == [102]
+    assert found(index, "EXAMPLE") == [101, 102]
+
+
+def test_short_queries_only_match_prefixes(index):
+    assert found(index, "an") == [101, 102, 105]
+    assert found(index, "z") == [104]
+    # "na" and "ex" only occur inside values: substrings need 3 characters
+    assert found(index, "na") == []
+    assert found(index, "ex") == []
+    assert found(index, "nne") == [104]
+
+
+def test_substring_matches(index):
+    assert found(index, "mail.org") == [103]
+    assert found(index, "nnex") == [104]
+    # Every trigram occurs, but not next to each other in one field
+    assert found(index, "annaj") == []
+
+
+@pytest.mark.parametrize("query", ["", "   ", "a\0b", "nobody"])
+def test_no_matches(index, query):
+    assert found(index, query) == []
+
+
+def test_search_users():
+    data_store.replace_data({"users": USERS})
+
+    result = search_users("Anna", limit=2, fields=["email"])
+    assert result == {
+        "query": "Anna",
+        "users": [
+            {"email": "anna@example.com", "id": 101},
+            {"email": "Annabel@Example.com", "id": 102},
+        ],
+    }
+    with pytest.raises(ValueError):
+        search_users("anna", limit=0)
@@ -0,0 +1,71 @@
+"""
+The column-wise users serializer must produce the JSON flask produces for the
+same users as dicts.
+"""
+
+import json
+import uuid
+from datetime import date
+from decimal import Decimal
+import numpy as np
+import pandas as pd
+import pytest
+from flask import Flask, jsonify
+from users.serialize import serialize_users
+from users.user import _user_records
+
+USERS = pd.DataFrame(
+    {
+        "user_id": ["c3", "a1", "b2", "a1"],
+        "email": ["zoë@example.com", "a@example.com", 'quote"d@example.com', "a2@x"],
+        "first_name": ["Zoë", None, "Bo\nb", "Al"],
+        "created_at": pd.to_datetime(
+            ["2025-03-01 23:58:06+01:00", "2024-12-31 00:00:00+00:00", None, None],
+            utc=True,
+        ),
+        "expiry_date": pd.to_datetime(["2025-04-01", None, "2026-01-01", None]),
+        "purchase_date": [date(2025, 3, 1), None, date(2024, 2, 29), None],
+        "credits": [1.5, np.nan, 0.1, 3.0],
+        "status": np.array([1, 0, 2, 1], dtype=np.int64),
+        "onboarding_complete": [True, False, True, False],
+        "auto_renew_enabled": [True, None, False, True],
+        "expected_mmr": [Decimal("9.99"), None, Decimal("0"), Decimal("1.10")],
+        "offer_id": [uuid.UUID(int=1), None, uuid.UUID(int=2), None],
+        "promo_codes_used": [["14-day-free"], [None], None, []],
+        "dietary_preferences": [{"vegan": True, "italian": False}, None, {}, None],
+    }
+)
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    with app.app_context():
+        yield app
+
+
+def users_dict(users_df):
+    """The users keyed by user_id, as dicts built like get_user's."""
+    return {record["id"]: record for record in _user_records(users_df)}
+
+
+def test_keyed_output_matches_flask(app):
+    expected = users_dict(USERS)
+
+    text = serialize_users(USERS)
+    # Byte for byte what cached_json_response serializes with app.json.dumps
+    assert text == app.json.dumps(expected)
+    # and the same JSON document jsonify returns
+    assert json.loads(text) == jsonify(expected).get_json()
+    assert list(json.loads(text)) == ["a1", "b2", "c3"]
+
+
+def test_list_output_matches_flask(app):
+    assert serialize_users(USERS, keyed=False) == app.json.dumps(_user_records(USERS))
+
+
+def test_output_without_app_context():
+    app = Flask(__name__)
+    text = serialize_users(USERS)
+    with app.app_context():
+        assert text == app.json.dumps(users_dict(USERS))
@@ -0,0 +1,152 @@
+"""
+Snapshot stores: every supported column type survives a write and a read,
+and the manifest keeps the snapshot a process may still be opening.
+"""
+
+import datetime as dt
+import os
+from decimal import Decimal
+import pandas as pd
+import pytest
+import snapshot_store
+from snapshot_store import (
+    ParquetSnapshotStore,
+    PickleSnapshotStore,
+    SnapshotStore,
+    pa,
+)
+
+BERLIN_WINTER = dt.timezone(dt.timedelta(hours=1))
+BERLIN_SUMMER = dt.timezone(dt.timedelta(hours=2))
+
+
+def sample_frame():
+    return pd.DataFrame(
+        {
+            "user_id": [1, 2, 3],
+            "credits": [1.5, None, 3.0],
+            "onboarding_complete": [True, False, True],
+            "email": ["a@example.com", None, "c@example.com"],
+            "created_at": pd.to_datetime(
+                ["2025-01-01 10:00", "2025-07-01 10:00", None]
+            ).tz_localize("UTC"),
+            "local_time": pd.Series(
+                [
+                    dt.datetime(2025, 1, 1, 10, tzinfo=BERLIN_SUMMER),
+                    dt.datetime(2025, 7, 1, 10, tzinfo=BERLIN_SUMMER),
+                    None,
+                ]
+            ),
+            "naive_time": pd.to_datetime(["2025-01-01", None, "2025-01-03"]),
+            "birthday": [dt.date(1990, 1, 1), None, dt.date(2000, 2, 29)],
+            "price": [Decimal("9.99"), None, Decimal("0.10")],
+            "promo_codes_used": [["14-day-free"], [], None],
+            "dietary_preferences": [{"vegan": True}, None, {"italian": False}],
+        }
+    )
+
+
+@pytest.fixture(params=["parquet", "pickle"])
+def store(request):
+    if request.param == "parquet":
+        if pa is None:
+            pytest.skip("pyarrow is not installed")
+        return ParquetSnapshotStore()
+    return PickleSnapshotStore()
+
+
+def round_trip(store, df, tmp_path, columns=None):
+    path = str(tmp_path / f"snapshot{store.extension}")
+    store.write(df, path)
+    return store.read(path, columns)
+
+
+def test_round_trip_keeps_values_and_dtypes(store, tmp_path):
+    df = sample_frame()
+    read = round_trip(store, df, tmp_path)
+    pd.testing.assert_frame_equal(read, df)
+    assert read.dtypes.to_dict() == df.dtypes.to_dict()
+
+
+def test_column_projection(store, tmp_path):
+    read = round_trip(store, sample_frame(), tmp_path, ["user_id", "price"])
+    assert list(read.columns) == ["user_id", "price"]
+
+
+def test_mixed_utc_offsets_become_a_utc_column(tmp_path):
+    if pa is None:
+        pytest.skip("pyarrow is not installed")
+    times = [
+        dt.datetime(2025, 1, 1, 10, tzinfo=BERLIN_WINTER),
+        dt.datetime(2025, 7, 1, 10, tzinfo=BERLIN_SUMMER),
+        None,
+    ]
+    df = pd.DataFrame({"created_at": pd.Series(times, dtype=object)})
+    read = round_trip(ParquetSnapshotStore(), df, tmp_path)
+
+    assert str(read["created_at"].dtype) == "datetime64[ns, UTC]"
+    assert read["created_at"][0] == pd.Timestamp("2025-01-01 09:00", tz="UTC")
+    assert read["created_at"][1] == pd.Timestamp("2025-07-01 08:00", tz="UTC")
+    assert pd.isna(read["created_at"][2])
+
+
+def test_values_json_cannot_store_fail_the_write(tmp_path):
+    if pa is None:
+        pytest.skip("pyarrow is not installed")
+    df = pd.DataFrame({"settings": [{"since": dt.date(2025, 1, 1)}, None]})
+    with pytest.raises(ValueError, match="settings"):
+        round_trip(ParquetSnapshotStore(), df, tmp_path)
+
+
+def test_snapshot_store_is_abstract():
+    with pytest.raises(TypeError):
+        SnapshotStore()
+
+
+def test_previous_snapshot_is_kept_until_the_next_write():
+    df = pd.DataFrame({"user_id": [1, 2]})
+    first = snapshot_store.write_snapshot(df, "keep_previous")
+    second = snapshot_store.write_snapshot(df, "keep_previous")
+    assert os.path.exists(first["path"])
+    assert snapshot_store.get_retired_snapshot("keep_previous") == first["path"]
+
+    third = snapshot_store.write_snapshot(df, "keep_previous")
+    assert not os.path.exists(first["path"])
+    assert os.path.exists(second["path"]) and os.path.exists(third["path"])
+    assert snapshot_store.get_snapshot_entry("keep_previous") == third
+
+
+def test_load_current_snapshot_checks_the_checksum():
+    df = pd.DataFrame({"user_id": [1, 2]})
+    entry = snapshot_store.write_snapshot(df, "checksum")
+    loaded, loaded_entry = snapshot_store.load_current_snapshot("checksum")
+    pd.testing.assert_frame_equal(loaded, df)
+    assert loaded_entry == entry
+
+    with open(entry["path"], "ab") as f:
+        f.write(b"corrupt")
+    with pytest.raises(snapshot_store.SnapshotChecksumError):
+        snapshot_store.load_current_snapshot("checksum")
+
+
+def test_load_current_snapshot_follows_a_replaced_snapshot(monkeypatch):
+    old = snapshot_store.write_snapshot(pd.DataFrame({"v": [1]}), "replaced")
+    snapshot_store.write_snapshot(pd.DataFrame({"v": [2]}), "replaced")
+    snapshot_store.write_snapshot(pd.DataFrame({"v": [3]}), "replaced")
+    assert not os.path.exists(old["path"])
+
+    # The first lookup still sees the entry of a snapshot deleted since
+    lookups = []
+    get_entry = snapshot_store.get_snapshot_entry
+
+    def stale_then_current(name):
+        lookups.append(name)
+        return old if len(lookups) == 1 else get_entry(name)
+
+    monkeypatch.setattr(snapshot_store, "get_snapshot_entry", stale_then_current)
+    df, entry = snapshot_store.load_current_snapshot("replaced")
+    assert df["v"].tolist() == [3]
+
+
+def test_load_current_snapshot_without_snapshot():
+    assert snapshot_store.load_current_snapshot("never_written") == (None, None)
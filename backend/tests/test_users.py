@@ -0,0 +1,147 @@
+"""
+Paging, sorting and filtering of the user list on the prepared user table.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+import data_store
+import users.user
+from data_store import DataNotLoadedError
+from users.user import MAX_PAGE_SIZE, get_users_page
+
+
+def day(n):
+    return pd.Timestamp("2025-01-01", tz="UTC") + pd.Timedelta(days=n)
+
+
+def utc(n):
+    """The day as a naive UTC timestamp, as the /users route parses it."""
+    return day(n).tz_localize(None)
+
+
+USERS = pd.DataFrame(
+    {
+        "user_id": [1, 2, 3, 4, 5, 6],
+        "email": ["d@x.com", "Bob@x.com", "a@x.com", "c@x.com", "e@x.com", "f@x.com"],
+        "first_name": ["Dana", "Bob", None, "Cleo", "Eve", "Finn"],
+        "created_at": [day(n) for n in range(6)],
+        "last_active": [day(10), pd.NaT, day(12), day(11), pd.NaT, day(9)],
+        "status": [1, 0, 1, 2, 1, 1],
+        "product_id": ["monthly", "yearly", "monthly", None, "yearly", "monthly"],
+        "onboarding_complete": [True, False, None, True, True, False],
+        "credits": [5.0, np.nan, 1.0, 3.0, np.nan, 2.0],
+    }
+)
+
+
+@pytest.fixture(autouse=True)
+def users_data():
+    data_store.replace_data({"users": USERS})
+
+
+def ids(page):
+    return [user["id"] for user in page["users"]]
+
+
+def test_offset_paging():
+    first = get_users_page(page=1, page_size=4)
+    assert ids(first) == [1, 2, 3, 4]
+    assert (first["total"], first["page"], first["page_size"]) == (6, 1, 4)
+    assert first["total_pages"] == 2
+
+    assert ids(get_users_page(page=2, page_size=4)) == [5, 6]
+    assert ids(get_users_page(page=3, page_size=4)) == []
+
+
+def test_page_size_bounds():
+    page = get_users_page(page_size=MAX_PAGE_SIZE)
+    assert page["page_size"] == MAX_PAGE_SIZE
+    assert page["total_pages"] == 1
+
+    for page, page_size in [(0, 10), (1, 0), (1, MAX_PAGE_SIZE + 1)]:
+        with pytest.raises(ValueError):
+            get_users_page(page=page, page_size=page_size)
+
+
+@pytest.mark.parametrize(
+    "sort, descending, expected",
+    [
+        ("created_at", True, [6, 5, 4, 3, 2, 1]),
+        ("created_at", False, [1, 2, 3, 4, 5, 6]),
+        # Missing values stay last in both directions
+        ("last_active", True, [3, 4, 1, 6, 2, 5]),
+        ("last_active", False, [6, 1, 4, 3, 2, 5]),
+        ("credits", True, [1, 4, 6, 3, 2, 5]),
+        ("credits", False, [3, 6, 4, 1, 2, 5]),
+        # Text sorts case-insensitively
+        ("email", False, [3, 2, 4, 1, 5, 6]),
+        ("first_name", False, [2, 4, 1, 5, 6, 3]),
+        ("user_id", True, [6, 5, 4, 3, 2, 1]),
+    ],
+)
+def test_sort_keys(sort, descending, expected):
+    assert ids(get_users_page(sort=sort, descending=descending)) == expected
+
+
+def test_sorted_pages_follow_the_sort():
+    pages = [
+        ids(get_users_page(page=page, page_size=4, sort="credits")) for page in (1, 2)
+    ]
+    assert pages == [[1, 4, 6, 3], [2, 5]]
+
+
+def test_unknown_sort_key():
+    with pytest.raises(ValueError):
+        get_users_page(sort="password")
+
+
+@pytest.mark.parametrize(
+    "filters, expected",
+    [
+        ({"status": [1]}, [1, 3, 5, 6]),
+        ({"status": [0, 2]}, [2, 4]),
+        ({"product_id": ["monthly"], "onboarding_complete": True}, [1]),
+        # A missing onboarding_complete counts as not completed
+        ({"onboarding_complete": False}, [2, 3, 6]),
+        # Date ranges, in naive UTC, include the start and exclude the end
+        ({"created_at": (utc(1), utc(3))}, [2, 3]),
+        ({"created_at": (utc(4), None)}, [5, 6]),
+        ({"last_active": (None, utc(11))}, [1, 6]),
+        ({"status": None, "product_id": None}, [1, 2, 3, 4, 5, 6]),
+    ],
+)
+def test_filters(filters, expected):
+    page = get_users_page(filters=filters)
+    assert ids(page) == expected
+    assert page["total"] == len(expected)
+
+
+def test_filters_apply_before_paging():
+    page = get_users_page(
+        page=2, page_size=2, sort="created_at", filters={"status": [1]}
+    )
+    assert ids(page) == [3, 1]
+    assert (page["total"], page["total_pages"]) == (4, 2)
+
+
+def test_unknown_filter():
+    with pytest.raises(ValueError):
+        get_users_page(filters={"password": ["x"]})
+
+
+def test_fields_and_missing_values():
+    page = get_users_page(page_size=2, fields=["credits", "last_active", "id"])
+    assert page["users"] == [
+        {"credits": 5.0, "last_active": day(10), "id": 1},
+        {"credits": None, "last_active": None, "id": 2},
+    ]
+
+    with pytest.raises(ValueError):
+        get_users_page(fields=["password"])
+
+
+def test_users_not_loaded(monkeypatch):
+    monkeypatch.setattr(users.user, "get_index", lambda name: None)
+    with pytest.raises(DataNotLoadedError):
+        get_users_page()
@@ -0,0 +1,177 @@
+"""
+Module for the in-memory search index over users.
+
+user_id, email and first_name are searched case-insensitively. Exact and
+prefix matches use binary search on each field's sorted values; substring
+matches use a trigram index, so they need queries of at least three
+characters, and every candidate row is checked before it is returned.
+"""
+
+import numpy as np
+import pandas as pd
+from data_store import register_index
+
+# Searchable columns, in ranking priority
+SEARCH_FIELDS = ("user_id", "email", "first_name")
+
+# Default and largest number of results returned by search_users
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+# Length of the n-grams indexed for substring search
+NGRAM = 3
+
+
+class UserSearchIndex:
+    """
+    Search structures over the users frame, built once per version of the
+    users data.
+
+    Attributes:
+        df: The users frame the index was built from
+        sorted_values: Field -> lower-cased values in sorted order (numpy
+            unicode array), for prefix binary search
+        sorted_positions: Field -> row position of each sorted value
+        texts: Lower-cased searchable fields of each row joined by NUL (numpy
+            unicode array), for verifying substring candidates
+        ngram_ids: Trigram -> id; the rows containing trigram i are
+            ngram_rows[ngram_offsets[i]:ngram_offsets[i + 1]], sorted
+    """
+
+    def __init__(self, users_df):
+        # Only the searchable columns are read, by row position
+        self.df = users_df
+        columns = {}
+        for field in SEARCH_FIELDS:
+            if field in users_df.columns:
+                values = users_df[field].to_numpy()
+                columns[field] = np.char.lower(
+                    np.where(pd.isna(values), "", values).astype(str)
+                )
+
+        self.sorted_values = {}
+        self.sorted_positions = {}
+        for field, values in columns.items():
+            order = np.argsort(values, kind="stable")
+            self.sorted_values[field] = values[order]
+            self.sorted_positions[field] = order
+
+        self.texts = (
+            pd.DataFrame(columns).agg("\0".join, axis=1).to_numpy(dtype=str)
+            if columns
+            else np.array([], dtype=str)
+        )
+
+        # Trigram postings as CSR arrays
+        grams, rows = [], []
+        for row, text in enumerate(self.texts):
+            row_grams = {text[i : i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+            row_grams = [gram for gram in row_grams if "\0" not in gram]
+            grams.extend(row_grams)
+            rows.extend([row] * len(row_grams))
+        codes, uniques = pd.factorize(pd.Series(grams, dtype=object))
+        rows = np.asarray(rows, dtype=np.int32)
+        order = np.lexsort((rows, codes))
+        self.ngram_rows = rows[order]
+        self.ngram_offsets = np.zeros(len(uniques) + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(codes, minlength=len(uniques)), out=self.ngram_offsets[1:]
+        )
+        self.ngram_ids = {gram: i for i, gram in enumerate(uniques)}
+
+    def _value_range(self, field, low, high=None):
+        """Get the [start, end) range of sorted values between low and high."""
+        values = self.sorted_values[field]
+        # Keys must fit the array's width, or numpy copies the whole array
+        width = values.dtype.itemsize // 4
+        if len(low) > width:
+            return 0, 0
+        start = np.searchsorted(values, np.array(low, dtype=values.dtype), "left")
+        if high is None or len(high) > width:
+            # Values equal to low, or, for a prefix as wide as the array, itself
+            end = np.searchsorted(values, np.array(low, dtype=values.dtype), "right")
+        else:
+            end = np.searchsorted(values, np.array(high, dtype=values.dtype), "left")
+        return start, end
+
+    def prefix_matches(self, field, prefix):
+        """Get the row positions whose field starts with prefix, in value order."""
+        start, end = self._value_range(field, prefix, prefix + "\U0010ffff")
+        return self.sorted_positions[field][start:end]
+
+    def exact_matches(self, field, value):
+        """Get the row positions whose field equals value."""
+        start, end = self._value_range(field, value)
+        return self.sorted_positions[field][start:end]
+
+    def substring_candidates(self, query):
+        """Get the rows containing every trigram of query (len(query) >= 3)."""
+        postings = []
+        for i in range(len(query) - NGRAM + 1):
+            gram_id = self.ngram_ids.get(query[i : i + NGRAM])
+            if gram_id is None:
+                return self.ngram_rows[:0]
+            postings.append(
+                self.ngram_rows[
+                    self.ngram_offsets[gram_id] : self.ngram_offsets[gram_id + 1]
+                ]
+            )
+        # Intersect from the shortest posting list, by binary search
+        postings.sort(key=len)
+        rows = postings[0]
+        for posting in postings[1:]:
+            found_at = np.searchsorted(posting, rows)
+            found_at[found_at == len(posting)] = 0
+            rows = rows[posting[found_at] == rows] if len(posting) else posting
+            if len(rows) == 0:
+                break
+        return rows
+
+    def search(self, query, limit=DEFAULT_SEARCH_LIMIT):
+        """
+        Find the rows matching a query, best matches first.
+
+        Exact matches rank first, then prefix matches, then substring matches.
+        Within a tier, user_id matches rank before email and first_name
+        matches, and prefix matches are in alphabetical order.
+
+        Args:
+            query: Text to search for (case-insensitive)
+            limit: Maximum number of rows returned
+
+        Returns:
+            List of row positions
+        """
+        query = query.strip().lower()
+        if not query or "\0" in query:
+            return []
+
+        found = {}
+
+        def add(positions):
+            for position in positions:
+                if len(found) >= limit:
+                    return
+                found.setdefault(int(position), None)
+
+        for field in self.sorted_values:
+            add(self.exact_matches(field, query))
+        for field in self.sorted_values:
+            add(self.prefix_matches(field, query)[:limit])
+
+        if len(found) < limit and len(query) >= NGRAM:
+            candidates = self.substring_candidates(query)
+            match_at = np.strings.find(self.texts[candidates], query)
+            verified = match_at >= 0
+            order = np.argsort(match_at[verified], kind="stable")
+            add(candidates[verified][order])
+
+        return list(found)
+
+
+def build_user_search_index(users_df):
+    """Build the UserSearchIndex for the users frame."""
+    return UserSearchIndex(users_df)
+
+
+register_index("users", "user_search", build_user_search_index)
@@ -0,0 +1,190 @@
+"""
+Serialize the users frame to JSON straight from its column arrays.
+
+The output is the text flask's JSON provider produces for the users as dicts
+(see users.user.get_user), without building those dicts.
+"""
+
+import decimal
+import json
+import uuid
+import numpy as np
+import pandas as pd
+from datetime import date
+from json.encoder import encode_basestring_ascii
+from flask import current_app, has_app_context
+from werkzeug.http import http_date
+
+# Day and month names of RFC 822 dates, as byte rows
+WEEKDAYS = np.frombuffer(b"ThuFriSatSunMonTueWed", dtype=np.uint8).reshape(7, 3)
+MONTHS = np.frombuffer(b"JanFebMarAprMayJunJulAugSepOctNovDec", dtype=np.uint8).reshape(
+    12, 3
+)
+
+# Layout of '"Sat, 01 Mar 2025 23:58:06 GMT"': the template, then the slices
+# filled from the weekday, month and the ISO 'YYYY-MM-DDTHH:MM:SS' string
+DATE_TEMPLATE = np.frombuffer(b'"---, -- --- ---- --:--:-- GMT"', dtype=np.uint8)
+DATE_WEEKDAY = slice(1, 4)
+DATE_MONTH = slice(9, 12)
+DATE_FROM_ISO = (
+    (slice(6, 8), slice(8, 10)),
+    (slice(13, 17), slice(0, 4)),
+    (slice(18, 26), slice(11, 19)),
+)
+
+
+def _default(value):
+    """Encode the non-JSON types of the users data like flask's provider."""
+    if isinstance(value, date):
+        return http_date(value)
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _get_encoder():
+    """
+    Get the encoder for values without a fast path, configured like the
+    app's JSON provider when there is an app context.
+    """
+    default = current_app.json.default if has_app_context() else _default
+    return json.JSONEncoder(default=default, ensure_ascii=True, sort_keys=True)
+
+
+def _encode_float(value):
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "Infinity" if value > 0 else "-Infinity"
+    return float.__repr__(value)
+
+
+def _encode_value(value, encoder):
+    """Encode one value of an object column."""
+    if value is None or value is pd.NA:
+        return "null"
+    if isinstance(value, str):
+        return encode_basestring_ascii(value)
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float):
+        # replace({np.nan: None}) in _clean_users_frame turns NaN into null
+        return "null" if value != value else _encode_float(value)
+    if isinstance(value, int):
+        return int.__repr__(value)
+    if isinstance(value, date):
+        return "null" if pd.isna(value) else f'"{http_date(value)}"'
+    if isinstance(value, np.generic):
+        return _encode_value(value.item(), encoder)
+    if isinstance(value, list) and all(type(item) is str for item in value):
+        return "[" + ", ".join(map(encode_basestring_ascii, value)) + "]"
+    return encoder.encode(value)
+
+
+def _encode_datetimes(values):
+    """Encode a datetime64 column as RFC 822 dates in GMT, like http_date."""
+    if values.dt.tz is not None:
+        values = values.dt.tz_convert("UTC").dt.tz_localize(None)
+    seconds = values.to_numpy(dtype="datetime64[s]")
+    missing = np.isnat(seconds)
+    seconds = np.where(missing, np.datetime64(0, "s"), seconds)
+
+    iso = np.datetime_as_string(seconds, unit="s").astype("S19")
+    iso = iso.view(np.uint8).reshape(len(iso), 19)
+    days = seconds.astype("datetime64[D]").astype(np.int64)
+    months = seconds.astype("datetime64[M]").astype(np.int64) % 12
+
+    # Assemble the dates as rows of bytes
+    chars = np.tile(DATE_TEMPLATE, (len(iso), 1))
+    chars[:, DATE_WEEKDAY] = WEEKDAYS[days % 7]
+    chars[:, DATE_MONTH] = MONTHS[months]
+    for target, source in DATE_FROM_ISO:
+        chars[:, target] = iso[:, source]
+    encoded = chars.view(f"S{len(DATE_TEMPLATE)}").ravel().astype(str)
+    return np.where(missing, "null", encoded).tolist()
+
+
+def _normalize_promo_codes(codes):
+    return (
+        []
+        if codes is None
+        or (isinstance(codes, list) and (None in codes or len(codes) == 0))
+        else codes
+    )
+
+
+def encode_column(values, encoder=None):
+    """
+    Encode every value of a column as JSON text.
+
+    Args:
+        values (pandas.Series): The column
+        encoder (json.JSONEncoder): Encoder for values without a fast path
+            (default: configured like the app's JSON provider)
+
+    Returns:
+        list[str]: The JSON text of each value
+    """
+    if encoder is None:
+        encoder = _get_encoder()
+    dtype = values.dtype
+    if pd.api.types.is_bool_dtype(dtype) and dtype != object:
+        if values.isna().any():
+            return [_encode_value(value, encoder) for value in values.astype(object)]
+        return np.where(values.to_numpy(dtype=bool), "true", "false").tolist()
+    if pd.api.types.is_integer_dtype(dtype) and isinstance(dtype, np.dtype):
+        return values.to_numpy().astype(str).tolist()
+    if pd.api.types.is_float_dtype(dtype) and isinstance(dtype, np.dtype):
+        array = values.to_numpy(dtype=np.float64)
+        encoded = list(map(float.__repr__, array.tolist()))
+        for i in np.flatnonzero(~np.isfinite(array)):
+            encoded[i] = "null" if np.isnan(array[i]) else _encode_float(array[i])
+        return encoded
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return _encode_datetimes(values)
+    return [
+        encode_basestring_ascii(value)
+        if type(value) is str
+        else _encode_value(value, encoder)
+        for value in values.tolist()
+    ]
+
+
+def serialize_users(users_df, keyed=True):
+    """
+    Serialize users to JSON text in one pass over the column arrays.
+
+    Args:
+        users_df (pandas.DataFrame): Users, with a `user_id` column
+        keyed (bool): Return an object keyed by user_id; otherwise a list of
+            users in frame order
+
+    Returns:
+        str: The JSON text; every user carries its user_id as `id`
+    """
+    if keyed:
+        # Keys are sorted like json.dumps(sort_keys=True); a repeated
+        # user_id keeps its last row
+        users_df = users_df.drop_duplicates("user_id", keep="last")
+        users_df = users_df.sort_values("user_id", kind="stable")
+
+    columns = {
+        column: users_df[column] for column in users_df.columns if column != "user_id"
+    }
+    columns["id"] = users_df["user_id"]
+    if "promo_codes_used" in columns:
+        columns["promo_codes_used"] = columns["promo_codes_used"].map(
+            _normalize_promo_codes
+        )
+
+    encoder = _get_encoder()
+    parts = []
+    for i, name in enumerate(sorted(columns)):
+        key = f"{', ' if i else ''}{encode_basestring_ascii(name)}: "
+        parts.append([key + text for text in encode_column(columns[name], encoder)])
+    rows = ["{" + "".join(row) + "}" for row in zip(*parts)]
+
+    if not keyed:
+        return "[" + ", ".join(rows) + "]"
+    keys = [encode_basestring_ascii(str(user_id)) for user_id in users_df["user_id"]]
+    return "{" + ", ".join(f"{key}: {row}" for key, row in zip(keys, rows)) + "}"
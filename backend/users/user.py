@@ -6,22 +6,25 @@ import os
 current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(current_dir)
 
-from db import get_analytic_db
-
-# View path
-print(sys.path)
-
 import pandas as pd
 import numpy as np
-import json
-from datetime import datetime, timedelta
-from db import execute_query
-from data_store import query_cache
+from data_store import DataNotLoadedError, query_cache, get_index, register_index
+from users.search import DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT
+from users.serialize import serialize_users
+
+
+def get_users_json():
+    """
+    Get every user keyed by user_id as JSON text.
 
+    Each user is serialized like get_user, encoding each column once instead of
+    copying the frame and building a dict per user.
+    """
+    return serialize_users(query_cache["users"])
 
-def get_users():
-    users_df = query_cache["users"]
 
+def _clean_users_frame(users_df):
+    """Replace missing values with None and normalize promo_codes_used."""
     # Handle NaT values by replacing them with None
     users_df = users_df.replace({pd.NaT: None})
 
@@ -35,13 +38,304 @@ def get_users():
             if x is None or (isinstance(x, list) and (None in x or len(x) == 0))
             else x
         )
+    return users_df
+
+
+# Columns the paginated user list can be sorted by
+SORT_FIELDS = (
+    "created_at",
+    "last_active",
+    "expiry_date",
+    "purchase_date",
+    "email",
+    "first_name",
+    "credits",
+    "user_id",
+)
+
+# Date range filters: query parameter prefix -> column
+DATE_FILTERS = {
+    "created": "created_at",
+    "last_active": "last_active",
+    "expiry": "expiry_date",
+    "purchase": "purchase_date",
+}
+
+# Largest page served by get_users_page
+MAX_PAGE_SIZE = 500
+
+
+class UserTable:
+    """
+    The users frame with sort orders and filter columns prepared once per
+    version of the users data.
+
+    The frame is referenced, not copied, and rows are addressed by position,
+    so the cache holds a single copy of the users data.
+
+    Attributes:
+        df: The users frame the table was built from
+        sort_orders: Sortable column -> row positions in ascending order,
+            missing values last
+        sort_valid: Sortable column -> number of non-missing values
+        dates: Date filter column -> datetime64 values in UTC
+        positions: user_id (as a string) -> row position
+        email_positions: Lower-cased email -> row position
+    """
+
+    def __init__(self, df):
+        self.df = df
+
+        # Hash indexes for single-user lookups; a repeated key keeps its last row
+        self.positions = {
+            str(user_id): position
+            for position, user_id in enumerate(self.df["user_id"])
+        }
+        self.email_positions = {}
+        if "email" in self.df.columns:
+            self.email_positions = {
+                email.lower(): position
+                for position, email in enumerate(self.df["email"])
+                if isinstance(email, str)
+            }
+
+        self.sort_orders = {}
+        self.sort_valid = {}
+        self.dates = {}
+
+        for field in SORT_FIELDS:
+            if field not in self.df.columns:
+                continue
+            # Label the values by row position, whatever the frame's index
+            values = pd.Series(self.df[field].array, copy=False)
+            if values.dtype == object:
+                values = values.map(
+                    lambda value: value.lower() if isinstance(value, str) else value
+                )
+            try:
+                ordered = values.sort_values(kind="stable", na_position="last")
+            except TypeError:
+                print(f"WARNING: Cannot sort users by '{field}': mixed types")
+                continue
+            self.sort_orders[field] = ordered.index.to_numpy()
+            self.sort_valid[field] = int(values.notna().sum())
+
+        for field in DATE_FILTERS.values():
+            if field in self.df.columns:
+                dates = pd.to_datetime(self.df[field], utc=True, errors="coerce")
+                self.dates[field] = dates.dt.tz_localize(None).to_numpy()
+
+    def order(self, field, descending=False):
+        """
+        Get the row positions sorted by a column; missing values stay last.
+
+        Raises:
+            ValueError: If the column cannot be sorted by
+        """
+        if field not in self.sort_orders:
+            raise ValueError(f"Cannot sort users by '{field}'")
+        ascending = self.sort_orders[field]
+        if not descending:
+            return ascending
+        valid = self.sort_valid[field]
+        return np.concatenate([ascending[:valid][::-1], ascending[valid:]])
+
+    def filter_mask(self, filters):
+        """
+        Get the rows matching every filter.
+
+        Args:
+            filters: Dict with any of `status` and `product_id` (lists of
+                accepted values), `onboarding_complete` (bool) and date
+                columns mapped to (start, end) timestamps, either end None
+
+        Returns:
+            Boolean numpy array, or None when there is nothing to filter on
+        """
+        mask = None
+
+        def narrow(condition):
+            nonlocal mask
+            condition = np.asarray(condition, dtype=bool)
+            mask = condition if mask is None else mask & condition
+
+        for field in ("status", "product_id"):
+            if filters.get(field) is not None:
+                narrow(self.df[field].isin(filters[field]))
+
+        if filters.get("onboarding_complete") is not None:
+            completed = self.df["onboarding_complete"].fillna(False).astype(bool)
+            narrow(completed == filters["onboarding_complete"])
+
+        for field in DATE_FILTERS.values():
+            start, end = filters.get(field) or (None, None)
+            if start is not None:
+                narrow(self.dates[field] >= np.datetime64(start))
+            if end is not None:
+                narrow(self.dates[field] < np.datetime64(end))
+        return mask
+
+
+def build_user_table(users_df):
+    """Build the UserTable index for the users frame."""
+    return UserTable(users_df)
+
+
+register_index("users", "user_table", build_user_table)
+
+
+def _user_records(users_df, fields=None):
+    """Serialize user rows as a list of dicts, with the user_id as `id`."""
+    if fields is not None:
+        users_df = users_df[["user_id"] + [f for f in fields if f != "user_id"]]
+    users_df = _clean_users_frame(users_df)
+    records = users_df.drop(columns="user_id").to_dict(orient="records")
+    for user_id, record in zip(users_df["user_id"], records):
+        record["id"] = user_id
+    return records
+
+
+def _get_user_table():
+    """
+    Get the user table of the current users data.
+
+    Raises:
+        DataNotLoadedError: If the users data is not loaded
+    """
+    table = get_index("user_table")
+    if table is None:
+        raise DataNotLoadedError("users")
+    return table
+
+
+def get_user(user_id):
+    """
+    Get one user by user_id, looked up in the user table's hash index.
+
+    Args:
+        user_id: The user ID (compared as a string)
+
+    Returns:
+        dict: The user, with its user_id as `id`, or None
+
+    Raises:
+        DataNotLoadedError: If the users data is not loaded
+    """
+    table = _get_user_table()
+    position = table.positions.get(str(user_id))
+    if position is None:
+        return None
+    return _user_records(table.df.iloc[[position]])[0]
+
+
+def get_user_by_email(email):
+    """
+    Get one user by email (case-insensitive), see get_user.
+
+    Args:
+        email: The user's email address
+
+    Returns:
+        dict: The user, or None if no user has this email
+
+    Raises:
+        DataNotLoadedError: If the users data is not loaded
+    """
+    table = _get_user_table()
+    position = table.email_positions.get(email.lower())
+    if position is None:
+        return None
+    return _user_records(table.df.iloc[[position]])[0]
+
+
+def get_users_page(
+    page=1, page_size=50, sort=None, descending=True, filters=None, fields=None
+):
+    """
+    Get one page of users, filtered and sorted on the prepared user table.
+
+    Args:
+        page (int): 1-based page number
+        page_size (int): Users per page (at most MAX_PAGE_SIZE)
+        sort (str): Column to sort by, one of SORT_FIELDS (default: table order)
+        descending (bool): Sort newest/largest first
+        filters (dict): Filters, see UserTable.filter_mask
+        fields (list[str]): Columns to include (default: all); `id` is always
+            included
+
+    Returns:
+        dict: The `users` of the page, the `total` number of matching users,
+        `page`, `page_size` and `total_pages`
+
+    Raises:
+        ValueError: If an argument is invalid
+        DataNotLoadedError: If the users data is not loaded
+    """
+    table = _get_user_table()
+    if page < 1 or not 1 <= page_size <= MAX_PAGE_SIZE:
+        raise ValueError(
+            f"page must be at least 1 and page_size between 1 and {MAX_PAGE_SIZE}"
+        )
+    if fields is not None:
+        unknown = sorted(set(fields) - set(table.df.columns) - {"id"})
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        fields = [field for field in fields if field != "id"]
+    for field, value in (filters or {}).items():
+        if value is not None and field not in table.df.columns:
+            raise ValueError(f"Cannot filter users by '{field}'")
+
+    if sort:
+        order = table.order(sort, descending)
+    else:
+        order = np.arange(len(table.df))
+
+    mask = table.filter_mask(filters or {})
+    if mask is not None:
+        order = order[mask[order]]
+
+    start = (page - 1) * page_size
+    positions = order[start : start + page_size]
+    return {
+        "users": _user_records(table.df.iloc[positions], fields),
+        "total": int(len(order)),
+        "page": page,
+        "page_size": page_size,
+        "total_pages": -(-len(order) // page_size),
+    }
+
+
+def search_users(query, limit=DEFAULT_SEARCH_LIMIT, fields=None):
+    """
+    Search users by user_id, email and first_name prefix or substring.
+
+    Args:
+        query (str): Text to search for (case-insensitive); substring matches
+            need at least 3 characters
+        limit (int): Maximum number of results (at most MAX_SEARCH_LIMIT)
+        fields (list[str]): Columns to include (default: all); `id` is always
+            included
 
-    # Use 'index' orient with user_id as index
-    users_df = users_df.set_index("user_id")
-    users_dict = users_df.to_dict(orient="index")
+    Returns:
+        dict: The `query` and the matching `users`, best matches first
 
-    # Add user_id as an attribute to each user object
-    for user_id, user_data in users_dict.items():
-        user_data["id"] = user_id
+    Raises:
+        ValueError: If an argument is invalid
+        DataNotLoadedError: If the users data is not loaded
+    """
+    if not 1 <= limit <= MAX_SEARCH_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_SEARCH_LIMIT}")
+    index = get_index("user_search")
+    if index is None:
+        raise DataNotLoadedError("users")
+    if fields is not None:
+        unknown = sorted(set(fields) - set(index.df.columns) - {"id"})
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        fields = [field for field in fields if field != "id"]
 
-    return users_dict
+    positions = index.search(query, limit)
+    return {
+        "query": query,
+        "users": _user_records(index.df.iloc[positions], fields),
+    }
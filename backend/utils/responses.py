@@ -0,0 +1,127 @@
+"""
+Helpers for serving JSON payloads derived from the cached query data.
+"""
+
+import hashlib
+import time
+from flask import current_app, jsonify, request
+from data_store import get_data_tags, get_derived, get_data_age, sync_snapshots
+
+# Seconds between two checks for snapshots saved by another worker
+SNAPSHOT_SYNC_INTERVAL = 1.0
+
+# Times a payload is built again when its data is replaced while building it
+BUILD_ATTEMPTS = 3
+
+_last_sync = 0.0
+
+
+def make_etag(key, tags):
+    """
+    Build a strong ETag for a payload from the identity of its source data.
+
+    Workers serving the same snapshots build the same ETag, so a client
+    revalidating against another worker still gets a 304.
+
+    Args:
+        key: Hashable identifier of the payload
+        tags: Identity of the source data, from data_store.get_data_tags
+
+    Returns:
+        str: The ETag value (without quotes)
+    """
+    fingerprint = repr((key, tags))
+    return hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()
+
+
+def _sync_snapshots():
+    """Load snapshots saved by other workers, at most once per interval."""
+    global _last_sync
+
+    now = time.monotonic()
+    if now - _last_sync >= SNAPSHOT_SYNC_INTERVAL:
+        _last_sync = now
+        sync_snapshots()
+
+
+def data_not_loaded_response(error, retry_after=5):
+    """
+    Answer a request for data that is still loading or failed to load.
+
+    Args:
+        error: The data_store.DataNotLoadedError raised
+        retry_after: Seconds the client should wait before retrying
+
+    Returns:
+        tuple: The 503 response and status
+    """
+    response = jsonify({"error": str(error)})
+    response.headers["Retry-After"] = str(retry_after)
+    return response, 503
+
+
+def set_data_age_headers(response, sources):
+    """
+    Tell the client how old the data behind a response is.
+
+    Sets X-Data-Age to the age in seconds of the oldest source snapshot.
+
+    Args:
+        response: The flask.Response to update
+        sources: IDs of the queries the payload is computed from
+    """
+    ages = [age for age in map(get_data_age, sources) if age is not None]
+    if ages:
+        response.headers["X-Data-Age"] = str(int(max(ages)))
+    return response
+
+
+def cached_json_response(key, sources, build, cache=True, serialized=False):
+    """
+    Serve a JSON payload that is serialized once per version of its source data.
+
+    A request whose If-None-Match already holds the current ETag gets an empty
+    304 response, so nothing is built, serialized or transferred. The ETag and
+    the body come from the same version of the data: a body whose data was
+    replaced while it was built is built again. Snapshots another worker saved
+    are loaded first (at most once per SNAPSHOT_SYNC_INTERVAL), so every worker
+    answers with the same ETag; call this only from authenticated routes.
+
+    Args:
+        key: Hashable identifier of the payload; include any request arguments
+            the payload depends on
+        sources: IDs of the queries the payload is computed from
+        build: Function returning the JSON-serializable payload
+        cache: Keep the serialized payload; pass False for cheap payloads with
+            many variants (e.g. pages), which would only evict costlier ones
+        serialized: build returns the payload as JSON text already
+
+    Returns:
+        flask.Response: 200 with the JSON body, or 304
+    """
+    _sync_snapshots()
+    dumps = (lambda text: text) if serialized else current_app.json.dumps
+    serialize = lambda: f"{dumps(build())}\n".encode("utf-8")
+
+    for _ in range(BUILD_ATTEMPTS):
+        tags = get_data_tags(*sources)
+        etag = make_etag(key, tags)
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+            break
+
+        body = get_derived(("json", key), sources, serialize) if cache else serialize()
+        if get_data_tags(*sources) == tags:
+            response = current_app.response_class(body, mimetype="application/json")
+            break
+    else:
+        # The data kept changing: serve the last body without an ETag, so no
+        # client pairs it with a version it was not built from
+        response = current_app.response_class(body, mimetype="application/json")
+        response.headers["Cache-Control"] = "no-store"
+        return set_data_age_headers(response, sources)
+
+    response.set_etag(etag)
+    # Always revalidate: the payload changes whenever the data is refreshed
+    response.headers["Cache-Control"] = "private, no-cache"
+    return set_data_age_headers(response, sources)
@@ -1,6 +1,5 @@
 import { useState } from "react";
-import { useUserActivity, UserSession } from "../hooks/useUser";
-import Pagination from "./Pagination";
+import { useUserActivity } from "../hooks/useUser";
 import { format } from "date-fns";
 
 interface UserActivitySessionsProps {
@@ -10,10 +9,18 @@ interface UserActivitySessionsProps {
 export default function UserActivitySessions({
   userId,
 }: UserActivitySessionsProps) {
-  const [currentPage, setCurrentPage] = useState(1);
+  // Cursors of the pages visited so far; the first page has none
+  const [cursors, setCursors] = useState<(string | null)[]>([null]);
   const itemsPerPage = 5; // Number of sessions per page
+  const currentPage = cursors.length;
 
-  const { data: sessions, isLoading, isError, error } = useUserActivity(userId);
+  const { data, isLoading, isError, error } = useUserActivity(
+    userId,
+    itemsPerPage,
+    cursors[cursors.length - 1]
+  );
+  // Only the first page carries the total; it stays cached while paging
+  const { data: firstPage } = useUserActivity(userId, itemsPerPage, null);
 
   if (isLoading) {
     return (
@@ -91,7 +98,7 @@ export default function UserActivitySessions({
     );
   }
 
-  if (!sessions || sessions.length === 0) {
+  if (!data || data.sessions.length === 0) {
     return (
       <div className="text-center py-4">
         No activity sessions found for this user.
@@ -99,17 +106,20 @@ export default function UserActivitySessions({
     );
   }
 
-  // Calculate pagination
-  const totalItems = sessions.length;
-  const totalPages = Math.ceil(totalItems / itemsPerPage);
+  const sessions = data.sessions;
+  const totalItems = firstPage?.total_sessions ?? null;
+  const startItem = (currentPage - 1) * itemsPerPage + 1;
+  const endItem = startItem + sessions.length - 1;
+  const nextCursor = data.next_cursor;
 
-  // Get current page data
-  const indexOfLastItem = currentPage * itemsPerPage;
-  const indexOfFirstItem = indexOfLastItem - itemsPerPage;
-  const currentSessions = sessions.slice(indexOfFirstItem, indexOfLastItem);
+  const handleNext = () => {
+    if (nextCursor) {
+      setCursors([...cursors, nextCursor]);
+    }
+  };
 
-  const handlePageChange = (pageNumber: number) => {
-    setCurrentPage(pageNumber);
+  const handlePrevious = () => {
+    setCursors(cursors.slice(0, -1));
   };
 
   return (
@@ -124,7 +134,7 @@ export default function UserActivitySessions({
       </div>
 
       <div className="divide-y divide-gray-200">
-        {currentSessions.map((session) => (
+        {sessions.map((session) => (
           <div key={session.session_id} className="px-4 py-5 sm:px-6">
             <div className="mb-4">
               <h4 className="text-md font-semibold text-gray-900">
@@ -201,14 +211,36 @@ export default function UserActivitySessions({
         ))}
       </div>
 
-      {totalPages > 1 && (
-        <Pagination
-          currentPage={currentPage}
-          totalPages={totalPages}
-          totalItems={totalItems}
-          itemsPerPage={itemsPerPage}
-          onPageChange={handlePageChange}
-        />
+      {(currentPage > 1 || nextCursor) && (
+        <div className="flex items-center justify-between border-t border-gray-200 bg-white px-4 py-3 sm:px-6">
+          <p className="text-sm text-gray-700">
+            Showing <span className="font-medium">{startItem}</span> to{" "}
+            <span className="font-medium">{endItem}</span>
+            {totalItems !== null && (
+              <>
+                {" "}
+                of <span className="font-medium">{totalItems}</span>
+              </>
+            )}{" "}
+            sessions
+          </p>
+          <div className="flex">
+            <button
+              onClick={handlePrevious}
+              disabled={currentPage === 1}
+              className="relative inline-flex items-center rounded-md border border-gray-300 bg-white px-4 py-2 text-sm font-medium text-gray-700 hover:bg-gray-50 disabled:opacity-50 disabled:cursor-not-allowed"
+            >
+              Newer
+            </button>
+            <button
+              onClick={handleNext}
+              disabled={!nextCursor}
+              className="relative ml-3 inline-flex items-center rounded-md border border-gray-300 bg-white px-4 py-2 text-sm font-medium text-gray-700 hover:bg-gray-50 disabled:opacity-50 disabled:cursor-not-allowed"
+            >
+              Older
+            </button>
+          </div>
+        </div>
       )}
     </div>
   );
@@ -14,7 +14,7 @@ import {
   TrashIcon,
   PencilIcon,
 } from "@heroicons/react/20/solid";
-import { RawUser, useRawUserData } from "../hooks/useKPI";
+import { RawUser } from "../hooks/useKPI";
 import { format } from "date-fns";
 import {
   useAdminComments,
@@ -102,7 +102,6 @@ export default function UserDetailView({ user }: UserDetailViewProps) {
   const addComment = useAddAdminComment();
   const updateComment = useUpdateAdminComment();
   const deleteComment = useDeleteAdminComment();
-  const { data: users } = useRawUserData();
 
   const handlePostComment = () => {
     if (!commentText.trim()) return;
@@ -384,7 +383,7 @@ export default function UserDetailView({ user }: UserDetailViewProps) {
                   <div key={comment.id} className="flex items-start space-x-4">
                     <div className="shrink-0">
                       <div className="inline-block size-10 rounded-full bg-gray-200 flex items-center justify-center text-gray-500 font-medium">
-                        {users?.[comment.author_id]?.first_name?.charAt(0) ||
+                        {comment.author?.username?.charAt(0).toUpperCase() ||
                           "A"}
                       </div>
                     </div>
@@ -392,7 +391,7 @@ export default function UserDetailView({ user }: UserDetailViewProps) {
                       <div className="flex justify-between">
                         <div>
                           <p className="text-sm font-medium text-gray-900">
-                            {users?.[comment.author_id]?.first_name || "Admin"}
+                            {comment.author?.username || "Admin"}
                           </p>
                           <p className="text-sm text-gray-500">
                             {format(
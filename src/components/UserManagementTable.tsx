@@ -4,11 +4,13 @@ import { format } from "date-fns";
 
 interface UserManagementTableProps {
   users: RawUser[];
+  commentCounts?: { [userId: string]: number };
   onUserClick?: (user: RawUser) => void;
 }
 
 export default function UserManagementTable({
   users,
+  commentCounts,
   onUserClick,
 }: UserManagementTableProps) {
   return (
@@ -45,6 +47,12 @@ export default function UserManagementTable({
                       <p className="text-sm/6 font-semibold text-gray-900">
                         <span className="absolute inset-x-0 -top-px bottom-0" />
                         {user.first_name}
+                        {!!commentCounts?.[user.id] && (
+                          <span className="ml-2 inline-flex items-center rounded-full bg-gray-100 px-2 py-0.5 text-xs font-medium text-gray-600">
+                            {commentCounts[user.id]}{" "}
+                            {commentCounts[user.id] === 1 ? "comment" : "comments"}
+                          </span>
+                        )}
                       </p>
                       <p className="mt-1 flex text-xs/5 text-gray-500">
                         <span className="relative truncate">{user.email}</span>
@@ -3,16 +3,30 @@ import { fetchData, postData, putData, deleteData } from "../services/api";
 import { queryClient } from "../services/queryClient";
 import { RawUser } from "./useKPI";
 
+export interface CommentAuthor {
+  id: number;
+  username: string;
+  email: string;
+}
+
 export interface AdminComment {
   id: number;
   user_id: string;
   author_id: number;
+  author: CommentAuthor | null;
   text: string;
   mood: string | null;
   created_at: string;
   updated_at: string;
 }
 
+// Comments of several users, newest first, with comment counts per user
+export interface AdminCommentsBatch {
+  comments: AdminComment[];
+  counts: { [userId: string]: number };
+  next_cursor: string | null;
+}
+
 // Fetch comments for a specific user
 export function useAdminComments(userId?: string) {
   return useQuery<AdminComment[]>({
@@ -25,6 +39,21 @@ export function useAdminComments(userId?: string) {
   });
 }
 
+// Fetch the comments of several users (e.g. a page of users) in one request
+export function useAdminCommentsBatch(userIds: string[], limit = 50) {
+  return useQuery<AdminCommentsBatch>({
+    queryKey: ["adminComments", "batch", userIds, limit],
+    queryFn: async () => {
+      const params = new URLSearchParams({
+        user_ids: userIds.join(","),
+        limit: String(limit),
+      });
+      return fetchData<AdminCommentsBatch>(`/admin/comments?${params}`);
+    },
+    enabled: userIds.length > 0,
+  });
+}
+
 // Add a new comment
 export function useAddAdminComment() {
   return useMutation({
@@ -46,6 +75,7 @@ export function useAddAdminComment() {
       queryClient.invalidateQueries({
         queryKey: ["adminComments", variables.userId],
       });
+      queryClient.invalidateQueries({ queryKey: ["adminComments", "batch"] });
     },
   });
 }
@@ -73,6 +103,7 @@ export function useUpdateAdminComment() {
       queryClient.invalidateQueries({
         queryKey: ["adminComments", variables.userId],
       });
+      queryClient.invalidateQueries({ queryKey: ["adminComments", "batch"] });
     },
   });
 }
@@ -93,6 +124,7 @@ export function useDeleteAdminComment() {
       queryClient.invalidateQueries({
         queryKey: ["adminComments", variables.userId],
       });
+      queryClient.invalidateQueries({ queryKey: ["adminComments", "batch"] });
     },
   });
 }
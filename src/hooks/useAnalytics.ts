@@ -98,10 +98,42 @@ export function useCohortRetention() {
   });
 }
 
-// Hook to refresh all data
+export interface RefreshQueryStatus {
+  status: "pending" | "running" | "completed" | "failed";
+  elapsed_seconds: number | null;
+  error: string | null;
+}
+
+export interface RefreshJob {
+  job_id: string;
+  status: "pending" | "running" | "completed" | "failed";
+  created_at: string;
+  finished_at: string | null;
+  error: string | null;
+  queries: {
+    [queryId: string]: RefreshQueryStatus;
+  };
+}
+
+const REFRESH_POLL_INTERVAL_MS = 2000;
+
+// Hook to refresh all data: starts a background refresh job and polls it
+// until it has finished
 export function useRefreshQueries() {
   return useMutation({
-    mutationFn: () => postData<{ message: string }>("/analytics/refresh"),
+    mutationFn: async () => {
+      let job = await postData<RefreshJob>("/analytics/refresh");
+      while (job.status === "pending" || job.status === "running") {
+        await new Promise((resolve) =>
+          setTimeout(resolve, REFRESH_POLL_INTERVAL_MS)
+        );
+        job = await fetchData<RefreshJob>(`/analytics/refresh/${job.job_id}`);
+      }
+      if (job.status === "failed") {
+        throw new Error(job.error || "Refresh failed");
+      }
+      return job;
+    },
     onSuccess: () => {
       // Invalidate all queries to refetch data
       queryClient.invalidateQueries();
@@ -1,4 +1,4 @@
-import { useQuery } from "@tanstack/react-query";
+import { keepPreviousData, useQuery } from "@tanstack/react-query";
 import { fetchData } from "../services/api";
 
 // Types for raw API response
@@ -32,12 +32,28 @@ export interface RawUserResponse {
   [key: string]: RawUser;
 }
 
+// One page of users from /analytics/users
+export interface UsersPage {
+  users: RawUser[];
+  total: number;
+  page: number;
+  page_size: number;
+  total_pages: number;
+}
+
+// Ranked search results from /analytics/users/search
+export interface UserSearchResult {
+  query: string;
+  users: RawUser[];
+}
+
+// Dashboard KPIs aggregated by the backend (/analytics/kpi)
 export interface UserMetrics {
   total_users: number;
   users_completed_onboarding: number;
   active_subscribers: number;
-  paying_users: RawUser[];
-  free_users: RawUser[];
+  paying_users: number;
+  free_users: number;
   monthly_subscribers: number;
   yearly_subscribers: number;
   estimated_monthly_revenue: number;
@@ -54,71 +70,71 @@ export function useRawUserData() {
   });
 }
 
-// Hook to get formatted retention data for charts
-export function useUserMetrics() {
-  const { data, isLoading, isError, error } = useRawUserData();
-
-  if (!data || isLoading || isError) {
-    return { data: undefined, isLoading, isError, error };
-  }
-
-  const users_completed_onboarding = Object.values(data).filter(
-    (user) => user.onboarding_complete
-  );
-
-  const active_users = Object.values(data).filter((user) => {
-    return user.status == 1 && user.auto_renew_enabled;
+// Hook to get one page of users, sorted newest first by sortField if given
+export function useUsersPage(
+  page: number,
+  pageSize: number,
+  sortField?: string | null,
+  enabled = true
+) {
+  return useQuery({
+    queryKey: ["users", "page", page, pageSize, sortField],
+    enabled,
+    staleTime: 1000,
+    placeholderData: keepPreviousData,
+    queryFn: async () => {
+      const params = new URLSearchParams({
+        page: String(page),
+        page_size: String(pageSize),
+      });
+      if (sortField) {
+        params.set("sort", sortField);
+        params.set("order", "desc");
+      }
+      const data = await fetchData<UsersPage>(`/analytics/users?${params}`);
+      return data;
+    },
   });
+}
 
-  // (excluding 14-day-free) and whose promo codes don't look like UUIDs
-  const paying_users = active_users.filter((user) => {
-    // If user has no promo codes used, they might be a paying user
-    const no_promo_codes =
-      !user.promo_codes_used || user.promo_codes_used.length === 0;
-
-    const is_using_free_code = user.promo_codes_used.some((code) => {
-      //Cannot be using a free code, unless it is the 14-day-free
-      const containsFree =
-        !code.toLowerCase().includes("free") || code == "14-day-free";
-
-      //Cannot be using a promo code that looks like a UUID
-      const uuidPattern =
-        /^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$/i;
-      const looksLikeUuid = uuidPattern.test(code);
-      return containsFree || looksLikeUuid;
-    });
-
-    if (
-      user.status == 1 &&
-      user.auto_renew_enabled &&
-      (no_promo_codes || !is_using_free_code)
-    ) {
-      return true;
-    }
+// Hook to search users by ID, email or first name
+export function useUserSearch(term: string, limit = 100) {
+  return useQuery({
+    queryKey: ["users", "search", term, limit],
+    enabled: term.length > 0,
+    staleTime: 1000,
+    placeholderData: keepPreviousData,
+    queryFn: async () => {
+      const params = new URLSearchParams({ q: term, limit: String(limit) });
+      const data = await fetchData<UserSearchResult>(
+        `/analytics/users/search?${params}`
+      );
+      return data;
+    },
   });
+}
 
-  // Free users are active users who are not paying
-  const free_users = active_users.filter(
-    (user) => !paying_users.includes(user)
-  );
+// Hook to get a single user by ID
+export function useUserDetail(userId?: string) {
+  return useQuery({
+    queryKey: ["users", userId],
+    enabled: !!userId,
+    staleTime: 1000,
+    queryFn: async () => {
+      const data = await fetchData<RawUser>(`/analytics/users/${userId}`);
+      return data;
+    },
+  });
+}
 
-  const metrics: UserMetrics = {
-    total_users: Object.keys(data).length,
-    users_completed_onboarding: users_completed_onboarding.length,
-    active_subscribers: active_users.length,
-    paying_users: paying_users,
-    free_users: free_users,
-    monthly_subscribers: paying_users.filter((user) =>
-      user.product_id.includes("month")
-    ).length,
-    yearly_subscribers: paying_users.filter(
-      (user) => !user.product_id.includes("month")
-    ).length,
-    estimated_monthly_revenue: paying_users.reduce(
-      (acc, user) => acc + parseFloat(user.expected_mmr),
-      0
-    ),
-  };
-  console.log("metrics", metrics);
-  return { data: metrics, isLoading, isError, error };
+// Hook to get the dashboard KPIs, aggregated server-side
+export function useUserMetrics() {
+  return useQuery({
+    queryKey: ["kpi"],
+    staleTime: 1000,
+    queryFn: async () => {
+      const data = await fetchData<UserMetrics>("/analytics/kpi");
+      return data;
+    },
+  });
 }
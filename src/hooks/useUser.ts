@@ -1,6 +1,6 @@
 import { useRawUserData } from "./useKPI";
 import { useAuth } from ".././store/auth-context";
-import { useQuery } from "@tanstack/react-query";
+import { keepPreviousData, useQuery } from "@tanstack/react-query";
 import { fetchData } from "../services/api";
 
 export function useUserInfo() {
@@ -45,22 +45,41 @@ export interface UserSession {
   session_start_time: string;
   session_end_time: string;
   visit_date: string;
+  screen_count: number;
+  total_duration_seconds: number;
   activities: UserActivity[];
 }
 
-export function useUserActivity(userId?: number) {
+// One page of sessions, newest first; pass next_cursor to get the next page.
+// Only the first page (no cursor) carries total_sessions
+export interface UserSessionsPage {
+  sessions: UserSession[];
+  total_sessions: number | null;
+  next_cursor: string | null;
+}
+
+export function useUserActivity(
+  userId?: number,
+  limit = 20,
+  cursor: string | null = null
+) {
   // If userId is not provided, use the current user's ID from userInfo
   const targetUserId = userId;
   return useQuery({
-    queryKey: ["userActivity", targetUserId],
+    queryKey: ["userActivity", targetUserId, limit, cursor],
     enabled: !!targetUserId,
     staleTime: 60000, // 1 minute
+    placeholderData: keepPreviousData,
     queryFn: async () => {
       if (!targetUserId) {
         throw new Error("User ID is required");
       }
-      const data = await fetchData<UserSession[]>(
-        `/admin/users/${targetUserId}/sessions`
+      const params = new URLSearchParams({ limit: String(limit) });
+      if (cursor) {
+        params.set("cursor", cursor);
+      }
+      const data = await fetchData<UserSessionsPage>(
+        `/admin/users/${targetUserId}/sessions?${params}`
       );
       return data;
     },
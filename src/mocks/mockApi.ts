@@ -29,8 +29,13 @@ export async function mockFetch(
   }
 
   if (path === "/api/analytics/refresh") {
-    return createMockResponse(200, {
-      message: "Queries refreshed successfully",
+    return createMockResponse(202, {
+      job_id: "mock-refresh",
+      status: "completed",
+      created_at: new Date().toISOString(),
+      finished_at: new Date().toISOString(),
+      error: null,
+      queries: {},
     });
   }
 
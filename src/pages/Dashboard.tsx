@@ -50,11 +50,11 @@ export default function Dashboard() {
   const userDistributionData = {
     labels: ["Paying users", "Beta/Special users", "Free users"],
     data: [
-      userMetrics.paying_users.length,
-      userMetrics.free_users.length,
+      userMetrics.paying_users,
+      userMetrics.free_users,
       userMetrics.users_completed_onboarding -
-        userMetrics.paying_users.length -
-        userMetrics.free_users.length,
+        userMetrics.paying_users -
+        userMetrics.free_users,
     ],
   };
 
@@ -87,9 +87,9 @@ export default function Dashboard() {
   const conversionRate =
     userMetrics.total_users > 0
       ? (
-          (userMetrics.paying_users.length /
+          (userMetrics.paying_users /
             (userMetrics.users_completed_onboarding -
-              userMetrics.free_users.length)) *
+              userMetrics.free_users)) *
           100
         ).toFixed(1)
       : "0.0";
@@ -166,11 +166,8 @@ export default function Dashboard() {
           }
           additionalLabel2="Free to Paid Ratio"
           additionalValue2={
-            userMetrics.free_users.length > 0
-              ? `${(
-                  userMetrics.paying_users.length /
-                  userMetrics.free_users.length
-                ).toFixed(2)}:1`
+            userMetrics.free_users > 0
+              ? `${(userMetrics.paying_users / userMetrics.free_users).toFixed(2)}:1`
               : "0:1"
           }
         />
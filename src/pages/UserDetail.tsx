@@ -1,12 +1,12 @@
 import { useParams, useNavigate } from "react-router-dom";
 import UserDetailView from "../components/UserDetailView";
-import { useRawUserData } from "../hooks/useKPI";
+import { useUserDetail } from "../hooks/useKPI";
 import { useEffect } from "react";
 
 export default function UserDetail() {
   const { userId } = useParams<{ userId: string }>();
   const navigate = useNavigate();
-  const { data: rawUserData, isLoading, isError } = useRawUserData();
+  const { data: user, isLoading, isError } = useUserDetail(userId);
 
   // If no user ID is provided, redirect to the user list
   useEffect(() => {
@@ -23,7 +23,7 @@ export default function UserDetail() {
     );
   }
 
-  if (isError || !rawUserData || !userId) {
+  if (isError || !userId) {
     return (
       <div className="bg-red-50 p-4 rounded-md m-4">
         <h3 className="text-lg font-medium text-red-800">
@@ -36,8 +36,6 @@ export default function UserDetail() {
     );
   }
 
-  const user = rawUserData[userId];
-
   if (!user) {
     return (
       <div>
@@ -3,7 +3,8 @@ import { useNavigate } from "react-router-dom";
 import UserManagementTable from "../components/UserManagementTable";
 import Pagination from "../components/Pagination";
 import SortFilter, { SortOption } from "../components/SortFilter";
-import { useRawUserData, RawUser } from "../hooks/useKPI";
+import { useUsersPage, useUserSearch, RawUser } from "../hooks/useKPI";
+import { useAdminCommentsBatch } from "../hooks/useAdminComments";
 
 const ITEMS_PER_PAGE = 10;
 
@@ -21,38 +22,35 @@ const SORT_OPTIONS: SortOption[] = [
 ];
 
 export default function UserManagement() {
-  const { data: rawUserData, isLoading, isError } = useRawUserData();
   const [currentPage, setCurrentPage] = useState(1);
   const [searchTerm, setSearchTerm] = useState("");
   const [activeSort, setActiveSort] = useState<string | null>(null);
   const navigate = useNavigate();
 
-  const users = useMemo(() => {
-    if (!rawUserData) return [];
-    return Object.values(rawUserData);
-  }, [rawUserData]);
-
-  // Apply search filtering to all users first
-  const filteredUsers = useMemo(() => {
-    if (!searchTerm.trim()) return users;
-
-    const lowerCaseSearch = searchTerm.toLowerCase();
-    return users.filter(
-      (user) =>
-        (user.first_name?.toLowerCase() || "").includes(lowerCaseSearch) ||
-        (user.email?.toLowerCase() || "").includes(lowerCaseSearch) ||
-        (user.id?.toString() || "") == lowerCaseSearch
-    );
-  }, [users, searchTerm]);
-
-  // Apply sorting if enabled
-  const sortedAndFilteredUsers = useMemo(() => {
-    if (!activeSort) return filteredUsers;
+  const sortOption = SORT_OPTIONS.find((option) => option.id === activeSort);
+  const trimmedSearch = searchTerm.trim();
+  const isSearching = trimmedSearch.length > 0;
 
-    const sortOption = SORT_OPTIONS.find((option) => option.id === activeSort);
-    if (!sortOption) return filteredUsers;
-
-    return [...filteredUsers].sort((a, b) => {
+  // Without a search term, the server sorts and pages the users
+  const pageQuery = useUsersPage(
+    currentPage,
+    ITEMS_PER_PAGE,
+    sortOption?.field,
+    !isSearching
+  );
+  // With a search term, the server returns the best matches
+  const searchQuery = useUserSearch(trimmedSearch);
+  // Only the first page load blocks the view, so typing keeps the input
+  const isLoading = !isSearching && pageQuery.isLoading;
+  const isError = isSearching ? searchQuery.isError : pageQuery.isError;
+  const searchPending = isSearching && !searchQuery.data;
+
+  // Sort search results if enabled
+  const searchResults = useMemo(() => {
+    const results = searchQuery.data?.users ?? [];
+    if (!sortOption) return results;
+
+    return [...results].sort((a, b) => {
       const dateA = new Date(
         a[sortOption.field as keyof RawUser] as string
       ).getTime();
@@ -61,17 +59,24 @@ export default function UserManagement() {
       ).getTime();
       return dateB - dateA; // Sort in descending order (newest first)
     });
-  }, [filteredUsers, activeSort]);
+  }, [searchQuery.data, sortOption]);
 
-  // Pagination logic - applied after filtering and sorting
-  const totalPages = Math.ceil(sortedAndFilteredUsers.length / ITEMS_PER_PAGE);
+  // Search results are paged here; other pages come from the server
+  const totalItems = isSearching
+    ? searchResults.length
+    : pageQuery.data?.total ?? 0;
+  const totalPages = Math.ceil(totalItems / ITEMS_PER_PAGE);
   const paginatedUsers = useMemo(() => {
+    if (!isSearching) return pageQuery.data?.users ?? [];
     const startIndex = (currentPage - 1) * ITEMS_PER_PAGE;
-    return sortedAndFilteredUsers.slice(
-      startIndex,
-      startIndex + ITEMS_PER_PAGE
-    );
-  }, [sortedAndFilteredUsers, currentPage]);
+    return searchResults.slice(startIndex, startIndex + ITEMS_PER_PAGE);
+  }, [isSearching, pageQuery.data, searchResults, currentPage]);
+
+  // Comment counts of the whole page, in one request
+  const { data: commentsBatch } = useAdminCommentsBatch(
+    paginatedUsers.map((user) => user.id),
+    1
+  );
 
   // Reset to first page when search term changes
   useMemo(() => {
@@ -152,10 +157,11 @@ export default function UserManagement() {
 
       <UserManagementTable
         users={paginatedUsers}
+        commentCounts={commentsBatch?.counts}
         onUserClick={handleUserClick}
       />
 
-      {sortedAndFilteredUsers.length === 0 ? (
+      {searchPending ? null : totalItems === 0 ? (
         <div className="py-10 text-center text-gray-500">
           No users found matching "{searchTerm}"
         </div>
@@ -164,7 +170,7 @@ export default function UserManagement() {
           <Pagination
             currentPage={currentPage}
             totalPages={totalPages}
-            totalItems={sortedAndFilteredUsers.length}
+            totalItems={totalItems}
             itemsPerPage={ITEMS_PER_PAGE}
             onPageChange={setCurrentPage}
           />